@@ -8,6 +8,15 @@ from config import config
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from flask_cors import CORS
+from .jobs import JobManager
+from .last_seen import LastSeenTracker
+from .user_cache import UserCache
+from .core_features.AGENTCLIENT import agent_client
+from .core_features.AIO import bridge
+from .core_features.TEMPLATES import config_templates
+from .health import HealthPoller
+from .metrics import metrics
+from .progress import progress
 
 bootstrap = Bootstrap()
 mail = Mail()
@@ -15,6 +24,10 @@ moment = Moment()
 db = SQLAlchemy()
 csrf = CSRFProtect()
 cors= CORS()
+jobs = JobManager()
+last_seen = LastSeenTracker()
+user_cache = UserCache()
+health = HealthPoller()
 login_manager=LoginManager()
 login_manager.login_view="auth.login" #sets the endpoint for login page
 login_manager.remember_cookie_duration = timedelta(minutes=30) #session management
@@ -37,6 +50,15 @@ def create_app(config_name):
     login_manager.init_app(app)
     csrf.init_app(app)
     cors.init_app(app)
+    jobs.init_app(app)
+    last_seen.init_app(app)
+    user_cache.init_app(app)
+    agent_client.init_app(app)
+    bridge.init_app(app)
+    config_templates.init_app(app)
+    health.init_app(app)
+    metrics.init_app(app)
+    progress.init_app(app)
     
     #Blueprint
     from .main import main as main_blueprint
@@ -3,7 +3,7 @@ from flask_login import login_required, login_user,logout_user,current_user
 from ..models import User
 from . import auth
 from .forms import LoginForm,RegistrationForm
-from .. import db
+from .. import db,last_seen,user_cache
 from ..email import send_email
 
 
@@ -51,6 +51,7 @@ def confirm(token):
         return redirect(url_for('main.index'))
     if current_user.confirm(token):
         db.session.commit()
+        user_cache.invalidate(current_user.id)
         flash("You've confirmed your account!")
     else:
         flash("The confirmation link is invalid or has expired")
@@ -60,7 +61,8 @@ def confirm(token):
 @auth.before_app_request
 def before_request():
     if current_user.is_authenticated :
-        current_user.ping()
+        if request.endpoint != 'static':
+            last_seen.touch(current_user.id)
         if not current_user.confirmed \
         and request.endpoint \
         and request.blueprint != 'auth' \
@@ -1,7 +1,54 @@
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 import os
+from concurrent.futures import ThreadPoolExecutor,wait
+import hashlib
+import json
 import requests
+import threading
 import time
+from .AGENTCLIENT import agent_client
+
+
+class AgentBundle:
+    """
+    The agent payload, read once and kept in memory with a sha256 manifest per file.
+    Every load() only stats the directory; the files are read again when one of them
+    is added, removed, or changes mtime or size.
+    """
+    MAX_FILES=10000
+
+    def __init__(self,directory:str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._signature = None
+        self._files = {}
+        self._manifest = {}
+        self.builds = 0
+
+    def _signature_of(self) -> tuple:
+        if not self.directory:
+            raise ValueError("AGENT_DIR is not set")
+        entries = []
+        with os.scandir(self.directory) as it: #AGENT_DIR must be absolute path 
+            for _,entry in zip(range(AgentBundle.MAX_FILES),it):
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((entry.name,stat.st_mtime_ns,stat.st_size))
+        return tuple(sorted(entries))
+
+    def load(self) -> tuple:
+        "Return (files, manifest) : name -> bytes and name -> sha256. Both are replaced, never mutated."
+        signature = self._signature_of()
+        with self._lock:
+            if signature != self._signature:
+                files,manifest = {},{}
+                for name,_,_ in signature:
+                    with open(os.path.join(self.directory,name),"rb") as f:
+                        files[name] = f.read()
+                    manifest[name] = hashlib.sha256(files[name]).hexdigest()
+                self._files,self._manifest,self._signature = files,manifest,signature
+                self.builds += 1
+            return self._files,self._manifest
 
 
 class Agent:
@@ -9,6 +56,10 @@ class Agent:
     UNSYNC=0
     SYNC=1
     FAILURE=2
+    UPLOAD_TIMEOUT=60
+    RESTART_TIMEOUT=60
+    MANIFEST_TIMEOUT=5
+    bundle=AgentBundle(AGENT_DIR)
        
     def __new__(cls):
         return cls
@@ -19,39 +70,77 @@ class Agent:
         return serializer.dumps({"confirm":True}).decode("utf-8")
     
     @staticmethod
-    def _file_list():
-        for _,file in zip(range(10000),os.listdir(Agent.AGENT_DIR)): #AGENT_DIR must be absolute path 
-            if os.path.isfile(os.path.join(Agent.AGENT_DIR,file)): #file path as well
-                yield str(_),open(os.path.join(Agent.AGENT_DIR,file),"rb") #Must be string or byte type
-    
-    @classmethod
-    def file_load(cls):
-        files={_:file for _,file in Agent._file_list()}
-        cls.files=files
-        cls.files["token"] = Agent.token_generator()
+    def changed_files(local:dict,remote:dict) -> list:
+        "Names of local files whose hash the remote manifest doesn't have."
+        return [name for name,digest in local.items() if remote.get(name) != digest]
         
     @staticmethod
     def sync_status(node:str,timeout=3):
+        report = Agent.version_status(node,timeout)
+        return node,report["status"]
+
+    @staticmethod
+    def version_status(node:str,timeout=3) -> dict:
+        "Ask one agent for its version. Anything short of a valid answer (refused, timed out, bad payload) is a FAILURE."
+        report = {"node":node,"version":None,"status":Agent.FAILURE,"latency_ms":None,"error":None}
+        start = time.perf_counter()
         try:
-            res= requests.get(node+"/",timeout=timeout)
-            if res.ok:
-                if res.json().get("version") ==os.getenv("AGENT_VERSION"):
-                    print("Version match")
-                    return node,Agent.SYNC
-                else:
-                    print("Version not matched!")
-                    return node,Agent.UNSYNC
-        except requests.exceptions.ConnectionError as e:
-            print("[ERROR] Connection to '{}' failed.".format(node))
-            return node,Agent.FAILURE
+            res= agent_client.get(node+"/",timeout=timeout)
+            report["latency_ms"] = round((time.perf_counter()-start)*1000,2)
+            Agent._read_version(report,res.status_code,res.content)
+        except requests.exceptions.Timeout as e:
+            report["error"] = "Timed out after {}s".format(timeout)
+        except requests.exceptions.RequestException as e:
+            report["error"] = "Connection failed"
+        except ValueError as e: #Not a JSON body
+            report["error"] = "Invalid response"
+        if report["error"]:
+            print("[ERROR] Version check on '{}' failed : {}".format(node,report["error"]))
+        return report
+
+    @staticmethod
+    def _read_version(report:dict,status_code:int,body:bytes):
+        "Fill 'report' from the agent's answer to GET /. Raises ValueError when the body is not JSON."
+        if status_code < 400:
+            report["version"] = json.loads(body).get("version")
+            report["status"] = Agent.SYNC if report["version"] == os.getenv("AGENT_VERSION") else Agent.UNSYNC
+        else:
+            report["error"] = "HTTP {}".format(status_code)
+
+    @staticmethod
+    def scan(nodes,timeout=3,deadline=None,max_workers=None) -> list:
+        """
+        Check the version of every agent concurrently, with at most 'max_workers' requests in flight.
+        Agents that have not answered when the overall 'deadline' runs out are reported as FAILURE.
+        """
+        nodes = list(dict.fromkeys(nodes))
+        if not nodes:
+            return []
+        deadline = agent_client.scan_deadline if deadline is None else deadline
+        pool = ThreadPoolExecutor(max_workers=min(len(nodes),max_workers or agent_client.scan_workers))
+        futures = {pool.submit(Agent.version_status,node,timeout):node for node in nodes}
+        done,_ = wait(futures,timeout=deadline)
+        pool.shutdown(wait=False,cancel_futures=True)
+        reports = []
+        for future,node in futures.items():
+            if future in done:
+                reports.append(future.result())
+            else:
+                reports.append({"node":node,"version":None,"status":Agent.FAILURE,"latency_ms":None,
+                                "error":"Deadline of {}s exceeded".format(deadline)})
+        return reports
     
 
     @staticmethod
-    def agent_sync(node:str,files:dict):
+    def agent_sync(node:str,files:dict,manifest:dict=None):
+        "Upload 'files' (name -> bytes). With 'manifest', the agent can drop the files the bundle no longer has."
         url = node + "/agent/command/sync"
-        print(url)
+        payload = {str(idx):(name,data) for idx,(name,data) in enumerate(files.items())} #Must be string or byte type
+        payload["token"] = Agent.token_generator()
+        if manifest is not None:
+            payload["manifest"] = json.dumps(manifest)
         try:
-            res=requests.post(url,files=files)
+            res=agent_client.post(url,files=payload,timeout=(agent_client.connect_timeout,Agent.UPLOAD_TIMEOUT))
             if res.ok:
                 print("[SUCCESS] Agent sync to {} completed successfully".format(node))
                 return True
@@ -65,11 +154,38 @@ class Agent:
             print("[ERROR] {}".format(str(e)))
             return False
 
+    @staticmethod
+    def delta_sync(node:str) -> dict:
+        """
+        Exchange manifests with the agent and upload only the files it doesn't have.
+        An agent that is already up to date costs the manifest request alone.
+        Agents that don't serve '/agent/command/manifest' get the whole bundle, as before.
+        """
+        files,manifest = Agent.bundle.load()
+        report = {"node":node,"ok":False,"up_to_date":False,"sent":[]}
+        changed = list(files)
+        try:
+            res = agent_client.post(node+"/agent/command/manifest",idempotent=True,
+                                    json={"token":Agent.token_generator(),"manifest":manifest},timeout=Agent.MANIFEST_TIMEOUT)
+            if res.ok:
+                remote = res.json().get("manifest",{})
+                changed = Agent.changed_files(manifest,remote)
+                if not changed and not set(remote) - set(manifest):
+                    print("[SUCCESS] Agent on {} is already up to date".format(node))
+                    report["ok"] = report["up_to_date"] = True
+                    return report
+        except (requests.exceptions.RequestException,ValueError) as e:
+            print("[WARNING] Manifest exchange with '{}' failed, sending the whole bundle.".format(node))
+        report["sent"] = changed
+        report["ok"] = Agent.agent_sync(node,{name:files[name] for name in changed},manifest)
+        return report
+
     @staticmethod
     def agent_restart(node:str):
         restart_url = node + "/agent/command/restart"
         try:
-            restart_res=requests.post(restart_url,json={"token":Agent.token_generator()}) #Agent server will shut down briefly
+            restart_res=agent_client.post(restart_url,json={"token":Agent.token_generator()},
+                                          timeout=(agent_client.connect_timeout,Agent.RESTART_TIMEOUT)) #Agent server will shut down briefly
         except requests.exceptions.ConnectionError as e: #we've already checked the connection
             print("Let's give a little sec '{}' failed.".format(node))
         except Exception as e:
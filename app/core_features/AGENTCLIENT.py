@@ -0,0 +1,165 @@
+######################################################################
+# One HTTP client for every request the master sends to its agents.
+# Keep-alive pools per agent, the same timeouts everywhere, retries for
+# idempotent calls and a cap on requests in flight per agent.
+#
+######################################################################
+
+from collections import Counter
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+import requests
+import threading
+import time
+from ..metrics import AGENT_REQUEST,AGENT_ERRORS
+
+
+class CountingAdapter(HTTPAdapter):
+    "HTTPAdapter counting the connections it opens, per 'host:port'."
+    def __init__(self,*args,**kwargs):
+        self.opened = Counter()
+        self._opened_lock = threading.Lock()
+        super().__init__(*args,**kwargs)
+
+    def init_poolmanager(self,*args,**kwargs):
+        super().init_poolmanager(*args,**kwargs)
+        adapter = self
+        def counting(pool_cls):
+            class Connection(pool_cls.ConnectionCls):
+                def connect(self):
+                    super().connect()
+                    with adapter._opened_lock:
+                        adapter.opened[f"{self.host}:{self.port}"] += 1
+            return type(pool_cls.__name__,(pool_cls,),{"ConnectionCls":Connection})
+        manager = self.poolmanager
+        manager.pool_classes_by_scheme = {scheme:counting(cls) for scheme,cls in manager.pool_classes_by_scheme.items()}
+
+    def connections(self) -> dict:
+        with self._opened_lock:
+            return dict(self.opened)
+
+
+class AgentClient:
+    """
+    requests.Session shared by Es, Redis and Agent.
+    get/post take the same arguments as requests.get/post, plus :
+      - timeout   : (connect, read) or a number, defaults to (connect_timeout, read_timeout)
+      - idempotent: retry on connection errors and 502/503/504 with exponential backoff.
+                    GET is idempotent unless told otherwise, POST is not.
+    Requests for one agent wait for a free slot when 'max_in_flight' are already running.
+    """
+    RETRY_STATUS=(502,503,504)
+
+    def __init__(self,app=None):
+        self.connect_timeout = 3
+        self.read_timeout = 30
+        self.retries = 2
+        self.backoff = 0.2
+        self.max_in_flight = 8
+        self.pool_hosts = 256
+        self.scan_workers = 32
+        self.scan_deadline = 10
+        self._lock = threading.Lock()
+        self._slots = {} #agent -> BoundedSemaphore
+        self._latency = {} #agent -> {"requests","errors","retries","total_ms","max_ms"}
+        self._build_session()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self,app):
+        self.connect_timeout = app.config.get("AGENT_CONNECT_TIMEOUT",3)
+        self.read_timeout = app.config.get("AGENT_READ_TIMEOUT",30)
+        self.retries = app.config.get("AGENT_RETRIES",2)
+        self.backoff = app.config.get("AGENT_RETRY_BACKOFF",0.2)
+        self.max_in_flight = app.config.get("AGENT_MAX_IN_FLIGHT",8)
+        self.pool_hosts = app.config.get("AGENT_POOL_HOSTS",256)
+        self.scan_workers = app.config.get("AGENT_SCAN_WORKERS",32)
+        self.scan_deadline = app.config.get("AGENT_SCAN_DEADLINE",10)
+        self.close()
+        app.extensions["agent_client"] = self
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = CountingAdapter(pool_connections=self.pool_hosts,pool_maxsize=self.max_in_flight)
+        session.mount("http://",adapter)
+        session.mount("https://",adapter)
+        self.session = session
+        self.adapter = adapter
+
+    def close(self):
+        "Drop every pooled connection and in-flight limit. The next request opens new ones."
+        with self._lock:
+            self.session.close()
+            self._build_session()
+            self._slots = {}
+            self._latency = {}
+
+    def _slot(self,agent:str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if agent not in self._slots:
+                self._slots[agent] = threading.BoundedSemaphore(self.max_in_flight)
+            return self._slots[agent]
+
+    def _record(self,agent:str,command:str,elapsed_ms:float,error:bool,retries:int):
+        AGENT_REQUEST.observe(elapsed_ms/1000,agent=agent,command=command)
+        if error:
+            AGENT_ERRORS.inc(agent=agent,command=command)
+        with self._lock:
+            stat = self._latency.setdefault(agent,{"requests":0,"errors":0,"retries":0,"total_ms":0.0,"max_ms":0.0})
+            stat["requests"] += 1
+            stat["errors"] += error
+            stat["retries"] += retries
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"],elapsed_ms)
+
+    def request(self,method:str,url:str,timeout=None,idempotent:bool=None,retries:int=None,**kwargs) -> requests.Response:
+        timeout = (self.connect_timeout,self.read_timeout) if timeout is None else timeout
+        idempotent = method.upper() in ("GET","HEAD") if idempotent is None else idempotent
+        retries = (self.retries if retries is None else retries) if idempotent else 0
+        agent,command = urlsplit(url)[1:3]
+        slot = self._slot(agent)
+        wait = timeout if isinstance(timeout,(int,float)) else sum(t for t in timeout if t)
+        if not slot.acquire(timeout=wait):
+            raise requests.exceptions.ConnectionError(f"{self.max_in_flight} requests to '{agent}' still in flight")
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    res = self.session.request(method,url,timeout=timeout,**kwargs)
+                    if res.status_code not in AgentClient.RETRY_STATUS or attempt >= retries:
+                        self._record(agent,command,(time.perf_counter()-start)*1000,not res.ok,attempt)
+                        return res
+                except requests.exceptions.RequestException:
+                    if attempt >= retries:
+                        self._record(agent,command,(time.perf_counter()-start)*1000,True,attempt)
+                        raise
+                time.sleep(self.backoff*(2**attempt))
+                attempt += 1
+        finally:
+            slot.release()
+
+    def get(self,url:str,**kwargs) -> requests.Response:
+        return self.request("GET",url,**kwargs)
+
+    def post(self,url:str,**kwargs) -> requests.Response:
+        return self.request("POST",url,**kwargs)
+
+    def stats(self) -> dict:
+        "Per agent : requests, errors, retries, latency and how many connections were opened for them."
+        with self._lock:
+            latency = {agent:dict(stat) for agent,stat in self._latency.items()}
+            opened = self.adapter.connections()
+        agents = {}
+        for agent,stat in latency.items():
+            stat["avg_ms"] = round(stat.pop("total_ms")/stat["requests"],2)
+            stat["max_ms"] = round(stat["max_ms"],2)
+            stat["connections"] = opened.get(agent,0)
+            agents[agent] = stat
+        requests_sent = sum(stat["requests"]+stat["retries"] for stat in agents.values())
+        connections = sum(stat["connections"] for stat in agents.values())
+        return {"agents":agents,"requests":requests_sent,"connections":connections,
+                "reuse_ratio":round(1-connections/requests_sent,4) if requests_sent else None}
+
+
+agent_client = AgentClient()
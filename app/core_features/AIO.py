@@ -0,0 +1,450 @@
+######################################################################
+# asyncio versions of the core operations, to fan out to many nodes
+# from one thread : ElasticSearch over HTTP, Redis over RESP and the
+# agents over HTTP, all on asyncio streams. AsyncBridge runs them for
+# the (blocking) Flask views on one event loop in a background thread.
+#
+######################################################################
+
+from urllib.parse import urlsplit
+import asyncio
+import base64
+import concurrent.futures
+import json
+import random
+import ssl
+import threading
+import time
+from .AGENT import Agent
+from .AGENTCLIENT import agent_client
+from .ES import Es
+from .HTTPPOOL import ConnectionPool,HTTPError,HTTPResponse
+from .REDIS import Redis
+from .RESP import RESPError,pipeline_async
+from .TEMPLATES import config_templates
+from ..metrics import ES_REQUEST,ES_ERRORS,AGENT_REQUEST,AGENT_ERRORS
+from ..topology import parse_address,DEFAULT_PORTS
+
+
+MAX_LINE=65536
+
+
+#--------------------HTTP--------------------
+async def _readline(reader:asyncio.StreamReader) -> bytes:
+    try:
+        line = await reader.readline()
+    except ValueError: #over the stream limit
+        raise HTTPError("Header line too long")
+    if not line:
+        raise ConnectionResetError("Connection closed by peer")
+    return line
+
+
+async def read_response(reader:asyncio.StreamReader,method:str="GET") -> HTTPResponse:
+    "HTTPReader.read_response() for asyncio streams."
+    status_line = (await _readline(reader)).decode("iso-8859-1").rstrip("\r\n")
+    try:
+        version,status,*reason = status_line.split(" ",2)
+        status = int(status)
+    except ValueError:
+        raise HTTPError("Malformed status line : {!r}".format(status_line))
+    if not version.startswith("HTTP/1."):
+        raise HTTPError("Unsupported protocol : {!r}".format(version))
+
+    headers = {}
+    while True:
+        line = (await _readline(reader)).decode("iso-8859-1").rstrip("\r\n")
+        if not line:
+            break
+        name,_,value = line.partition(":")
+        name = name.strip().lower()
+        value = value.strip()
+        headers[name] = headers[name]+", "+value if name in headers else value
+
+    connection = headers.get("connection","").lower()
+    keep_alive = "close" not in connection if version=="HTTP/1.1" else "keep-alive" in connection
+
+    try:
+        if method=="HEAD" or status in (204,304) or 100 <= status < 200:
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding","").lower():
+            chunks = []
+            while True:
+                size_line = (await _readline(reader)).split(b";",1)[0].strip()
+                try:
+                    size = int(size_line,16)
+                except ValueError:
+                    raise HTTPError("Malformed chunk size : {!r}".format(size_line))
+                if size == 0:
+                    while await _readline(reader) not in (b"\r\n",b"\n"): #trailers, then the final CRLF
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await _readline(reader)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read() #body delimited by connection close
+            keep_alive = False
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionResetError("Connection closed with {} bytes of the body read".format(len(e.partial)))
+    return HTTPResponse(status,reason[0] if reason else "",headers,body,keep_alive)
+
+
+class AsyncHTTPClient:
+    """
+    HTTP/1.1 over asyncio streams. Idle keep-alive connections are kept per (host, port, https)
+    and reused until they go stale; one the peer closed meanwhile is replaced transparently, unless
+    a request other than GET/HEAD was already sent on it.
+    Connections belong to the event loop that opened them : use one client per loop.
+    """
+    def __init__(self,connect_timeout:float=3,read_timeout:float=30,max_idle:int=4,idle_ttl:float=30):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle = max_idle
+        self.idle_ttl = idle_ttl
+        self._idle = {} #(host, port, https) -> [(reader, writer, last used)]
+        self.stats = {"requests":0,"created":0,"reused":0}
+
+    async def _connect(self,host:str,port:int,https:bool) -> tuple:
+        context = None
+        if https:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        conn = await asyncio.wait_for(asyncio.open_connection(host,port,ssl=context,limit=MAX_LINE),self.connect_timeout)
+        self.stats["created"] += 1
+        return conn
+
+    def _checkout(self,key:tuple):
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle:
+            reader,writer,used = idle.pop()
+            if now - used < self.idle_ttl and not writer.is_closing() and not reader.at_eof():
+                self.stats["reused"] += 1
+                return reader,writer
+            writer.close()
+        return None
+
+    def _checkin(self,key:tuple,reader,writer):
+        idle = self._idle.setdefault(key,[])
+        if len(idle) < self.max_idle:
+            idle.append((reader,writer,time.monotonic()))
+        else:
+            writer.close()
+
+    async def request(self,method:str,host:str,port:int,path:str,headers:dict=None,body:bytes=b"",
+                      https:bool=False,timeout:float=None) -> HTTPResponse:
+        "'timeout' bounds the wait for the whole response, connecting excluded. Defaults to read_timeout."
+        key = (host,port,https)
+        lines = ["{} {} HTTP/1.1".format(method,path),"Host: {}:{}".format(host,port),"Connection: keep-alive"]
+        lines += ["{}: {}".format(k,v) for k,v in (headers or {}).items()]
+        if body or method in ("POST","PUT"):
+            lines.append("Content-Length: {}".format(len(body)))
+        data = ("\r\n".join(lines)+"\r\n\r\n").encode("iso-8859-1")+body
+        timeout = self.read_timeout if timeout is None else timeout
+        self.stats["requests"] += 1
+        for fresh in (False,True):
+            conn = None if fresh else self._checkout(key)
+            reused = conn is not None
+            reader,writer = conn or await self._connect(host,port,https)
+            sent = False
+            try:
+                writer.write(data)
+                await writer.drain()
+                sent = True
+                response = await asyncio.wait_for(read_response(reader,method),timeout)
+            except ConnectionError:
+                writer.close()
+                #kept alive, but closed by the peer since : send again only if the peer can't have run it
+                if reused and (not sent or method in ConnectionPool.IDEMPOTENT):
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if response.keep_alive:
+                self._checkin(key,reader,writer)
+            else:
+                writer.close()
+            return response
+
+    async def close(self):
+        idle,self._idle = self._idle,{}
+        for connections in idle.values():
+            for _,writer,_ in connections:
+                writer.close()
+
+
+#--------------------Operations--------------------
+def _limiter(limit,default:int) -> asyncio.Semaphore:
+    return limit if limit is not None else asyncio.Semaphore(default)
+
+
+class AsyncEs:
+    "Es.es_json, ClusterHealthCheck, Configuration and LiveConfigurationReport as coroutines."
+    RETRIES=2
+
+    def __init__(self,nodes,auth:str=None,http:AsyncHTTPClient=None,limit:asyncio.Semaphore=None):
+        nodes = [parse_address(node,DEFAULT_PORTS["ElasticSearch"]) for node in nodes]
+        self.https = nodes[0].https
+        self.nodes = [node.endpoint for node in nodes]
+        self.auth = auth
+        self.http = http or AsyncHTTPClient()
+        self.limit = _limiter(limit,AsyncBridge.MAX_PER_CLUSTER)
+
+    async def es_json(self,path:str,timeout:float=None) -> dict:
+        "GET 'path' on a random node, another one on each retry. Raises on connection or parsing errors."
+        headers = {"Accept":"application/json"}
+        if self.auth:
+            headers["Authorization"] = "Basic %s" %base64.b64encode(self.auth.encode("ascii")).decode()
+        label = path.split("?")[0]
+        start = time.perf_counter()
+        last_error = None
+        async with self.limit:
+            for _ in range(AsyncEs.RETRIES+1):
+                host,port = random.choice(self.nodes)
+                try:
+                    response = await self.http.request("GET",host,port,path,headers,https=self.https,timeout=timeout)
+                    ES_REQUEST.observe(time.perf_counter()-start,path=label)
+                    return json.loads(response.body)
+                except (OSError,HTTPError,asyncio.TimeoutError) as e:
+                    last_error = e
+                except ValueError:
+                    ES_ERRORS.inc(path=label)
+                    raise
+        ES_REQUEST.observe(time.perf_counter()-start,path=label)
+        ES_ERRORS.inc(path=label)
+        raise last_error
+
+    async def ClusterHealthCheck(self) -> str:
+        try:
+            return (await self.es_json("/_cluster/health")).get("status")
+        except Exception as e:
+            return str(e) or type(e).__name__
+
+    async def version(self) -> str:
+        "Shares Es.version()'s cache."
+        key = (tuple(sorted(self.nodes)),self.https)
+        now = time.monotonic()
+        cached = Es._versions.get(key)
+        if cached is not None and now - cached[0] < Es.VERSION_TTL:
+            return cached[1]
+        version = (await self.es_json("/")).get("version",{}).get("number")
+        with Es._versions_lock:
+            Es._versions[key] = (now,version)
+        return version
+
+    async def Configuration(self) -> dict:
+        try:
+            return dict(config_templates.get("elasticsearch",(await self.version()).split(".")[0]))
+        except Exception as e:
+            return e
+
+    async def LiveConfigurationReport(self) -> dict:
+        version,body = await asyncio.gather(self.version(),self.es_json(Es.NODE_SETTINGS_PATH))
+        return Es.settings_report(version,Es.parse_node_settings(body))
+
+
+class AsyncRedis:
+    "Redis.HealthReport and ClusterHealthCheck as coroutines : one task per node instead of one thread."
+    def __init__(self,nodes,auth=None,connect_timeout:float=2,read_timeout:float=2,limit:asyncio.Semaphore=None):
+        self.auth = auth
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.agents = [parse_address(node,DEFAULT_PORTS["Redis"]).endpoint for node in nodes]
+        self.limit = _limiter(limit,AsyncBridge.MAX_PER_CLUSTER)
+
+    async def _probe(self,node:tuple) -> dict:
+        "Redis._probe on asyncio streams : the same pipeline, deadlines and report."
+        report = Redis._new_report(node)
+        async with self.limit:
+            start = time.perf_counter()
+            writer = None
+            try:
+                reader,writer = await asyncio.wait_for(asyncio.open_connection(*node),self.connect_timeout)
+                connected = time.perf_counter()
+                report["connect_ms"] = round((connected-start)*1000,2)
+                replies = await asyncio.wait_for(pipeline_async(reader,writer,Redis._probe_commands(self.auth)),self.read_timeout)
+                report["rtt_ms"] = round((time.perf_counter()-connected)*1000,2)
+                Redis._read_probe(report,replies,self.auth)
+            except RESPError:
+                pass
+            except asyncio.TimeoutError:
+                report["error"] = "timed out"
+            except Exception as e:
+                report["error"] = str(e) or type(e).__name__
+            finally:
+                if writer is not None:
+                    writer.close()
+        Redis._record_probe(report,time.perf_counter()-start)
+        return report
+
+    async def HealthReport(self) -> list:
+        reports = await asyncio.gather(*(self._probe(node) for node in self.agents))
+        for report in reports:
+            report["problems"] = Redis.problems(report)
+        return list(reports)
+
+    async def ClusterHealthCheck(self) -> bool:
+        return Redis.cluster_status(await self.HealthReport()) == "green"
+
+
+class AsyncAgent:
+    "Agent.version_status and scan, plus a JSON POST, as coroutines."
+    def __init__(self,http:AsyncHTTPClient=None,limit:asyncio.Semaphore=None):
+        self.http = http or AsyncHTTPClient()
+        self.limit = _limiter(limit,AsyncBridge.MAX_PER_CLUSTER)
+
+    async def request(self,method:str,url:str,payload:dict=None,timeout:float=None) -> HTTPResponse:
+        parts = urlsplit(url)
+        body = json.dumps(payload).encode() if payload is not None else b""
+        headers = {"Content-Type":"application/json"} if payload is not None else {}
+        start = time.perf_counter()
+        error = True
+        try:
+            async with self.limit:
+                target = (parts.path or "/")+("?"+parts.query if parts.query else "")
+                response = await self.http.request(method,parts.hostname,parts.port or 80,target,headers,body,
+                                                   https=parts.scheme=="https",timeout=timeout)
+            error = not response.ok
+            return response
+        finally:
+            AGENT_REQUEST.observe(time.perf_counter()-start,agent=parts.netloc,command=parts.path)
+            if error:
+                AGENT_ERRORS.inc(agent=parts.netloc,command=parts.path)
+
+    async def post(self,url:str,payload:dict,timeout:float=None) -> HTTPResponse:
+        return await self.request("POST",url,payload,timeout)
+
+    async def version_status(self,node:str,timeout:float=3) -> dict:
+        report = {"node":node,"version":None,"status":Agent.FAILURE,"latency_ms":None,"error":None}
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self.request("GET",node+"/",timeout=timeout),timeout)
+            report["latency_ms"] = round((time.perf_counter()-start)*1000,2)
+            Agent._read_version(report,response.status,response.body)
+        except asyncio.TimeoutError:
+            report["error"] = "Timed out after {}s".format(timeout)
+        except (OSError,HTTPError):
+            report["error"] = "Connection failed"
+        except ValueError: #Not a JSON body
+            report["error"] = "Invalid response"
+        if report["error"]:
+            print("[ERROR] Version check on '{}' failed : {}".format(node,report["error"]))
+        return report
+
+    async def scan(self,nodes,timeout:float=3,deadline:float=None) -> list:
+        "Agent.scan : agents that have not answered when 'deadline' runs out are reported as FAILURE."
+        nodes = list(dict.fromkeys(nodes))
+        if not nodes:
+            return []
+        deadline = agent_client.scan_deadline if deadline is None else deadline
+        tasks = {asyncio.ensure_future(self.version_status(node,timeout)):node for node in nodes}
+        done,pending = await asyncio.wait(tasks,timeout=deadline)
+        for task in pending:
+            task.cancel()
+        return [task.result() if task in done else
+                {"node":node,"version":None,"status":Agent.FAILURE,"latency_ms":None,
+                 "error":"Deadline of {}s exceeded".format(deadline)}
+                for task,node in tasks.items()]
+
+
+#--------------------Bridge--------------------
+class AsyncBridge:
+    """
+    One event loop in a daemon thread, shared by every request of the process.
+    run() hands it a coroutine and blocks the calling thread until it is done, so a Flask view
+    probes a thousand nodes with a thousand tasks rather than a thousand threads.
+    es(), redis() and agents() build clients sharing the loop's keep-alive connections, and one
+    semaphore of 'max_per_cluster' per cluster so that a big cluster can't take every socket.
+    """
+    MAX_PER_CLUSTER=256
+    RUN_TIMEOUT=60
+
+    def __init__(self,app=None):
+        self.max_per_cluster = AsyncBridge.MAX_PER_CLUSTER
+        self.run_timeout = AsyncBridge.RUN_TIMEOUT
+        self.connect_timeout = 3
+        self.read_timeout = 30
+        self._loop = None
+        self._thread = None
+        self._limits = {}
+        self._lock = threading.Lock()
+        self.http = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self,app):
+        self.max_per_cluster = app.config.get("ASYNC_MAX_PER_CLUSTER",AsyncBridge.MAX_PER_CLUSTER)
+        self.run_timeout = app.config.get("ASYNC_RUN_TIMEOUT",AsyncBridge.RUN_TIMEOUT)
+        self.connect_timeout = app.config.get("AGENT_CONNECT_TIMEOUT",3)
+        self.read_timeout = app.config.get("AGENT_READ_TIMEOUT",30)
+        self.close()
+        app.extensions["async_bridge"] = self
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self.http = AsyncHTTPClient(self.connect_timeout,self.read_timeout,max_idle=8)
+                self._thread = threading.Thread(target=self._loop.run_forever,name="async-bridge",daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self,coro,timeout:float=None):
+        "Result of 'coro', run on the bridge's loop. On timeout the coroutine is cancelled."
+        loop = self._start()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("AsyncBridge.run() called from the bridge's own loop, await the coroutine instead")
+        future = asyncio.run_coroutine_threadsafe(coro,loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def limit(self,key) -> asyncio.Semaphore:
+        with self._lock:
+            if key not in self._limits:
+                self._limits[key] = asyncio.Semaphore(self.max_per_cluster)
+            return self._limits[key]
+
+    def es(self,nodes,auth:str=None) -> AsyncEs:
+        self._start()
+        return AsyncEs(nodes,auth,http=self.http,limit=self.limit(("ElasticSearch",tuple(sorted(nodes)))))
+
+    def redis(self,nodes,auth=None) -> AsyncRedis:
+        return AsyncRedis(nodes,auth,limit=self.limit(("Redis",tuple(sorted(nodes)))))
+
+    def agents(self) -> AsyncAgent:
+        self._start()
+        return AsyncAgent(http=self.http,limit=self.limit(("Agent",)))
+
+    @staticmethod
+    async def _shutdown(http:AsyncHTTPClient):
+        "Cancel whatever still runs on the loop, so that no run() waits on it forever, then drop the connections."
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks,return_exceptions=True)
+        await http.close()
+
+    def close(self):
+        "Cancel the pending coroutines, stop the loop and drop its connections. The next run() starts a new one."
+        with self._lock:
+            loop,thread,http = self._loop,self._thread,self.http
+            self._loop = self._thread = self.http = None
+            self._limits = {}
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(AsyncBridge._shutdown(http),loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+bridge = AsyncBridge()
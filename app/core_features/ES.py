@@ -1,114 +1,312 @@
-from collections.abc import MutableMapping
+from collections import Counter
+from collections.abc import Mapping,MutableMapping
 import time 
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-import requests
-import re
 import os
-import yaml
 from .INTERFACE import Interface
-import socket
-import ssl
+from .HTTPPOOL import ConnectionPool
+from .AGENTCLIENT import agent_client
+from .TEMPLATES import config_templates,flatten
+from ..metrics import ES_REQUEST,ES_ERRORS,RESTART_PHASE,RESTART_FAILURES
+from ..progress import progress,NODE_STARTED,NODE_RESTARTED,WAITING_FOR_GREEN,NODE_DONE,FAILURE
+from ..topology import parse_address,DEFAULT_PORTS,agent_port
 import base64
+from concurrent.futures import ThreadPoolExecutor
 import json
-import random
+import threading
+from urllib.parse import urlencode
 
 class Es(Interface):
+    LONG_POLL=30 #seconds the cluster may hold each health request
+    LEAVE_TIMEOUT=30 #how long to watch for the restarted node to leave
+    NODE_TIMEOUT=1800 #give up on a node that is not back and green by then
+    VERSION_TTL=300 #seconds a cluster's version number is reused for
+    #Per node by nature : attributes ES adds itself (node.attr.ml.machine_memory...), paths, addresses
+    NODE_LOCAL_SETTINGS=("node.name","network.host","client.type","http.type.default","transport.type.default")
+    NODE_LOCAL_PREFIXES=("node.attr.","path.")
+    #Placeholders in the templates : nodes are compared with each other on these, not with the template
+    TEMPLATE_PLACEHOLDERS=("cluster.name","discovery.seed_hosts","cluster.initial_master_nodes")
+    _versions = {} #(sorted nodes, https) -> (asked at, version number)
+    _versions_lock = threading.Lock()
+
     def __init__(self,nodes,auth:tuple = None):
         "If authentication is required, it must be given in a form of <id>:<password>"
-        self.nodes :list[str]= nodes
+        nodes = [parse_address(node,DEFAULT_PORTS["ElasticSearch"]) for node in nodes]
+        self.https = nodes[0].https
+        self.agents = [node.agent for node in nodes]
+        self.nodes :list[tuple]= [node.endpoint for node in nodes] # (123.123.23.24,9200)
         self.auth = auth
-        if self.nodes[0].startswith=="https":
-            self.https=True
-        else:
-            self.https=False
-        self.agents = []
-        
-        for idx in range(len(self.nodes)):
-            self.agents.append(re.sub(r"https",r"http",self.nodes[idx]).rsplit(":",maxsplit=1)[0] +":5000")
-            ip,port = re.search(r"[0-9]{2,3}.[0-9]{1,3}.[0-9]{1,3}.[0-9]{1,3}:[0-9]{4}",self.nodes[idx]).group().split(":")# (123.123.23.24,9200)
-            self.nodes[idx] = (ip,int(port))
+        self.pool = ConnectionPool.for_cluster(self.nodes,self.https)
             
 
     def es_con(self,path='/_cluster/health',get="status") -> str:
-        node = random.choice(self.nodes)
-        
-        with socket.socket(socket.AF_INET,socket.SOCK_STREAM) as sock:
-            if self.https:
-                sock = ssl.wrap_socket(sock,keyfile=None,certfile=None,server_side=False,cert_reqs=ssl.CERT_NONE,ssl_version=ssl.PROTOCOL_SSLv23)
-            sock.settimeout(3)
-            try :
-                sock.connect(node)
-            except TimeoutError as t:
-                self.es_con(path=path,get=get)
-            except Exception as e:
-                return str(e)
-
-            else:
-            #HTTP communication protocol
-                path = path
-                host = node[0]
-                if self.auth :
-                    token = base64.b64encode(self.auth.encode("ascii"))
-                    lines = [
-                    'GET %s HTTP/1.1' % path,
-                    'Host: %s' % host,
-                    'Authorization: Basic %s' %token.decode()
-                    ]
-                else :
-                    lines = [
-                    'GET %s HTTP/1.1' % path,
-                    'Host: %s' % host,
-                    ]
-
-                #sock.send
-                sock.send(("\r\n".join(lines) +"\r\n\r\n").encode())
-                response=sock.recv(4096).decode()
-                separator=response.index("{")
-                result = json.loads(response[separator:])
-                return result.get(get)
+        "GET 'path' over the cluster's keep-alive pool and return the 'get' key of the JSON body."
+        try:
+            result = self.es_json(path)
+        except Exception as e:
+            return str(e)
+        return result.get(get)
 
-    
+    def es_json(self,path:str,timeout:float=None) -> dict:
+        "GET 'path' and return the whole JSON body. Raises on connection or parsing errors."
+        headers = {"Accept":"application/json"}
+        if self.auth :
+            token = base64.b64encode(self.auth.encode("ascii"))
+            headers["Authorization"] = "Basic %s" %token.decode()
+        label = path.split("?")[0]
+        try:
+            with ES_REQUEST.time(path=label):
+                response = self.pool.request("GET",path,headers,timeout=timeout)
+            return json.loads(response.body)
+        except Exception:
+            ES_ERRORS.inc(path=label)
+            raise
+
+    def pool_stats(self) -> dict:
+        return self.pool.pool_stats()
 
     @staticmethod
     def token_generator() -> str:
         serializer= Serializer(os.getenv("AGENT_KEY"),300)
         return serializer.dumps({"confirm":True}).decode("utf-8")
     
-    def RollingRestart(self):
-        #es_con = self.connector()
-        for ip,port in self.nodes: # ip:str,port:int 
-            while True : 
-                try :
-                    # if es_con.cluster.health()['status'] =="green":
-                    if self.es_con() == "green":
-                        print("Cluster health green! Continue rolling restart...")
-                        token = Es.token_generator()
-                        
-                        res=requests.post("http://"+ip+":5000/es/command/restart",json={"token":token,"port":str(port)})
-                        if res.status_code == 200:
-                            print(f"[SUCCESS] Agent : {ip} executed Restart...")
-                            time.sleep(10) 
-                            #es_con = self.connector() # recall 
-                        else:
-                            print(f"[ERROR] Agent : {ip} restart failed...")
-                except Exception as e:
-                    print(f"[ERROR]! {e}")
-                    print(e.args)
-                    return False
+    def wait_for_health(self,deadline:float,on_poll=None,**params):
+        """
+        Long-poll _cluster/health with 'params' (wait_for_status, wait_for_nodes...) so that the cluster
+        answers as soon as the condition holds. Returns the health body, or None once 'deadline' (monotonic) passes.
+        'on_poll(health)' is called with the body of every poll, including the ones that timed out.
+        """
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            poll = max(1,min(Es.LONG_POLL,int(remaining)))
+            query = urlencode(dict(params,timeout="{}s".format(poll)))
+            try:
+                health = self.es_json("/_cluster/health?"+query,timeout=poll+5)
+            except Exception as e:
+                #e.g. the request landed on the node being restarted
+                print(f"[WARNING] Health request failed : {e}")
+                time.sleep(1)
+                continue
+            if "status" in health and on_poll is not None:
+                on_poll(health)
+            if "status" in health and not health.get("timed_out"):
+                return health
+            if "status" not in health: #error body, e.g. master not discovered yet
+                time.sleep(1)
+
+    @staticmethod
+    def _address(info:dict):
+        "(ip,port) a node publishes over HTTP. publish_address is either 'ip:port' or 'hostname/ip:port'."
+        ip,_,port = info.get("http",{}).get("publish_address","").rsplit("/",1)[-1].rpartition(":")
+        return (ip.strip("[]"),int(port)) if port.isdigit() else None
+
+    def node_start_times(self) -> dict:
+        "(ip,port) -> JVM start time, for every node currently in the cluster."
+        nodes = self.es_json("/_nodes/http,jvm?filter_path=nodes.*.http.publish_address,nodes.*.jvm.start_time_in_millis").get("nodes",{})
+        return {Es._address(info):info.get("jvm",{}).get("start_time_in_millis") for info in nodes.values()}
+
+    def node_start_time(self,ip:str,port:int):
+        "JVM start time of the node publishing ip:port over HTTP, or None when it is not in the cluster."
+        return self.node_start_times().get((ip,port))
+
+    #--------Restart batches--------
+    def awareness_attributes(self) -> list:
+        "cluster.routing.allocation.awareness.attributes, from wherever it is set."
+        settings = self.es_json("/_cluster/settings?include_defaults=true&flat_settings=true")
+        for scope in ("transient","persistent","defaults"):
+            value = settings.get(scope,{}).get("cluster.routing.allocation.awareness.attributes")
+            if value:
+                return [attr.strip() for attr in (value if isinstance(value,list) else value.split(",")) if attr.strip()]
+        return []
+
+    @staticmethod
+    def plan_groups(nodes:list,zone_of:dict,copies:list) -> list:
+        """
+        Split 'nodes' into restart batches. Nodes of one zone go together as long as every shard
+        keeps at least one started copy outside the batch; a zone that can't is split greedily.
+        'zone_of' maps node -> zone (nodes without a zone are batched alone),
+        'copies' is a list of sets : the nodes holding a started copy of each shard.
+        """
+        zones = {}
+        for node in nodes:
+            zones.setdefault(zone_of.get(node,("node",node)),[]).append(node)
+        groups = []
+        for members in zones.values():
+            batch = []
+            for node in members:
+                candidate = set(batch+[node])
+                if not batch or not any(holders and holders <= candidate for holders in copies):
+                    batch.append(node)
                 else:
-                    cnt=1
-                    #Proceeding with rolling restart with cluster health being yellow or red is banned. 
-                    while self.es_con() != "green":
-                        print("Cluster health not green! give it a little sec")
-                        print(f"Tried {cnt} times...")
-                        print(f"The most recent execution was on {ip}")
-                        time.sleep(10)
-                        cnt+=1
-                        continue
-                    else:
-                        break
+                    groups.append(batch)
+                    batch = [node]
+            if batch:
+                groups.append(batch)
+        return groups
+
+    def restart_groups(self) -> list:
+        "Batches of self.nodes that can be restarted together, from node attributes and shard placement."
+        attributes = self.awareness_attributes()
+        if not attributes:
+            return [[node] for node in self.nodes]
+        nodes = self.es_json("/_nodes?filter_path=nodes.*.name,nodes.*.attributes,nodes.*.http.publish_address").get("nodes",{})
+        name_to_address = {info.get("name"):Es._address(info) for info in nodes.values()}
+        zone_of = {Es._address(info):tuple(info.get("attributes",{}).get(attr) for attr in attributes)
+                   for info in nodes.values()
+                   if all(attr in info.get("attributes",{}) for attr in attributes)}
+        copies = {}
+        for shard in self.es_json("/_cat/shards?format=json&h=index,shard,prirep,state,node"):
+            holders = copies.setdefault((shard["index"],shard["shard"]),set())
+            if shard.get("state") == "STARTED" and shard.get("node") in name_to_address:
+                holders.add(name_to_address[shard["node"]])
+        return Es.plan_groups(self.nodes,zone_of,list(copies.values()))
+
+    #--------Rolling restart--------
+    def _send_restart(self,node:tuple) -> bool:
+        ip,port = node
+        try :
+            token = Es.token_generator()
+            res=agent_client.post(f"http://{ip}:{agent_port()}/es/command/restart",json={"token":token,"port":str(port)},
+                                timeout=(agent_client.connect_timeout,Es.RESTART_REQUEST_TIMEOUT))
+        except Exception as e:
+            print(f"[ERROR]! {e}")
+            print(e.args)
+            return False
+        if res.status_code != 200:
+            print(f"[ERROR] Agent : {ip} restart failed...")
+            return False
+        print(f"[SUCCESS] Agent : {ip} executed Restart...")
+        return True
+
+    @staticmethod
+    def _failed(phase:str,nodes:list,error:str):
+        print(f"[ERROR] {error}")
+        RESTART_FAILURES.inc(solution="ElasticSearch",phase=phase)
+        progress.emit(FAILURE,solution="ElasticSearch",phase=phase,nodes=nodes,error=error)
+
+    @staticmethod
+    def _waiting(phase:str,nodes:list):
+        "on_poll for wait_for_health : one waiting_for_green event per poll."
+        def on_poll(health:dict):
+            progress.emit(WAITING_FOR_GREEN,solution="ElasticSearch",phase=phase,nodes=nodes,status=health.get("status"),
+                          number_of_nodes=health.get("number_of_nodes"),unassigned_shards=health.get("unassigned_shards"),
+                          relocating_shards=health.get("relocating_shards"),initializing_shards=health.get("initializing_shards"))
+        return on_poll
+
+    def _wait_for_rejoin(self,group:list,started:dict,number_of_nodes:int,deadline:float):
+        """
+        Monotonic time at which the cluster is back to 'number_of_nodes' with every node of 'group' running
+        a JVM started after 'started', or None once 'deadline' passes.
+        Nodes missing from 'started' (configured by hostname, publishing another interface...) only count
+        through the node count.
+        """
+        tracked = [node for node in group if started.get(node) is not None]
+        while self.wait_for_health(deadline,wait_for_nodes=">={}".format(number_of_nodes)):
+            try:
+                current = self.node_start_times()
+                if all(current.get(node) not in (None,started[node]) for node in tracked):
+                    return time.monotonic()
+            except Exception as e:
+                print(f"[WARNING] Node list request failed : {e}")
+            time.sleep(1)
+        return None
+
+    def _restart_group(self,group:list) -> bool:
+        "Restart every node of 'group' at once and wait for all of them to rejoin and the cluster to get green."
+        deadline = time.monotonic() + Es.NODE_TIMEOUT
+        nodes = [f"{ip}:{port}" for ip,port in group]
+        names = ", ".join(nodes)
+        #Proceeding with rolling restart with cluster health being yellow or red is banned. 
+        began = time.monotonic()
+        health = self.wait_for_health(deadline,Es._waiting("pre_green",nodes),wait_for_status="green")
+        if health is None:
+            Es._failed("pre_green",nodes,f"Cluster never got green before restarting {names}")
+            return False
+        print("Cluster health green! Continue rolling restart...")
+        try:
+            started = self.node_start_times()
+        except Exception as e:
+            Es._failed("start_times",nodes,str(e))
+            return False
+        untracked = [f"{ip}:{port}" for ip,port in group if started.get((ip,port)) is None]
+        if untracked:
+            print(f"[WARNING] No node publishes {', '.join(untracked)} over HTTP : only the node count tells when they are back")
+        for node in nodes:
+            progress.emit(NODE_STARTED,solution="ElasticSearch",node=node,group=len(self.groups))
+        sending = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(group)) as pool:
+            sent = list(pool.map(self._send_restart,group))
+        for node,ok in zip(nodes,sent):
+            if ok:
+                progress.emit(NODE_RESTARTED,solution="ElasticSearch",node=node)
+        restarted = time.monotonic()
+        number_of_nodes = health["number_of_nodes"]
+        if not all(sent):
+            Es._failed("restart",[node for node,ok in zip(nodes,sent) if not ok],f"Agent restart failed on {names}")
+            #Don't leave the cluster yellow behind the nodes that did restart
+            group = [node for node,ok in zip(group,sent) if ok]
+            nodes = [f"{ip}:{port}" for ip,port in group]
+            if group and self._wait_for_rejoin(group,started,number_of_nodes,deadline) is not None:
+                self.wait_for_health(deadline,Es._waiting("green",nodes),wait_for_status="green")
+            return False
+
+        #The restart may be over before this is asked; the start time check below still tells.
+        left = self.wait_for_health(min(deadline,restarted+Es.LEAVE_TIMEOUT),wait_for_nodes="<{}".format(number_of_nodes))
+        left_at = time.monotonic() if left else None
+
+        rejoined_at = self._wait_for_rejoin(group,started,number_of_nodes,deadline)
+        if rejoined_at is None:
+            Es._failed("rejoin",nodes,f"{names} did not rejoin the cluster in {Es.NODE_TIMEOUT}s")
+            return False
+        print(f"{names} rejoined the cluster")
+
+        if self.wait_for_health(deadline,Es._waiting("green",nodes),wait_for_status="green") is None:
+            Es._failed("green",nodes,f"Cluster did not get green after restarting {names}")
+            return False
+        green_at = time.monotonic()
+
+        for ip,port in group:
+            timing = {
+                "node":f"{ip}:{port}",
+                "group":len(self.groups),
+                "downtime_s":round(rejoined_at-(left_at or restarted),2),
+                "rejoin_s":round(rejoined_at-restarted,2),
+                "green_s":round(green_at-rejoined_at,2),
+                "total_s":round(green_at-restarted,2),
+            }
+            self.timings.append(timing)
+            for phase,seconds in (("pre_green",sending-began),("restart",restarted-sending),
+                                  ("rejoin",timing["rejoin_s"]),("green",timing["green_s"])):
+                RESTART_PHASE.observe(seconds,solution="ElasticSearch",phase=phase,node=timing["node"])
+            progress.emit(NODE_DONE,solution="ElasticSearch",**timing)
+            print(f"[SUCCESS] {timing}")
+        return True
+
+    def RollingRestart(self,batched:bool=False):
+        """
+        Restart node by node, or with 'batched' a whole zone at a time (see restart_groups).
+        Each wait is driven by the cluster : long-polls on _cluster/health for the nodes to leave,
+        for the node count to recover and for green, plus the nodes' JVM start time to confirm
+        the restarted nodes are the ones that rejoined. Per-node timings end up in self.timings.
+        """
+        self.timings = []
+        self.groups = []
+        if batched:
+            try:
+                groups = self.restart_groups()
+            except Exception as e:
+                print(f"[ERROR] Could not plan restart batches : {e}")
+                progress.emit(FAILURE,solution="ElasticSearch",phase="plan",nodes=[],error=str(e))
+                return False
         else:
-            return True
+            groups = [[node] for node in self.nodes] # ip:str,port:int 
+        for group in groups:
+            if not self._restart_group(group):
+                return False
+            self.groups.append(group)
+        return True
     
     def ClusterHealthCheck(self) -> str:
         try :
@@ -116,62 +314,125 @@ class Es(Interface):
         except Exception as e:
             return str(e)
     
+    def version(self) -> str:
+        "Version number of the cluster, asked at most once per VERSION_TTL seconds for the same nodes."
+        key = (tuple(sorted(self.nodes)),self.https)
+        now = time.monotonic()
+        cached = Es._versions.get(key)
+        if cached is not None and now - cached[0] < Es.VERSION_TTL:
+            return cached[1]
+        version :str = self.es_con(path='/',get="version").get("number")
+        with Es._versions_lock:
+            Es._versions[key] = (now,version)
+        return version
+
     @property
     def Configuration(self) -> dict:
-        #First, check the version of cluster
-        #es_con = self.connector()
-        try : 
-            # version :str = es_con.info().get("version").get("number") 
-            version :str = self.es_con(path='/',get="version").get("number")
-            dirname = os.path.dirname(__file__)
-            filename = os.path.join(dirname, f'../solutions/elasticsearch/elasticsearch{version[0]}.yml')
-            with open(filename,encoding='UTF8') as f:
-                data = Es.flatten_dict(yaml.load(f,Loader=yaml.FullLoader))
-                return data
-                
+        "Flattened template for the cluster's major version, out of the template cache."
+        try :
+            return dict(config_templates.get("elasticsearch",self.version().split(".")[0]))
         except Exception as e:
-            print("error from exception")
             return e
     
     
-    def SetConfiguration(self,dic:MutableMapping) -> bool:
+    @staticmethod
+    def normalize_settings(settings:Mapping) -> dict:
+        """
+        ES answers every setting as a string, the YAML template has booleans, numbers and lists.
+        'key.0', 'key.1'... are folded back into a list. Settings that are per node by nature are dropped.
+        """
+        def value(v):
+            if isinstance(v,(list,tuple)):
+                return [value(x) for x in v]
+            if isinstance(v,bool):
+                return "true" if v else "false"
+            return str(v).strip()
+        normalized,arrays = {},{}
+        for key,v in settings.items():
+            prefix,_,index = key.rpartition(".")
+            if prefix and index.isdigit():
+                arrays.setdefault(prefix,{})[int(index)] = value(v)
+            elif not Es.node_local(key):
+                normalized[key] = value(v)
+        for key,items in arrays.items():
+            if not Es.node_local(key):
+                normalized[key] = [items[i] for i in sorted(items)]
+        return normalized
+
+    @staticmethod
+    def node_local(key:str) -> bool:
+        return key in Es.NODE_LOCAL_SETTINGS or key.startswith(Es.NODE_LOCAL_PREFIXES)
+
+    NODE_SETTINGS_PATH="/_nodes/settings?flat_settings=true&filter_path=nodes.*.name,nodes.*.settings"
+
+    @staticmethod
+    def parse_node_settings(body:dict) -> dict:
+        return {node.get("name",node_id):Es.normalize_settings(flatten(node.get("settings",{})))
+                for node_id,node in body.get("nodes",{}).items()}
+
+    def node_settings(self) -> dict:
+        "node name -> normalized settings, for every node of the cluster in one _nodes/settings call."
+        return Es.parse_node_settings(self.es_json(Es.NODE_SETTINGS_PATH))
+
+    def LiveConfigurationReport(self) -> dict:
+        """
+        What the nodes actually run, against the template and against each other, deltas only.
+        Nodes with identical settings are grouped by hash, so each distinct set is compared once.
+          - 'data'  : key -> expected value for the keys that differ : the template's, or what most nodes have
+                      for the keys the template lacks or only holds a placeholder for (TEMPLATE_PLACEHOLDERS)
+          - 'drift' : key -> {node: value} for the nodes not running the expected value
+          - 'groups': nodes per distinct set of settings, majority first
+        """
+        return Es.settings_report(self.version(),self.node_settings())
+
+    @staticmethod
+    def settings_report(version:str,nodes:dict) -> dict:
+        "LiveConfigurationReport out of the version number and node name -> normalized settings."
+        template = Es.normalize_settings(config_templates.get("elasticsearch",version.split(".")[0]))
+        template = {k:v for k,v in template.items() if k not in Es.TEMPLATE_PLACEHOLDERS}
+        groups = {}
+        for name,settings in nodes.items():
+            groups.setdefault(Es.config_hash(settings),{"settings":settings,"nodes":[]})["nodes"].append(name)
+        ordered = sorted(groups.items(),key=lambda item: -len(item[1]["nodes"])) #majority first
+
+        data,drift = {},{}
+        for key in dict.fromkeys([*template,*(key for _,group in ordered for key in group["settings"])]):
+            values = [(group["settings"].get(key),group["nodes"]) for _,group in ordered]
+            if key in template:
+                expected = template[key]
+            else: #the value most nodes have, ties going to the largest group
+                votes = Counter()
+                for v,names in values:
+                    if v is not None:
+                        votes[json.dumps(v)] += len(names)
+                expected = json.loads(votes.most_common(1)[0][0])
+            off = {node:v for v,names in values if v != expected for node in names}
+            if off:
+                data[key] = expected
+                drift[key] = off
+        return {
+            "version":version,
+            "nodes":len(nodes),
+            "data":data,
+            "drift":drift,
+            "groups":[{"hash":digest,"nodes":group["nodes"]} for digest,group in ordered],
+        }
+
+    def SetConfiguration(self,dic:MutableMapping,force:bool=False,dry_run:bool=False) -> bool:
+        """
+        Two-phase push to every agent in parallel of the keys each node doesn't run yet (see Interface.delta_push).
+        Per-node reports end up in self.push_reports. With dry_run, they are the plan and nothing is sent.
+        """
         token = Es.token_generator()
         #Connect, and send this newly gotten dict
-        error_reports=[]
-        for ip,port in self.nodes:
-            try:        
-                print(token)
-                res=requests.post("http://"+ip+":5000/es/command/configuration",json={"token":token,"data":dic,"port":str(port)})
-                if res.status_code == 200:
-                    message= f"[SUCCESS] Agent '{ip}' Set Config file..."
-                    print(message)  
-                else:
-                    message = f"[ERROR] Sent a post request but agent '{ip}' failed to set config file"
-                    error_reports.append(message)
-            except Exception as e:
-                message =f"[Error] Post request to '{ip}' failed !"
-                print(message)
-                error_reports.append(message)
-        if not error_reports:
-            return True,0
-        else:
-            return False,error_reports
+        targets = [(f"{ip}:{port}",f"http://{ip}:{agent_port()}/es/command/configuration",{"token":token,"port":str(port)})
+                   for ip,port in self.nodes]
+        self.push_reports = Es.delta_push("ElasticSearch",targets,dict(dic),force,dry_run)
+        for report in self.push_reports:
+            print(f"[{report['commit']}] Agent '{report['node']}' config push : {report}")
+        return Es.push_result(self.push_reports)
     
     # flatenning dict--------
-    @staticmethod
-    def _flatten_dict_gen(d:dict,parent_key,sep):
-        for k ,v in d.items():
-            new_key = parent_key + sep + k if parent_key else k
-            if isinstance(v,MutableMapping):
-                yield from Es.flatten_dict(v,new_key,sep=sep).items()
-            else:
-                yield new_key,v
-    
     @staticmethod
     def flatten_dict(d:MutableMapping, parent_key:str ="",sep:str="."):
-        return dict(Es._flatten_dict_gen(d,parent_key,sep))
-                
-
-
-                        
-                
+        return flatten(d,parent_key,sep)
@@ -0,0 +1,62 @@
+######################################################################
+# What each node was last configured with, as one hash per key.
+# A configuration push compares against it to send every node only the
+# keys whose value changed, and to skip the nodes already up to date.
+#
+######################################################################
+
+import hashlib
+import json
+import threading
+
+
+class ConfigFingerprints:
+    """
+    (solution, node) -> {key: hash of the value last committed on the node}.
+    Kept in memory only : after a restart of the master, the first push to a node sends every key.
+    Settings changed on a node by other means are not seen, push with force=True to send everything.
+    """
+    def __init__(self):
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def value_hash(value) -> str:
+        return hashlib.sha256(json.dumps(value,sort_keys=True,default=str).encode()).hexdigest()[:16]
+
+    def delta(self,solution:str,node:str,config:dict,force:bool=False) -> dict:
+        "The part of 'config' that 'node' does not run yet."
+        if force:
+            return dict(config)
+        with self._lock:
+            applied = self._nodes.get((solution,node),{})
+        return {k:v for k,v in config.items() if applied.get(k) != ConfigFingerprints.value_hash(v)}
+
+    def removed(self,solution:str,node:str,config:dict) -> list:
+        "Keys committed on 'node' that 'config' no longer has."
+        with self._lock:
+            applied = self._nodes.get((solution,node),{})
+        return sorted(k for k in applied if k not in config)
+
+    def plan(self,solution:str,nodes:list,config:dict,force:bool=False) -> dict:
+        "node -> keys to send, {} for a node that is up to date."
+        return {node:self.delta(solution,node,config,force) for node in nodes}
+
+    def record(self,solution:str,node:str,config:dict,replace:bool=False):
+        "'config' was committed on 'node', merged into what it ran or, with 'replace', instead of it."
+        hashes = {k:ConfigFingerprints.value_hash(v) for k,v in config.items()}
+        with self._lock:
+            self._nodes[(solution,node)] = hashes if replace else {**self._nodes.get((solution,node),{}),**hashes}
+
+    def forget(self,solution:str,node:str=None):
+        "Drop what is known of one node, or of every node of the solution."
+        with self._lock:
+            for key in [key for key in self._nodes if key[0] == solution and node in (None,key[1])]:
+                del self._nodes[key]
+
+    def get(self,solution:str,node:str) -> dict:
+        with self._lock:
+            return dict(self._nodes.get((solution,node),{}))
+
+
+fingerprints = ConfigFingerprints()
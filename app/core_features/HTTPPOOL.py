@@ -0,0 +1,266 @@
+######################################################################
+# Keep-alive HTTP/1.1 connection pool used to talk to the solutions
+# directly (e.g. Elasticsearch REST port).
+#
+######################################################################
+
+from collections import deque
+import socket
+import ssl
+import threading
+import time
+import random
+
+
+class HTTPError(Exception):
+    "Raised when the peer sends something that is not a valid HTTP/1.1 response."
+
+
+class HTTPResponse:
+    "A fully read HTTP/1.1 response."
+    def __init__(self,status:int,reason:str,headers:dict,body:bytes,keep_alive:bool):
+        self.status = status
+        self.reason = reason
+        self.headers = headers #lower-cased header names
+        self.body = body
+        self.keep_alive = keep_alive
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def text(self) -> str:
+        return self.body.decode("utf-8",errors="replace")
+
+    def __repr__(self):
+        return "<HTTPResponse %r %r>" % (self.status,self.reason)
+
+
+class HTTPReader:
+    "Minimal HTTP/1.1 response parser : Content-Length, chunked and read-until-close bodies."
+    MAX_LINE = 65536
+
+    def __init__(self,sock):
+        self.file = sock.makefile("rb")
+
+    def _readline(self) -> bytes:
+        line = self.file.readline(HTTPReader.MAX_LINE+1)
+        if not line:
+            raise ConnectionResetError("Connection closed by peer")
+        if len(line) > HTTPReader.MAX_LINE:
+            raise HTTPError("Header line too long")
+        return line
+
+    def read_response(self,method:str="GET") -> HTTPResponse:
+        status_line = self._readline().decode("iso-8859-1").rstrip("\r\n")
+        try:
+            version,status,*reason = status_line.split(" ",2)
+            status = int(status)
+        except ValueError:
+            raise HTTPError("Malformed status line : {!r}".format(status_line))
+        if not version.startswith("HTTP/1."):
+            raise HTTPError("Unsupported protocol : {!r}".format(version))
+
+        headers = {}
+        while True:
+            line = self._readline().decode("iso-8859-1").rstrip("\r\n")
+            if not line:
+                break
+            name,_,value = line.partition(":")
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = headers[name]+", "+value if name in headers else value
+
+        connection = headers.get("connection","").lower()
+        keep_alive = "close" not in connection if version=="HTTP/1.1" else "keep-alive" in connection
+
+        if method=="HEAD" or status in (204,304) or 100 <= status < 200:
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding","").lower():
+            body = self._read_chunked()
+        elif "content-length" in headers:
+            body = self._read_exact(int(headers["content-length"]))
+        else:
+            body = self.file.read() #Body delimited by connection close
+            keep_alive = False
+        return HTTPResponse(status,reason[0] if reason else "",headers,body,keep_alive)
+
+    def _read_exact(self,length:int) -> bytes:
+        body = self.file.read(length)
+        if len(body) != length:
+            raise ConnectionResetError("Connection closed with {} of {} bytes read".format(len(body),length))
+        return body
+
+    def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            size_line = self._readline().split(b";",1)[0].strip()
+            try:
+                size = int(size_line,16)
+            except ValueError:
+                raise HTTPError("Malformed chunk size : {!r}".format(size_line))
+            if size == 0:
+                #Trailers, then the final CRLF
+                while self._readline() not in (b"\r\n",b"\n"):
+                    pass
+                return b"".join(chunks)
+            chunks.append(self._read_exact(size))
+            self._readline() #CRLF after each chunk
+
+    def close(self):
+        self.file.close()
+
+
+class PooledConnection:
+    def __init__(self,node:tuple,https:bool,timeout:float):
+        self.node = node
+        sock = socket.create_connection(node,timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+        if https:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock,server_hostname=node[0])
+        self.sock = sock
+        self.timeout = timeout
+        self.reader = HTTPReader(sock)
+        self.last_used = time.monotonic()
+
+    def request(self,method:str,path:str,headers:dict,body:bytes=b"",timeout:float=None) -> HTTPResponse:
+        "'timeout' overrides the read timeout for this request only (e.g. long-polls)."
+        if timeout is not None:
+            self.sock.settimeout(timeout)
+        lines = ["{} {} HTTP/1.1".format(method,path)]
+        lines += ["{}: {}".format(k,v) for k,v in headers.items()]
+        if body or method in ("POST","PUT"):
+            lines.append("Content-Length: {}".format(len(body)))
+        self.sock.sendall(("\r\n".join(lines)+"\r\n\r\n").encode("iso-8859-1")+body)
+        response = self.reader.read_response(method)
+        if timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.last_used = time.monotonic()
+        return response
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """
+    Per-cluster pool of persistent connections.
+    Idle connections are kept per node and reused until they go stale or the peer closes them.
+    Use ConnectionPool.for_cluster() so every Es instance of one cluster shares a pool.
+    """
+    _pools = {}
+    _pools_lock = threading.Lock()
+    IDEMPOTENT = ("GET","HEAD") #methods safe to send again after the node may have received them
+
+    def __init__(self,nodes:list,https:bool=False,timeout:float=3,max_idle:int=4,idle_ttl:float=30,retries:int=2):
+        self.nodes = list(nodes) #list of (host,port)
+        self.https = https
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle_ttl = idle_ttl
+        self.retries = retries
+        self._idle = {node:deque() for node in self.nodes}
+        self._lock = threading.Lock()
+        self.stats = {"requests":0,"created":0,"reused":0,"retries":0,"errors":0,"discarded":0}
+
+    @classmethod
+    def for_cluster(cls,nodes:list,https:bool=False,**kwargs):
+        key = (tuple(sorted(nodes)),https)
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls._pools[key] = cls(nodes,https,**kwargs)
+            return pool
+
+    @classmethod
+    def all_stats(cls) -> dict:
+        with cls._pools_lock:
+            return {",".join("{}:{}".format(*n) for n in key[0]):pool.pool_stats() for key,pool in cls._pools.items()}
+
+    def _count(self,key:str):
+        with self._lock:
+            self.stats[key]+=1
+
+    def _acquire(self,node:tuple):
+        "Return (connection, reused)"
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle[node]
+            while idle:
+                conn = idle.pop()
+                if now - conn.last_used < self.idle_ttl:
+                    self.stats["reused"]+=1
+                    return conn,True
+                self.stats["discarded"]+=1
+                conn.close()
+        conn = PooledConnection(node,self.https,self.timeout)
+        self._count("created")
+        return conn,False
+
+    def _release(self,conn:PooledConnection,keep_alive:bool):
+        if keep_alive:
+            with self._lock:
+                idle = self._idle[conn.node]
+                if len(idle) < self.max_idle:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def request(self,method:str,path:str,headers:dict=None,body:bytes=b"",node:tuple=None,timeout:float=None) -> HTTPResponse:
+        """
+        Send one request, retrying at most 'retries' times on timeouts and connection errors,
+        each time on another node when no node was pinned.
+        Other methods than IDEMPOTENT ones are retried only when the connection could not be opened,
+        so a POST is never run twice.
+        A stale keep-alive connection closed by the peer is replaced without using up a retry.
+        """
+        self._count("requests")
+        last_error = None
+        for attempt in range(self.retries+1):
+            target = node or random.choice(self.nodes)
+            headers_ = {"Host":target[0],"Connection":"keep-alive"}
+            headers_.update(headers or {})
+            conn = None
+            try:
+                conn,reused = self._acquire(target)
+                try:
+                    response = conn.request(method,path,headers_,body,timeout)
+                except (ConnectionResetError,BrokenPipeError,ConnectionAbortedError):
+                    if not reused:
+                        raise
+                    conn.close()
+                    self._count("discarded")
+                    conn = PooledConnection(target,self.https,self.timeout)
+                    self._count("created")
+                    response = conn.request(method,path,headers_,body,timeout)
+                self._release(conn,response.keep_alive)
+                return response
+            except (OSError,HTTPError) as e: #socket.timeout and ssl errors are OSErrors
+                if conn is not None:
+                    conn.close()
+                last_error = e
+                if conn is not None and method not in ConnectionPool.IDEMPOTENT:
+                    break #the node may have run it already
+                if attempt < self.retries:
+                    self._count("retries")
+        self._count("errors")
+        raise last_error
+
+    def pool_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["idle"] = sum(len(idle) for idle in self._idle.values())
+        return stats
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                while idle:
+                    idle.pop().close()
@@ -1,5 +1,13 @@
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import os
+import requests
+from .AGENTCLIENT import agent_client
+from .FINGERPRINTS import fingerprints
+from ..metrics import CONFIG_PUSH,CONFIG_PUSH_ERRORS
+import time
 
 from abc import ABC,abstractmethod
 class Interface(ABC):
@@ -15,6 +23,142 @@ class Interface(ABC):
         serializer= Serializer(os.getenv("AGENT_KEY"),300)
         return serializer.dumps({"confirm":True}).decode("utf-8")
     
+    @staticmethod
+    def config_hash(config:dict) -> str:
+        "Same settings, same hash : nodes are grouped by it so each distinct config is compared once."
+        return hashlib.sha256(json.dumps(config,sort_keys=True).encode()).hexdigest()
+
+    #Rolling restart : the agent answers once the service was restarted, which can outlast AGENT_READ_TIMEOUT
+    RESTART_REQUEST_TIMEOUT=600
+
+    #Configuration push
+    PUSH_WORKERS=32
+    CONNECT_TIMEOUT=3
+    PUSH_TIMEOUT=30
+
+    @staticmethod
+    def _post(url:str,payload:dict) -> tuple:
+        "(response, elapsed ms)"
+        start = time.perf_counter()
+        res = agent_client.post(url,json=payload,timeout=(Interface.CONNECT_TIMEOUT,Interface.PUSH_TIMEOUT))
+        return res,round((time.perf_counter()-start)*1000,2)
+
+    @staticmethod
+    def two_phase_push(targets:list) -> list:
+        """
+        Push a configuration to every agent in two phases, 'PUSH_WORKERS' at a time.
+        targets : list of (node name, command url, payload), or (node name, command url, payload, legacy payload)
+        when agents predating staging must be sent something else.
+
+        Phase 1 POSTs to '<url>/stage' : the agent validates and stages the file without applying it.
+        Phase 2 POSTs to '<url>/commit' on every node, only if every node staged successfully;
+        otherwise the staged nodes get '<url>/abort' and nothing is applied anywhere.
+        Agents answering 404 on '/stage' predate staging : they count as staged once reachable
+        and get the one-shot '<url>' in phase 2, with the legacy payload when there is one.
+        Returns one report per node : stage/commit outcome, timings and error.
+        """
+        reports = [{"node":node,"stage":None,"commit":None,"stage_ms":None,"commit_ms":None,"error":None,"legacy":False}
+                   for node,*_ in targets]
+        if not targets:
+            return reports
+
+        def stage(idx):
+            node,url,payload = targets[idx][:3]
+            report = reports[idx]
+            try:
+                res,report["stage_ms"] = Interface._post(url+"/stage",payload)
+                CONFIG_PUSH.observe(report["stage_ms"]/1000,phase="stage",node=node)
+                if res.status_code == 404:
+                    report["legacy"] = True
+                    report["stage"] = "ok"
+                elif res.ok:
+                    report["stage"] = "ok"
+                else:
+                    report["stage"] = "failed"
+                    report["error"] = "Stage rejected ({}) : {}".format(res.status_code,res.text[:200])
+            except requests.exceptions.RequestException as e:
+                report["stage"] = "failed"
+                report["error"] = "Stage request failed : {}".format(e)
+            if report["stage"] == "failed":
+                CONFIG_PUSH_ERRORS.inc(phase="stage",node=node)
+
+        def finish(idx,commit:bool):
+            node,url,payload,*legacy = targets[idx]
+            report = reports[idx]
+            key = "commit"
+            try:
+                if commit:
+                    if report["legacy"]:
+                        res,report["commit_ms"] = Interface._post(url,legacy[0] if legacy else payload)
+                    else:
+                        res,report["commit_ms"] = Interface._post(url+"/commit",payload)
+                    CONFIG_PUSH.observe(report["commit_ms"]/1000,phase="commit",node=node)
+                    report[key] = "ok" if res.ok else "failed"
+                    if not res.ok:
+                        report["error"] = "Commit rejected ({}) : {}".format(res.status_code,res.text[:200])
+                elif report["stage"] == "ok" and not report["legacy"]:
+                    Interface._post(url+"/abort",payload)
+                    report[key] = "aborted"
+                else:
+                    report[key] = "skipped"
+            except requests.exceptions.RequestException as e:
+                report[key] = "failed" if commit else "skipped"
+                report["error"] = report["error"] or "{} request failed : {}".format("Commit" if commit else "Abort",e)
+            if report[key] == "failed":
+                CONFIG_PUSH_ERRORS.inc(phase="commit",node=node)
+
+        with ThreadPoolExecutor(max_workers=min(len(targets),Interface.PUSH_WORKERS)) as pool:
+            list(pool.map(stage,range(len(targets))))
+            commit = all(report["stage"] == "ok" for report in reports)
+            list(pool.map(lambda idx: finish(idx,commit),range(len(targets))))
+        return reports
+
+    @staticmethod
+    def delta_push(solution:str,targets:list,config:dict,force:bool=False,dry_run:bool=False) -> list:
+        """
+        two_phase_push of only what changed. targets : list of (node name, command url, payload without 'data').
+        Each node is sent the keys whose value differs from the one last committed there (see ConfigFingerprints),
+        with 'delta' set so that the agent merges them into its current file. A merge can't remove a key :
+        a node that ran keys 'config' no longer has gets the whole 'config' without 'delta', replacing its file,
+        as every node does with 'force'. Agents predating staging get the whole 'config'.
+        Nodes already up to date are not contacted : their report says "unchanged".
+        With dry_run, nothing is sent and every report only lists the keys that would be, and the ones removed.
+        """
+        nodes = [node for node,_,_ in targets]
+        plan = fingerprints.plan(solution,nodes,config,force)
+        removed = {node:fingerprints.removed(solution,node,config) for node in nodes}
+        replace = {node:force or bool(removed[node]) for node in nodes}
+        for node in nodes:
+            if replace[node]:
+                plan[node] = dict(config)
+        pushing = [(node,url,{**payload,"data":plan[node],"delta":not replace[node]},{**payload,"data":config})
+                   for node,url,payload in targets if plan[node] or removed[node]]
+        pushed = {} if dry_run else {report["node"]:report for report in Interface.two_phase_push(pushing)}
+        reports = []
+        for node in nodes:
+            report = pushed.get(node) or {"node":node,"stage":None,"commit":None,"stage_ms":None,"commit_ms":None,
+                                          "error":None,"legacy":False}
+            if not plan[node] and not removed[node]:
+                report["stage"] = report["commit"] = "unchanged"
+            elif dry_run:
+                report["stage"] = report["commit"] = "planned"
+            elif report["commit"] == "ok":
+                fingerprints.record(solution,node,config,replace=replace[node] or report["legacy"])
+            report["keys"] = sorted(plan[node])
+            report["removed"] = removed[node]
+            reports.append(report)
+        return reports
+
+    @staticmethod
+    def push_result(reports:list) -> tuple:
+        "Collapse push reports to the (success, error_reports) pair SetConfiguration returns."
+        errors = ["[ERROR] Agent '{}' : {}".format(r["node"],r["error"]) for r in reports if r["error"]]
+        if all(r["commit"] in ("ok","unchanged","planned") for r in reports):
+            return True,0
+        if not errors:
+            errors = ["[ERROR] Configuration was not applied on any node"]
+        return False,errors
+
     @staticmethod
     @abstractmethod
     def RollingRestart():
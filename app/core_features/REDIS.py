@@ -1,118 +1,438 @@
+from collections import Counter
 from collections.abc import MutableMapping
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import json
+import socket
 import time 
 from .INTERFACE import Interface
+from .AGENTCLIENT import agent_client
+from .RESP import RESPError,pipeline,parse_info,parse_replica
+from ..metrics import REDIS_PING,REDIS_PING_ERRORS,RESTART_PHASE,RESTART_FAILURES
+from ..progress import progress,NODE_STARTED,NODE_RESTARTED,WAITING_FOR_GREEN,NODE_DONE,FAILURE,FAILOVER
+from ..topology import parse_address,DEFAULT_PORTS,agent_port
 
 class Redis(Interface):
-    def __init__(self,nodes,auth=None):
+    MAX_WORKERS=32
+    CLUSTER_SLOTS=16384
+    REPLICA_MAX_LAG=1024*1024 #bytes of replication stream a replica may be behind and still count as healthy
+    CONFIG_TIMEOUT=10
+    RESTART_TIMEOUT=300 #seconds for a restarted node to come back and catch up
+    FAILOVER_TIMEOUT=60
+    POLL_INTERVAL=0.2
+    
+    def __init__(self,nodes,auth=None,connect_timeout=2,read_timeout=2):
         self.nodes=nodes
         self.auth = auth
-        self.agents=[]
-        for node in self.nodes: #10.107.11.66:6379
-            agent = node.split(":")
-            self.agents.append((agent[0],int(agent[1])))
-
-    def ClusterHealthCheck(self):
-        import socket
-        success=[]
-        for node in self.agents:
-            with socket.socket(socket.AF_INET,socket.SOCK_STREAM) as sock:
-                try:
-                    sock.connect(node) #tuple type
-                    sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
-                    if self.auth:
-                        sock.sendall(f"auth {self.auth}\r\n".encode())
-                        sock.recv(1024)
-                    sock.sendall(b"ping\r\n")
-                    if sock.recv(1024) == b"+PONG\r\n":
-                        success.append(True)
-                    else:
-                        #print(f"[ERROR] Connection to {node} failed!")
-                        success.append(False)
-                except Exception as e:
-                    #print(f"[ERROR] Connection to {node} failed!")
-                    success.append(False)
-        if all(success):
-            return True
-        else:
-            return False
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.agents=[parse_address(node,DEFAULT_PORTS["Redis"]).endpoint for node in self.nodes] #10.107.11.66:6379
+
+    def _probe(self,node:tuple) -> dict:
+        """
+        AUTH, PING, CLUSTER INFO, INFO replication and INFO server in one round trip, with the node's own connect/read deadlines.
+        Besides up/down, reports cluster_state and slot coverage (None on standalone nodes), the role,
+        and replication : each replica's lag behind a master, or the link status on a replica.
+        """
+        report = Redis._new_report(node)
+        start = time.perf_counter()
+        try:
+            with socket.create_connection(node,timeout=self.connect_timeout) as sock: #tuple type
+                connected = time.perf_counter()
+                report["connect_ms"] = round((connected-start)*1000,2)
+                sock.settimeout(self.read_timeout)
+                sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+                replies = pipeline(sock,Redis._probe_commands(self.auth))
+                report["rtt_ms"] = round((time.perf_counter()-connected)*1000,2)
+            Redis._read_probe(report,replies,self.auth)
+        except RESPError:
+            pass
+        except Exception as e:
+            report["error"] = str(e) or type(e).__name__
+        Redis._record_probe(report,time.perf_counter()-start)
+        return report
+
+    @staticmethod
+    def _new_report(node:tuple) -> dict:
+        return {"node":"{}:{}".format(*node),"status":"down","connect_ms":None,"rtt_ms":None,"error":None,
+                "role":None,"cluster_state":None,"slots_assigned":None,"slots_ok":None,"slots_fail":None,
+                "replicas":[],"master":None,"master_link_status":None,"repl_offset":None,"max_lag_bytes":None,"run_id":None}
+
+    @staticmethod
+    def _probe_commands(auth) -> list:
+        commands = [("PING",),("CLUSTER","INFO"),("INFO","replication"),("INFO","server")]
+        if auth:
+            commands.insert(0,("AUTH",auth))
+        return commands
+
+    @staticmethod
+    def _read_probe(report:dict,replies:list,auth):
+        "Fill 'report' from the replies to _probe_commands. Raises RESPError when the node is not up."
+        if auth and isinstance(replies[0],RESPError):
+            report["error"] = "AUTH failed : {}".format(replies[0])
+            raise replies[0]
+        pong,cluster,replication,server = replies[-4:]
+        if pong != "PONG":
+            report["error"] = str(pong) or "empty reply"
+            raise RESPError(report["error"])
+        report["status"] = "up"
+        if not isinstance(cluster,RESPError): #cluster support disabled otherwise
+            Redis._cluster_fields(report,parse_info(cluster))
+        if not isinstance(replication,RESPError):
+            Redis._replication_fields(report,parse_info(replication))
+        if not isinstance(server,RESPError):
+            report["run_id"] = parse_info(server).get("run_id")
+
+    @staticmethod
+    def _record_probe(report:dict,elapsed:float):
+        REDIS_PING.observe(elapsed,node=report["node"])
+        if report["status"] != "up":
+            REDIS_PING_ERRORS.inc(node=report["node"])
+
+    @staticmethod
+    def _cluster_fields(report:dict,info:dict):
+        report["cluster_state"] = info.get("cluster_state")
+        for field in ("slots_assigned","slots_ok","slots_fail"):
+            if "cluster_"+field in info:
+                report[field] = int(info["cluster_"+field])
+
+    @staticmethod
+    def _replication_fields(report:dict,info:dict):
+        report["role"] = {"slave":"replica"}.get(info.get("role"),info.get("role"))
+        report["master_link_status"] = info.get("master_link_status")
+        if info.get("master_host"):
+            report["master"] = "{}:{}".format(info["master_host"],info.get("master_port"))
+        master_offset = int(info.get("master_repl_offset",0))
+        report["repl_offset"] = int(info.get("slave_repl_offset",master_offset))
+        for key,value in info.items():
+            if key.startswith("slave") and key[5:].isdigit():
+                replica = parse_replica(value)
+                offset = int(replica.get("offset",0))
+                report["replicas"].append({"node":"{}:{}".format(replica.get("ip"),replica.get("port")),
+                                           "state":replica.get("state"),"offset":offset,
+                                           "lag_bytes":max(0,master_offset-offset),"lag_s":int(replica.get("lag",0))})
+        if report["replicas"]:
+            report["max_lag_bytes"] = max(replica["lag_bytes"] for replica in report["replicas"])
+
+    @staticmethod
+    def problems(report:dict) -> list:
+        "What keeps a node that answers from being healthy : uncovered slots, broken replication, lag."
+        if report["status"] != "up":
+            return ["down : {}".format(report["error"])]
+        issues = []
+        if report["cluster_state"] not in (None,"ok"):
+            issues.append("cluster_state is {}".format(report["cluster_state"]))
+        if report["slots_ok"] is not None and report["slots_ok"] < Redis.CLUSTER_SLOTS:
+            issues.append("{} of {} slots covered".format(report["slots_ok"],Redis.CLUSTER_SLOTS))
+        if report["role"] == "replica" and report["master_link_status"] != "up":
+            issues.append("link to master is {}".format(report["master_link_status"]))
+        for replica in report["replicas"]:
+            if replica["state"] != "online" or replica["lag_bytes"] > Redis.REPLICA_MAX_LAG:
+                issues.append("replica {} is {} and {} bytes behind".format(replica["node"],replica["state"],replica["lag_bytes"]))
+        return issues
+
+    def HealthReport(self) -> list:
+        """
+        Probe every node concurrently. 
+        Total time is bounded by the slowest node rather than the sum of them.
+        """
+        if not self.agents:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(self.agents),Redis.MAX_WORKERS)) as pool:
+            reports = list(pool.map(self._probe,self.agents))
+        for report in reports:
+            report["problems"] = Redis.problems(report)
+        return reports
+
+    @staticmethod
+    def cluster_status(reports:list) -> str:
+        "red : no node answers or a node sees the cluster failed. yellow : any other problem. green : none."
+        up = [report for report in reports if report["status"] == "up"]
+        if not up or any(report["cluster_state"] == "fail" for report in up):
+            return "red"
+        if any(report["problems"] for report in reports):
+            return "yellow"
+        return "green"
+
+    def ClusterHealthCheck(self) -> bool:
+        return Redis.cluster_status(self.HealthReport()) == "green"
                     
     @staticmethod
     def token_loader(token):
         serializer = Serializer()
         return serializer.loads(token.encode("utf-8"))
     
-    def RollingRestart(self):
-        for node in self.agents:
-            while True:
-                try :
-                    if self.ClusterHealthCheck():
-                        print("Cluster health green! Continue rolling restart...")
-                        token = Redis.token_generator()
-                        res = requests.post("http://"+node[0]+":5000/redis/command/restart",json={"token":token,"port":node[1]})
-                        if res.status_code==200:
-                            print(f"[SUCCESS] Agent : {node} executed Restart...")
-                            time.sleep(10) 
-                        else:
-                            print(f"[ERROR] Agent : {node} restart failed...")
-                    else:
-                        raise Exception(f"Connection to {node} failed!")
-                except Exception as e:
-                    print(f"[ERROR] {e}")
+    #--------Rolling restart--------
+    @staticmethod
+    def _endpoint(name:str) -> tuple:
+        host,port = name.rsplit(":",1)
+        return host,int(port)
+
+    def _execute(self,node:tuple,*commands) -> list:
+        "Run 'commands' on 'node' in one round trip. Error replies come back as RESPError."
+        if self.auth:
+            commands = (("AUTH",self.auth),)+commands
+        with socket.create_connection(node,timeout=self.connect_timeout) as sock:
+            sock.settimeout(self.read_timeout)
+            replies = pipeline(sock,list(commands))
+        return replies[1:] if self.auth else replies
+
+    def _send_restart(self,node:tuple) -> bool:
+        token = Redis.token_generator()
+        try:
+            res = agent_client.post(f"http://{node[0]}:{agent_port()}/redis/command/restart",json={"token":token,"port":node[1]},
+                                    timeout=(agent_client.connect_timeout,Redis.RESTART_REQUEST_TIMEOUT))
+        except Exception as e:
+            print(f"[ERROR] Restart request to {node} failed : {e}")
+            return False
+        if res.status_code != 200:
+            print(f"[ERROR] Agent : {node} restart failed...")
+            return False
+        print(f"[SUCCESS] Agent : {node} executed Restart...")
+        return True
+
+    def _caught_up(self,name:str,run_id) -> bool:
+        """
+        'name' runs a new process ('run_id' changed), sees the cluster ok and, as a replica, is linked and caught up with its master.
+        The replica's own offset is compared with its master's : the master lists its replicas by the address they
+        announce, which needn't be the inventory name (hostnames, replica-announce-ip, NAT).
+        """
+        report = self._probe(Redis._endpoint(name))
+        if report["status"] != "up" or report["run_id"] == run_id or report["cluster_state"] not in (None,"ok"):
+            return False
+        if report["role"] != "replica":
+            return True
+        if report["master_link_status"] != "up" or not report["master"]:
+            return False
+        master = self._probe(Redis._endpoint(report["master"]))
+        return master["status"] == "up" and master["repl_offset"] - report["repl_offset"] <= Redis.REPLICA_MAX_LAG
+
+    def _wait(self,condition,deadline:float) -> bool:
+        "Poll 'condition' every POLL_INTERVAL until it holds or 'deadline' (monotonic) passes."
+        while True:
+            try:
+                if condition():
+                    return True
+            except Exception as e:
+                print(f"[WARNING] {e}")
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(Redis.POLL_INTERVAL)
+
+    @staticmethod
+    def _failed(phase:str,nodes:list,error:str):
+        print(f"[ERROR] {error}")
+        RESTART_FAILURES.inc(solution="Redis",phase=phase)
+        progress.emit(FAILURE,solution="Redis",phase=phase,nodes=nodes,error=error)
+
+    def _restart_node(self,name:str,role:str=None) -> bool:
+        "Restart one node and wait until it is back and caught up. Timings end up in self.timings."
+        node = Redis._endpoint(name)
+        run_id = self._probe(node)["run_id"]
+        progress.emit(NODE_STARTED,solution="Redis",node=name,role=role)
+        sent = time.monotonic()
+        if not self._send_restart(node):
+            Redis._failed("restart",[name],f"Agent restart failed on {name}")
+            return False
+        restarted = time.monotonic()
+        progress.emit(NODE_RESTARTED,solution="Redis",node=name,role=role)
+        progress.emit(WAITING_FOR_GREEN,solution="Redis",phase="recover",nodes=[name],status="recovering")
+        if not self._wait(lambda: self._caught_up(name,run_id),restarted+Redis.RESTART_TIMEOUT):
+            Redis._failed("recover",[name],f"{name} did not come back and catch up in {Redis.RESTART_TIMEOUT}s")
+            return False
+        back = time.monotonic()
+        RESTART_PHASE.observe(restarted-sent,solution="Redis",phase="restart",node=name)
+        RESTART_PHASE.observe(back-restarted,solution="Redis",phase="recover",node=name)
+        self.timings.append({"node":name,"role":role,"restart_s":round(restarted-sent,2),"recover_s":round(back-restarted,2)})
+        progress.emit(NODE_DONE,solution="Redis",**self.timings[-1])
+        print(f"[SUCCESS] {self.timings[-1]}")
+        return True
+
+    def _failover(self,master:str,replica:str) -> bool:
+        "CLUSTER FAILOVER on 'replica', then wait until it is the master and 'master' its replica."
+        start = time.monotonic()
+        progress.emit(FAILOVER,solution="Redis",master=master,replica=replica)
+        reply = self._execute(Redis._endpoint(replica),("CLUSTER","FAILOVER"))[0]
+        if isinstance(reply,RESPError):
+            Redis._failed("failover",[master,replica],f"CLUSTER FAILOVER on {replica} failed : {reply}")
+            return False
+        def promoted():
+            return self._probe(Redis._endpoint(replica))["role"] == "master" and self._probe(Redis._endpoint(master))["role"] == "replica"
+        if not self._wait(promoted,start+Redis.FAILOVER_TIMEOUT):
+            Redis._failed("failover",[master,replica],f"{replica} did not take over from {master} in {Redis.FAILOVER_TIMEOUT}s")
+            return False
+        RESTART_PHASE.observe(time.monotonic()-start,solution="Redis",phase="failover",node=master)
+        print(f"[SUCCESS] {replica} took over from {master}")
+        return True
+
+    def _green_before(self,name:str):
+        "ClusterHealthCheck for _wait, emitting waiting_for_green whenever the status changes."
+        last = []
+        def green() -> bool:
+            status = Redis.cluster_status(self.HealthReport())
+            if last[-1:] != [status]:
+                last.append(status)
+                progress.emit(WAITING_FOR_GREEN,solution="Redis",phase="pre_green",nodes=[name],status=status)
+            return status == "green"
+        return green
+
+    @staticmethod
+    def replication_plan(reports:list) -> tuple:
+        """
+        (waves, masters) for a replica-first restart of the nodes in 'reports'.
+        Wave i holds the i-th replica of every master, so no shard loses two replicas at once.
+        masters is a list of (master, failover target) : its most up to date online replica, or None.
+        """
+        by_master = {}
+        masters = []
+        for report in reports:
+            if report["role"] == "replica":
+                by_master.setdefault(report["master"],[]).append(report["node"])
+            else:
+                online = [r for r in report["replicas"] if r["state"] == "online"]
+                target = min(online,key=lambda r: r["lag_bytes"])["node"] if online else None
+                masters.append((report["node"],target))
+        waves = []
+        for replicas in by_master.values():
+            for idx,name in enumerate(replicas):
+                if idx == len(waves):
+                    waves.append([])
+                waves[idx].append(name)
+        return waves,masters
+
+    def RollingRestart(self,replica_first:bool=False) -> bool:
+        """
+        Restart the nodes in list order, or with 'replica_first' : all replicas first, one wave at a time
+        (in parallel across shards), then each master after handing its role to a replica with CLUSTER FAILOVER.
+        A node counts as back once it runs a new process and, if it is a replica, has caught up with its master.
+        Per-node timings end up in self.timings.
+        """
+        self.timings = []
+        self.waves = []
+        reports = self.HealthReport()
+        if Redis.cluster_status(reports) != "green":
+            Redis._failed("pre_check",[r["node"] for r in reports if r["problems"]],
+                          "Cluster is not healthy, rolling restart is not started : {}".format(
+                              {r["node"]:r["problems"] for r in reports if r["problems"]}))
+            return False
+        if not replica_first:
+            for name in [report["node"] for report in reports]:
+                #Replicas of a restarted master resync before the next node goes down
+                if not self._wait(self._green_before(name),time.monotonic()+Redis.RESTART_TIMEOUT):
+                    Redis._failed("recover",[name],"Cluster did not get healthy again before restarting {}".format(name))
+                    return False
+                if not self._restart_node(name):
                     return False
-                else:
-                    cnt =0
-                    MAXTRIAL = 5
-                    while not self.ClusterHealthCheck() and cnt <MAXTRIAL:
-                        print("Cluster health not green! give it a little sec")
-                        time.sleep(5)
-                        cnt+=1
-                        print(f"Tried {cnt} times...")
-                        print(f"The most recent execution was on {node}")
-                        continue
-                    if not cnt<MAXTRIAL:
-                        return False
-                    else:
-                        break  
+                self.waves.append([name])
+            return True
+
+        waves,masters = Redis.replication_plan(reports)
+        for wave in waves:
+            with ThreadPoolExecutor(max_workers=min(len(wave),Redis.MAX_WORKERS)) as pool:
+                if not all(pool.map(progress.bound(lambda name: self._restart_node(name,"replica")),wave)):
+                    return False
+            self.waves.append(wave)
+        for master,target in masters:
+            if target is None:
+                print(f"[WARNING] {master} has no online replica, it is restarted without failover")
+            elif not self._failover(master,target):
+                return False
+            if not self._restart_node(master,"master"):
+                return False
+            self.waves.append([master])
         return True
                     
+    def _get_config(self,node:tuple) -> dict:
+        token = Redis.token_generator()
+        res = agent_client.post(f"http://{node[0]}:{agent_port()}/redis/command/get_config",json={"token":token,"port":node[1]},
+                                timeout=(self.connect_timeout,Redis.CONFIG_TIMEOUT),idempotent=True)
+        res.raise_for_status()
+        #You will get the json form of data
+        return res.json()
+
+    @staticmethod
+    def normalize_config(config:dict) -> dict:
+        """
+        Same settings written differently (key case, padding, number vs string) normalize to the same dict.
+        Only used to compare and hash : what is shown and pushed back are the values as the nodes sent them.
+        """
+        def value(v):
+            if isinstance(v,(list,tuple)):
+                return [value(x) for x in v]
+            if isinstance(v,dict):
+                return Redis.normalize_config(v)
+            return v if v is None else str(v).strip()
+        return {Redis.normalize_key(k):value(v) for k,v in config.items()}
+
+    @staticmethod
+    def normalize_key(key) -> str:
+        return str(key).strip().lower()
+
+    def ConfigurationReport(self) -> dict:
+        """
+        Fetch get_config from every node in parallel and merge them.
+        Nodes with identical normalized configs are grouped by hash, so each distinct config is compared once.
+        'config' holds, for every key, the value most nodes have (ties go to the largest group);
+        'drift' lists the keys whose value differs between nodes as key -> {node: value}.
+        Values are the ones the nodes sent, normalization is only used to compare them.
+        """
+        names = ["{}:{}".format(*node) for node in self.agents]
+        configs,errors = {},{}
+        with ThreadPoolExecutor(max_workers=max(1,min(len(self.agents),Redis.MAX_WORKERS))) as pool:
+            futures = {name:pool.submit(self._get_config,node) for name,node in zip(names,self.agents)}
+        for name,future in futures.items():
+            try:
+                configs[name] = future.result()
+            except Exception as e:
+                errors[name] = str(e)
+
+        groups = {}
+        for name,config in configs.items():
+            normalized = Redis.normalize_config(config)
+            groups.setdefault(Redis.config_hash(normalized),{"config":normalized,"nodes":[]})["nodes"].append(name)
+        ordered = sorted(groups.items(),key=lambda item: -len(item[1]["nodes"])) #majority first
+        nodes = [node for _,group in ordered for node in group["nodes"]]
+        #normalized key -> (key, value) as each node sent it
+        original = {node:{Redis.normalize_key(k):(k,v) for k,v in configs[node].items()} for node in nodes}
+
+        merged,drift = {},{}
+        for key in dict.fromkeys(key for _,group in ordered for key in group["config"]):
+            votes = Counter() #normalized value -> nodes having it, first seen in the largest group
+            seen = {}
+            for _,group in ordered:
+                if key in group["config"]:
+                    normalized = json.dumps(group["config"][key],sort_keys=True)
+                    votes[normalized] += len(group["nodes"])
+                    seen.setdefault(normalized,group["nodes"][0])
+            name,value = original[seen[votes.most_common(1)[0][0]]][key]
+            merged[name] = value
+            if len(votes) > 1 or sum(votes.values()) < len(nodes):
+                drift[name] = {node:original[node].get(key,(None,None))[1] for node in nodes}
+        return {
+            "config":merged,
+            "drift":drift,
+            "groups":[{"hash":digest,"nodes":group["nodes"]} for digest,group in ordered],
+            "errors":errors,
+        }
+
     @property
     def Configuration(self):
-        #Fetch current data from the first server. 
-        file:dict
-        error:Exception 
-        for node in self.agents:
-            try: 
-                token = Redis.token_generator()
-                print(node)
-                res = requests.post("http://"+node[0]+":5000/redis/command/get_config",json={"token":token,"port":node[1]})
-                #You will get the json form of data
-                file = res.json()
-                return file
-            except Exception as e:
-                error=e
-        return error
-        #process it
+        "Merged configuration of every node (see ConfigurationReport), or the error when no node answered."
+        report = self.ConfigurationReport()
+        if not report["groups"]:
+            return Exception("No agent returned its configuration : {}".format(report["errors"]))
+        return report["config"]
         
         
-    def SetConfiguration(self,dic:MutableMapping) -> bool:
+    def SetConfiguration(self,dic:MutableMapping,force:bool=False,dry_run:bool=False) -> bool:
+        """
+        Two-phase push to every agent in parallel of the keys each node doesn't run yet (see Interface.delta_push).
+        Per-node reports end up in self.push_reports. With dry_run, they are the plan and nothing is sent.
+        """
         token = Redis.token_generator()
-        error_reports=[]
-        for node in self.agents:
-            try:
-                res = requests.post("http://"+node[0]+":5000/redis/command/set_config",json={"token":token,"data":dic,"port":node[1]})
-                if res.status_code == 200:
-                    message =f"[SUCCESS] Agent '{node}' Set Config file..."
-                    print(message)
-                else:
-                    message = f"[ERROR] Sent a post request but agent '{node}' failed to set config file"
-                    error_reports.append(message)
-            except Exception as e:
-                message =f"[Error] Post request to '{node}' failed !"
-                print(message)
-                error_reports.append(message)
-        if not error_reports:
-            return True,0
-        else:
-            return False,error_reports
\ No newline at end of file
+        targets = [("{}:{}".format(*node),f"http://{node[0]}:{agent_port()}/redis/command/set_config",{"token":token,"port":node[1]})
+                   for node in self.agents]
+        self.push_reports = Redis.delta_push("Redis",targets,dict(dic),force,dry_run)
+        for report in self.push_reports:
+            print(f"[{report['commit']}] Agent '{report['node']}' config push : {report}")
+        return Redis.push_result(self.push_reports)
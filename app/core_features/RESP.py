@@ -0,0 +1,127 @@
+######################################################################
+# Minimal RESP (REdis Serialization Protocol) client side :
+# command encoding, a buffered reply reader, and pipelining of several
+# commands in one round trip, over a socket or asyncio streams.
+#
+######################################################################
+
+import asyncio
+import socket
+
+
+class RESPError(Exception):
+    "An error reply (-ERR ..., -NOAUTH ...). Returned in place of the reply, not raised, by read()."
+
+
+class RESPProtocolError(Exception):
+    "The bytes on the wire are not RESP, or the connection closed mid-reply."
+
+
+def encode_command(*args) -> bytes:
+    "*<n>\\r\\n$<len>\\r\\n<arg>\\r\\n... : binary safe, unlike inline commands."
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg,bytes):
+            arg = str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(arg),arg))
+    return b"".join(out)
+
+
+class RESPReader:
+    "Reads replies from a connected socket. Simple strings and bulk strings come back as str, arrays as lists."
+    def __init__(self,sock:socket.socket,bufsize:int=65536):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.buffer = b""
+
+    def _fill(self):
+        chunk = self.sock.recv(self.bufsize)
+        if not chunk:
+            raise RESPProtocolError("Connection closed by the server")
+        self.buffer += chunk
+
+    def _line(self) -> bytes:
+        while True:
+            idx = self.buffer.find(b"\r\n")
+            if idx >= 0:
+                line,self.buffer = self.buffer[:idx],self.buffer[idx+2:]
+                return line
+            self._fill()
+
+    def _exactly(self,length:int) -> bytes:
+        while len(self.buffer) < length+2:
+            self._fill()
+        data,self.buffer = self.buffer[:length],self.buffer[length+2:]
+        return data
+
+    def read(self):
+        line = self._line()
+        if not line:
+            raise RESPProtocolError("Empty reply line")
+        kind,rest = line[:1],line[1:]
+        if kind == b"+":
+            return rest.decode(errors="replace")
+        if kind == b"-":
+            return RESPError(rest.decode(errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            return None if length < 0 else self._exactly(length).decode(errors="replace")
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self.read() for _ in range(length)]
+        raise RESPProtocolError("Unexpected reply : {!r}".format(line[:80]))
+
+
+def pipeline(sock:socket.socket,commands:list) -> list:
+    "Send every command in one write, then read one reply per command, in order."
+    sock.sendall(b"".join(encode_command(*command) for command in commands))
+    reader = RESPReader(sock)
+    return [reader.read() for _ in commands]
+
+
+async def read_reply(reader:asyncio.StreamReader):
+    "RESPReader.read() for asyncio streams."
+    try:
+        line = (await reader.readuntil(b"\r\n"))[:-2]
+        if not line:
+            raise RESPProtocolError("Empty reply line")
+        kind,rest = line[:1],line[1:]
+        if kind == b"+":
+            return rest.decode(errors="replace")
+        if kind == b"-":
+            return RESPError(rest.decode(errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            return None if length < 0 else (await reader.readexactly(length+2))[:-2].decode(errors="replace")
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [await read_reply(reader) for _ in range(length)]
+    except asyncio.IncompleteReadError:
+        raise RESPProtocolError("Connection closed by the server")
+    raise RESPProtocolError("Unexpected reply : {!r}".format(line[:80]))
+
+
+async def pipeline_async(reader:asyncio.StreamReader,writer:asyncio.StreamWriter,commands:list) -> list:
+    "pipeline() for asyncio streams."
+    writer.write(b"".join(encode_command(*command) for command in commands))
+    await writer.drain()
+    return [await read_reply(reader) for _ in commands]
+
+
+def parse_info(text:str) -> dict:
+    "INFO / CLUSTER INFO body -> {field: value}; '# Section' lines are skipped."
+    fields = {}
+    for line in (text or "").splitlines():
+        if line and not line.startswith("#") and ":" in line:
+            key,value = line.split(":",1)
+            fields[key.strip()] = value.strip()
+    return fields
+
+
+def parse_replica(value:str) -> dict:
+    "'ip=10.0.0.2,port=6379,state=online,offset=123,lag=0' -> dict"
+    return dict(pair.split("=",1) for pair in value.split(",") if "=" in pair)
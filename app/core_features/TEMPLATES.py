@@ -0,0 +1,120 @@
+######################################################################
+# Configuration templates of every solution, under app/solutions/.
+# Each <solution>/<name><major>.yml is parsed and flattened once, then
+# served read-only from memory. A file is parsed again only when its
+# mtime changes.
+#
+######################################################################
+
+from collections import namedtuple
+from collections.abc import Mapping
+from types import MappingProxyType
+import os
+import re
+import threading
+import time
+import yaml
+
+
+#libyaml when the wheel was built with it, the pure Python parser otherwise
+Loader = getattr(yaml,"CSafeLoader",yaml.SafeLoader)
+
+ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)),"solutions")
+FILENAME = re.compile(r"^\D+?(\d+)\.ya?ml$") #elasticsearch7.yml -> 7
+
+Template = namedtuple("Template",["path","mtime","data"])
+
+
+def flatten(d:Mapping,parent_key:str="",sep:str=".") -> dict:
+    """
+    {'a':{'b':1}} -> {'a.b':1}, with an explicit stack instead of recursion.
+    Keys come out in the order of the file, nested ones in place, as the configuration form shows them.
+    """
+    flat = {}
+    stack = [(parent_key,iter(d.items()))]
+    while stack:
+        prefix,items = stack[-1]
+        for k,v in items:
+            key = prefix + sep + str(k) if prefix else str(k)
+            if isinstance(v,Mapping):
+                stack.append((key,iter(v.items()))) #its keys first, then the rest of this mapping
+                break
+            flat[key] = v
+        else:
+            stack.pop()
+    return flat
+
+
+def _freeze(value):
+    return tuple(_freeze(v) for v in value) if isinstance(value,list) else value
+
+
+class ConfigTemplates:
+    """
+    (solution, major version) -> read-only flattened template.
+    load() parses every file; get() is a dictionary lookup, and at most every 'check_interval'
+    seconds also compares the file's mtime with the one it was parsed at.
+    """
+    def __init__(self,root:str=ROOT,app=None):
+        self.root = root
+        self.check_interval = 5
+        self._templates = {}
+        self._checked = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self,app):
+        self.check_interval = app.config.get("CONFIG_TEMPLATE_CHECK_INTERVAL",5)
+        self.load()
+        app.extensions["config_templates"] = self
+
+    @staticmethod
+    def _parse(path:str) -> Template:
+        mtime = os.stat(path).st_mtime_ns
+        with open(path,encoding="UTF8") as f:
+            data = flatten(yaml.load(f,Loader=Loader) or {})
+        return Template(path,mtime,MappingProxyType({k:_freeze(v) for k,v in data.items()}))
+
+    def load(self):
+        "Parse every template under root, replacing the whole cache at once."
+        templates = {}
+        for dirpath,_,filenames in os.walk(self.root):
+            for filename in filenames:
+                match = FILENAME.match(filename)
+                if match:
+                    solution = os.path.relpath(dirpath,self.root)
+                    templates[(solution,int(match.group(1)))] = self._parse(os.path.join(dirpath,filename))
+        with self._lock:
+            self._templates = templates
+            self._checked = time.monotonic()
+
+    def _revalidate(self):
+        for key,template in list(self._templates.items()):
+            try:
+                changed = os.stat(template.path).st_mtime_ns != template.mtime
+            except OSError: #removed, keep serving what was parsed
+                continue
+            if changed:
+                fresh = self._parse(template.path)
+                with self._lock:
+                    self._templates = {**self._templates,key:fresh}
+
+    def get(self,solution:str,major) -> Mapping:
+        "Raises LookupError when there is no template for that version."
+        if not self._templates:
+            self.load()
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            self._revalidate()
+        template = self._templates.get((solution,int(major)))
+        if template is None:
+            raise LookupError(f"No {solution} configuration template for version {major}")
+        return template.data
+
+    def versions(self,solution:str) -> list:
+        return sorted(major for name,major in self._templates if name == solution)
+
+
+config_templates = ConfigTemplates()
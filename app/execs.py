@@ -5,6 +5,7 @@
 ######################################################################
 
 from abc import ABC,abstractmethod
+import threading
 
 class IExecutableBuilder(ABC):
     "The Executable Builder interface"
@@ -52,6 +53,8 @@ class ElasticDirector:
             .set_executable("FileTransfer")\
             .set_executable("ClusterHealthCheck")\
             .set_executable("Configuration")\
+            .set_executable("BatchedRollingRestart")\
+            .set_executable("LiveConfiguration")\
             .get_result()
 
 class RedisDirector:
@@ -62,7 +65,75 @@ class RedisDirector:
         return ExecutableBuilder()\
             .set_solution_type("Redis")\
             .set_executable("RollingRestart")\
+            .set_executable("ReplicaFirstRollingRestart")\
             .set_executable("FileTransfer")\
             .set_executable("Ping")\
             .set_executable("Configuration")\
             .get_result()
+
+
+class ExecutionCatalog:
+    """
+    Solution plugin registry.
+    A solution registers its director (what it can execute), a client factory and one handler per executable.
+    Execution ids are read from the executions table once and kept as id -> (solution, name),
+    so dispatching a request costs a dictionary lookup instead of a query per executable.
+    """
+    def __init__(self):
+        self.directors = {} #solution -> director
+        self.clients = {} #solution -> factory(nodes, cluster)
+        self.handlers = {} #(solution, executable) -> handler(client, req)
+        self._by_id = None
+        self._lock = threading.Lock()
+
+    def register(self,director,client=None) -> str:
+        "Register a solution by its director. Returns the solution name."
+        solution = director.construct()["solution"]
+        self.directors[solution] = director
+        if client is not None:
+            self.clients[solution] = client
+        self.invalidate()
+        return solution
+
+    def handler(self,solution:str,executable:str):
+        "Decorator registering 'handler(client, req)' for one executable of a solution."
+        def decorator(f):
+            self.handlers[(solution,executable)] = f
+            return f
+        return decorator
+
+    def products(self) -> list:
+        return [director.construct() for director in self.directors.values()]
+
+    def load(self) -> dict:
+        from .models import Execution
+        by_id = {exe.id:(exe.solution,exe.name) for exe in Execution.query.all()}
+        with self._lock:
+            self._by_id = by_id
+        return by_id
+
+    def invalidate(self):
+        with self._lock:
+            self._by_id = None
+
+    def lookup(self,exec_id:int):
+        "(solution, executable) of an execution id, or None. An unknown id triggers one reload."
+        by_id = self._by_id
+        if by_id is None or exec_id not in by_id:
+            by_id = self.load()
+        return by_id.get(exec_id)
+
+    def dispatch(self,exec_id:int,solution:str=None):
+        """
+        Return (handler, client factory, executable) for an execution id.
+        Raises KeyError when the id is unknown, belongs to another solution or has no handler.
+        """
+        found = self.lookup(exec_id)
+        if found is None or (solution is not None and found[0] != solution):
+            raise KeyError(exec_id)
+        return self.handlers[found],self.clients[found[0]],found[1]
+
+
+catalog = ExecutionCatalog()
+catalog.register(RedisDirector)
+catalog.register(ElasticDirector)
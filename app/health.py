@@ -0,0 +1,216 @@
+######################################################################
+# Background health poller.
+# Probes every cluster of the topology and every agent on an interval
+# and keeps the latest timestamped snapshot of each in memory, so views
+# answer from memory instead of probing on every request.
+#
+######################################################################
+
+from concurrent.futures import Future,ThreadPoolExecutor
+from datetime import datetime
+import atexit
+import random
+import threading
+import time
+
+
+def wants_fresh(req:dict=None) -> bool:
+    "'?fresh=1' on the URL, or \"fresh\": true in the JSON body, asks for a probe instead of the snapshot."
+    from flask import request
+    return request.args.get("fresh") in ("1","true") or bool((req or {}).get("fresh"))
+
+
+class HealthPoller:
+    """
+    Every HEALTH_POLL_INTERVAL seconds (+/- HEALTH_POLL_JITTER of it), probe all clusters,
+    at most HEALTH_POLL_WORKERS at a time, and scan all agents.
+    The thread starts on first use. A probe that is already running for a cluster is
+    shared by everyone asking for it, so concurrent fresh requests don't pile up.
+    Probes are registered per solution : probe(nodes, cluster) -> {"status", "nodes"}.
+    A snapshot older than HEALTH_MAX_AGE (3 intervals by default), e.g. because the poller is disabled
+    or stuck, is probed again when read, and listed as "stale" by snapshots().
+    """
+    def __init__(self,app=None):
+        self.interval = 30
+        self.jitter = 0.2
+        self.workers = 8
+        self.enabled = True
+        self.max_age = 90
+        self.rounds = 0
+        self._probes = {} #solution -> probe function
+        self._clusters = {} #cluster -> snapshot
+        self._agents = {} #agent url -> report, with "checked_at"
+        self._checked = {} #("cluster", name) or ("agent", url) -> monotonic time of the probe
+        self._running = {} #cluster -> Future of the probe in progress
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._atexit = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self,app):
+        self.interval = app.config.get("HEALTH_POLL_INTERVAL",30)
+        self.jitter = app.config.get("HEALTH_POLL_JITTER",0.2)
+        self.workers = app.config.get("HEALTH_POLL_WORKERS",8)
+        self.enabled = app.config.get("HEALTH_POLL_ENABLED",True)
+        self.max_age = app.config.get("HEALTH_MAX_AGE") or 3*self.interval
+        if not self._atexit:
+            atexit.register(self.shutdown)
+            self._atexit = True
+        with self._lock:
+            self._clusters.clear()
+            self._agents.clear()
+            self._checked.clear()
+        app.extensions["health"] = self
+
+    def probe(self,solution:str):
+        "Decorator registering the health probe of 'solution'."
+        def decorator(func):
+            self._probes[solution] = func
+            return func
+        return decorator
+
+    #--------Snapshots--------
+    def cluster(self,name:str,fresh:bool=False) -> dict:
+        "Latest snapshot of cluster 'name', probed now when there is none yet, it is too old or 'fresh' is set. None for unknown clusters."
+        self._start()
+        if not fresh:
+            with self._lock:
+                snapshot = self._clusters.get(name)
+                stale = self._stale(("cluster",name),time.monotonic())
+            if snapshot is not None and not stale:
+                return snapshot
+        return self._probe_cluster(name)
+
+    def agents(self,nodes:list,fresh:bool=False) -> list:
+        "Latest report of each agent in 'nodes', in order. Agents without a recent one (or all of them, with 'fresh') are scanned now."
+        self._start()
+        nodes = list(dict.fromkeys(nodes))
+        now = time.monotonic()
+        with self._lock:
+            known = {} if fresh else {node:self._agents[node] for node in nodes
+                                      if node in self._agents and not self._stale(("agent",node),now)}
+        missing = [node for node in nodes if node not in known]
+        if missing:
+            known.update(self._store_agents(HealthPoller._scan(missing)))
+        return [known[node] for node in nodes]
+
+    def forget_agent(self,node:str):
+        "Drop the report of an agent that was just changed, so the next look probes it."
+        with self._lock:
+            self._agents.pop(node,None)
+            self._checked.pop(("agent",node),None)
+
+    def snapshots(self) -> dict:
+        "Every snapshot, each with its age in seconds and whether it is older than max_age."
+        self._start()
+        now = time.monotonic()
+        with self._lock:
+            def aged(kind:str,snapshots:dict) -> dict:
+                return {key:dict(snapshot,age_s=round(now-self._checked.get((kind,key),now),1),stale=self._stale((kind,key),now))
+                        for key,snapshot in snapshots.items()}
+            return {"clusters":aged("cluster",self._clusters),"agents":aged("agent",self._agents),"rounds":self.rounds}
+
+    def _stale(self,key:tuple,now:float) -> bool:
+        "Called with the lock held."
+        checked = self._checked.get(key)
+        return checked is None or now - checked > self.max_age
+
+    #--------Probing--------
+    @staticmethod
+    def _now() -> str:
+        return datetime.utcnow().isoformat(timespec="seconds")+"Z"
+
+    def _probe_cluster(self,name:str) -> dict:
+        from .topology import topology
+        with self._lock:
+            future = self._running.get(name)
+            owner = future is None
+            if owner:
+                future = self._running[name] = Future()
+        if not owner:
+            return future.result()
+        try:
+            solution = topology.get().solution_of(name)
+            snapshot = None
+            if solution is not None:
+                snapshot = {"cluster":name,"solution":solution,"status":None,"nodes":[],"error":None,
+                            "checked_at":HealthPoller._now(),"duration_ms":None}
+                start = time.perf_counter()
+                try:
+                    probe = self._probes[solution]
+                    snapshot.update(probe([node.address for node in topology.get().nodes(name)],name))
+                except Exception as e:
+                    snapshot["status"] = "unknown"
+                    snapshot["error"] = str(e) or type(e).__name__
+                snapshot["duration_ms"] = round((time.perf_counter()-start)*1000,2)
+                with self._lock:
+                    self._clusters[name] = snapshot
+                    self._checked[("cluster",name)] = time.monotonic()
+            future.set_result(snapshot)
+            return snapshot
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._running.pop(name,None)
+
+    @staticmethod
+    def _scan(nodes:list) -> list:
+        "Agent.scan on the asyncio bridge : one task per agent instead of one thread."
+        from .core_features.AIO import bridge
+        return bridge.run(bridge.agents().scan(nodes),timeout=bridge.run_timeout)
+
+    def _store_agents(self,reports:list) -> dict:
+        now = HealthPoller._now()
+        reports = {report["node"]:dict(report,checked_at=now) for report in reports}
+        checked = time.monotonic()
+        with self._lock:
+            self._agents.update(reports)
+            self._checked.update({("agent",node):checked for node in reports})
+        return reports
+
+    def poll_once(self):
+        "Probe every cluster and agent of the current topology. Snapshots of removed ones are dropped."
+        from .topology import topology
+        current = topology.get()
+        clusters = list(current.clusters)
+        if clusters:
+            with ThreadPoolExecutor(max_workers=min(len(clusters),self.workers)) as pool:
+                list(pool.map(self._probe_cluster,clusters))
+        agents = self._store_agents(HealthPoller._scan(list(current.agents)))
+        with self._lock:
+            for name in set(self._clusters) - set(clusters):
+                del self._clusters[name]
+                self._checked.pop(("cluster",name),None)
+            for node in set(self._agents) - set(agents):
+                del self._agents[node]
+                self._checked.pop(("agent",node),None)
+            self.rounds += 1
+
+    #--------Background thread--------
+    def _start(self):
+        if not self.enabled:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run,name="health-poller",daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                print("[ERROR] Health poll failed : {}".format(e))
+            #Jitter keeps several master processes from probing the clusters in lockstep
+            if self._stop.wait(self.interval*(1+random.uniform(-self.jitter,self.jitter))):
+                break
+
+    def shutdown(self):
+        self._stop.set()
+
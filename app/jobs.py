@@ -0,0 +1,150 @@
+######################################################################
+# Background jobs for long-running executions (e.g. rolling restarts)
+# so that they don't hold a request worker for their whole duration.
+#
+######################################################################
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+import traceback
+import uuid
+from .progress import progress,JOB_STARTED,JOB_FINISHED
+
+
+class Job:
+    PENDING="pending"
+    RUNNING="running"
+    SUCCEEDED="succeeded"
+    FAILED="failed"
+
+    def __init__(self,name:str,key=None,**meta):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.key = key
+        self.meta = meta
+        self.status = Job.PENDING
+        self.result = None
+        self.error = None
+        self.submitted_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self,timeout=None) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self,with_result=False) -> dict:
+        dic = {
+            "id":self.id,
+            "name":self.name,
+            "status":self.status,
+            "submitted_at":self.submitted_at,
+            "started_at":self.started_at,
+            "finished_at":self.finished_at,
+            "error":self.error,
+        }
+        dic.update(self.meta)
+        if with_result:
+            dic["result"] = self.result
+        return dic
+
+    def __repr__(self):
+        return "<Job %r %r>" % (self.name,self.status)
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded worker pool and keeps the most recent ones for status lookups.
+    Jobs submitted with the same 'key' (e.g. a cluster name) while one is still active
+    are not started twice; the active job is returned instead.
+    """
+    def __init__(self,app=None):
+        self.app = None
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+        self.max_jobs = 1000
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self,app):
+        self.app = app
+        self.max_jobs = app.config.get("JOB_HISTORY",1000)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=app.config.get("JOB_WORKERS",4),thread_name_prefix="job")
+        app.extensions["jobs"] = self
+
+    def submit(self,name:str,fn,*args,key=None,on_done=None,**meta) -> Job:
+        """
+        Schedule fn(*args). 'on_done(job)' is called in an application context once it finishes,
+        which is where the caller records its Operation row.
+        """
+        with self._lock:
+            if key is not None and key in self._active:
+                return self._active[key]
+            job = Job(name,key=key,**meta)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active[key] = job
+            self._evict()
+        progress.open(job.id) #so that the events can be subscribed to before the job starts
+        self._executor.submit(self._run,job,fn,args,on_done)
+        return job
+
+    def get(self,job_id:str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _evict(self):
+        "Drop the oldest finished jobs past 'max_jobs'."
+        overflow = len(self._jobs) - self.max_jobs
+        for job_id in [job_id for job_id,job in self._jobs.items() if job.done][:max(overflow,0)]:
+            del self._jobs[job_id]
+
+    def _run(self,job:Job,fn,args,on_done):
+        job.status = Job.RUNNING
+        job.started_at = datetime.utcnow()
+        progress.bind(job.id)
+        progress.emit(JOB_STARTED,job=job.id,name=job.name,**job.meta)
+        try:
+            with self.app.app_context():
+                try:
+                    job.result = fn(*args)
+                    job.status = Job.SUCCEEDED
+                except Exception as e:
+                    job.status = Job.FAILED
+                    job.error = str(e)
+                    traceback.print_exc()
+                    return
+                #The execution itself succeeded : a failure to record it doesn't change that
+                if on_done is not None:
+                    try:
+                        on_done(job)
+                    except Exception as e:
+                        job.error = "Recording the result failed : {}".format(e)
+                        traceback.print_exc()
+        finally:
+            job.finished_at = datetime.utcnow()
+            with self._lock:
+                if job.key is not None and self._active.get(job.key) is job:
+                    del self._active[job.key]
+            progress.emit(JOB_FINISHED,job=job.id,status=job.status,result=job.result,error=job.error)
+            progress.bind(None)
+            progress.close(job.id)
+            job._done.set()
+
+    def shutdown(self,wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
@@ -0,0 +1,98 @@
+######################################################################
+# Write-behind tracking of User.last_seen.
+# Requests only touch memory; a background flusher writes every
+# pending timestamp in one bulk UPDATE.
+#
+######################################################################
+
+from datetime import datetime,timedelta
+import atexit
+import threading
+
+
+class LastSeenTracker:
+    """
+    touch() records "user seen now" in memory, and ignores it when the same user was already
+    recorded less than LAST_SEEN_WINDOW seconds ago. Pending timestamps are flushed every
+    LAST_SEEN_FLUSH_INTERVAL seconds, and once more when the process exits.
+    """
+    def __init__(self,app=None):
+        self.app = None
+        self.window = timedelta(seconds=60)
+        self.interval = 30
+        self._seen = {} #user id -> last recorded timestamp
+        self._pending = {} #user id -> timestamp not written yet
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.flushes = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self,app):
+        if self.app is None:
+            atexit.register(self.shutdown)
+        self.app = app
+        self.window = timedelta(seconds=app.config.get("LAST_SEEN_WINDOW",60))
+        self.interval = app.config.get("LAST_SEEN_FLUSH_INTERVAL",30)
+        with self._lock:
+            self._seen.clear()
+            self._pending.clear()
+        app.extensions["last_seen"] = self
+
+    def touch(self,user_id:int,now:datetime=None) -> bool:
+        "Returns True when the timestamp was recorded, False when it fell within the window."
+        now = now or datetime.utcnow()
+        with self._lock:
+            last = self._seen.get(user_id)
+            if last is not None and now - last < self.window:
+                return False
+            self._seen[user_id] = now
+            self._pending[user_id] = now
+        self._start()
+        return True
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run,name="last-seen-flusher",daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print("[ERROR] Flushing last_seen failed : {}".format(e))
+
+    def flush(self) -> int:
+        "Write every pending timestamp in one UPDATE. Returns the number of users written."
+        with self._lock:
+            pending,self._pending = self._pending,{}
+        if not pending or self.app is None:
+            return 0
+        from . import db
+        from .models import User
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    User.__table__.update().where(User.__table__.c.id == db.bindparam("uid")).values(last_seen=db.bindparam("seen")),
+                    [{"uid":user_id,"seen":seen} for user_id,seen in pending.items()])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self._lock: #keep them for the next round unless newer ones came in
+                    for user_id,seen in pending.items():
+                        self._pending.setdefault(user_id,seen)
+                raise
+        self.flushes += 1
+        return len(pending)
+
+    def shutdown(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print("[ERROR] Final last_seen flush failed : {}".format(e))
@@ -9,4 +9,4 @@ def inject_permissions():
     return dict(Permission=Permission)
 
 
-from . import views,errors
\ No newline at end of file
+from . import views,errors,executions
\ No newline at end of file
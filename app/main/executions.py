@@ -0,0 +1,140 @@
+######################################################################
+# Handlers for the executables of each solution.
+# op_call_exec looks the execution id up in the catalog and calls the
+# handler registered here with the solution client and the request.
+#
+######################################################################
+
+from flask import flash,jsonify
+from flask_login import current_user
+from .. import db,jobs,health
+from ..health import wants_fresh
+from ..execs import catalog,ElasticDirector,RedisDirector
+from ..models import Operation
+from ..topology import Topology
+from app.core_features.ES import Es
+from app.core_features.REDIS import Redis
+from app.core_features.AIO import bridge
+
+
+ELASTIC = catalog.register(ElasticDirector,client=lambda nodes,cluster: Es(nodes,Topology.auth(cluster)))
+REDIS = catalog.register(RedisDirector,client=lambda nodes,cluster: Redis(nodes,Topology.auth(cluster)))
+
+
+def _record_operation(exec_id,user_id,cluster):
+    "Job callback : record the Operation once the execution has succeeded."
+    def on_done(job):
+        if job.result:
+            #You can just put exec_id as its value is coerced into integer in the model.
+            op = Operation(exec_id=exec_id,user_id=user_id,cluster=cluster)
+            db.session.add(op)
+            db.session.commit()
+    return on_done
+
+
+def _submit_restart(solution,title,restart,req,*args):
+    job = jobs.submit("RollingRestart",restart,*args,key=req["cluster"],
+                      on_done=_record_operation(req["execution"],current_user.id,req["cluster"]),
+                      title=title,cluster=req["cluster"],solution=solution)
+    return jsonify({"task":"RollingRestart","job":job.id}),202
+
+
+def _configuration(data,req):
+    if isinstance(data,Exception):
+        flash(str(data))
+        return jsonify({"task":"Configuration"})
+    return jsonify({"task":"Configuration","data":data})
+
+
+#--------------------ElasticSearch--------------------
+@catalog.handler(ELASTIC,"RollingRestart")
+def es_rolling_restart(es:Es,req:dict):
+    return _submit_restart(ELASTIC,"Rolling Restart",es.RollingRestart,req)
+
+
+@catalog.handler(ELASTIC,"BatchedRollingRestart")
+def es_batched_rolling_restart(es:Es,req:dict):
+    return _submit_restart(ELASTIC,"Batched Rolling Restart",es.RollingRestart,req,True)
+
+
+@catalog.handler(ELASTIC,"LiveConfiguration")
+def es_live_configuration(es:Es,req:dict):
+    try:
+        report = es.LiveConfigurationReport()
+    except Exception as e:
+        return _configuration(e,req)
+    if not report["data"]:
+        flash("All {} nodes of '{}' run the template of ElasticSearch {}.".format(report["nodes"],req.get("cluster"),report["version"]))
+    else:
+        flash("{} setting(s) of '{}' differ from the template or between nodes.".format(len(report["data"]),req.get("cluster")))
+    return jsonify({"task":"Configuration",**report})
+
+
+@health.probe(ELASTIC)
+def es_health(nodes:list,cluster:str) -> dict:
+    status = Es(nodes,Topology.auth(cluster)).ClusterHealthCheck()
+    if status in ("green","yellow","red"):
+        return {"status":status}
+    return {"status":"unknown","error":status}
+
+
+@catalog.handler(ELASTIC,"ClusterHealthCheck")
+def es_cluster_health_check(es:Es,req:dict):
+    snapshot = health.cluster(req.get("cluster"),fresh=wants_fresh(req))
+    if snapshot is None: #not in the inventory, ask the nodes given
+        snapshot = {"status":es.ClusterHealthCheck()}
+    flash("Cluster '{}' status: {}!".format(req.get("cluster"),snapshot.get("error") or snapshot["status"]))
+    return jsonify({"task":"ClusterHealthCheck","snapshot":snapshot})
+
+
+@catalog.handler(ELASTIC,"Configuration")
+def es_configuration(es:Es,req:dict):
+    return _configuration(es.Configuration,req)
+
+
+#--------------------Redis--------------------
+@health.probe(REDIS)
+def redis_health(nodes:list,cluster:str) -> dict:
+    reports = bridge.run(bridge.redis(nodes,Topology.auth(cluster)).HealthReport(),timeout=bridge.run_timeout)
+    return {"status":Redis.cluster_status(reports),"nodes":reports}
+
+
+@catalog.handler(REDIS,"Ping")
+def redis_ping(redis:Redis,req:dict):
+    snapshot = health.cluster(req.get("cluster"),fresh=wants_fresh(req))
+    selected = {"{}:{}".format(*node) for node in redis.agents}
+    reports = [report for report in (snapshot or {}).get("nodes",[]) if report["node"] in selected]
+    if len(reports) != len(selected): #nodes outside the inventory, or the probe itself failed
+        snapshot = None
+        reports = redis.HealthReport()
+    status = Redis.cluster_status(reports)
+    if status == "green":
+        flash("Cluster '{}' status: green!".format(req.get("cluster")))
+    else:
+        flash("Cluster '{}' status: {}!".format(req.get("cluster"),status))
+        for report in reports:
+            for problem in report["problems"]:
+                flash("[ERROR] {} : {}".format(report["node"],problem))
+    return jsonify({"task":"ClusterHealthCheck","status":status,"nodes":reports,"checked_at":snapshot and snapshot["checked_at"]})
+
+
+@catalog.handler(REDIS,"RollingRestart")
+def redis_rolling_restart(redis:Redis,req:dict):
+    return _submit_restart(REDIS,"Rolling Restart",redis.RollingRestart,req)
+
+
+@catalog.handler(REDIS,"ReplicaFirstRollingRestart")
+def redis_replica_first_rolling_restart(redis:Redis,req:dict):
+    return _submit_restart(REDIS,"Replica-first Rolling Restart",redis.RollingRestart,req,True)
+
+
+@catalog.handler(REDIS,"Configuration")
+def redis_configuration(redis:Redis,req:dict):
+    report = redis.ConfigurationReport()
+    if not report["groups"]:
+        return _configuration(Exception("No agent returned its configuration : {}".format(report["errors"])),req)
+    for node,error in report["errors"].items():
+        flash("[ERROR] Configuration from {} : {}".format(node,error))
+    if report["drift"]:
+        flash("{} setting(s) differ between nodes of '{}'.".format(len(report["drift"]),req.get("cluster")))
+    return jsonify({"task":"Configuration","data":report["config"],"drift":report["drift"],"groups":report["groups"]})
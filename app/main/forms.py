@@ -2,8 +2,7 @@ from flask_wtf import FlaskForm
 from wtforms import StringField,SubmitField,TextAreaField,BooleanField,SelectField,ValidationError,SelectMultipleField,widgets
 from wtforms.validators import DataRequired,Length,Email,Regexp
 from app.models import User,Role,Execution
-import os
-import json
+from app.topology import topology
 
 
 class NameForm(FlaskForm):
@@ -75,13 +74,12 @@ class ClusterForm(FlaskForm):
     def __init__(self,*args,**kwargs):
         super(ClusterForm,self).__init__(*args,**kwargs)
         
-        self.cluster.choices =[(None,"Choose")]+ [(cluster,cluster) for clusters in json.loads(os.getenv("SOLUTION")).values()
-                                                for cluster in clusters.keys()]
+        self.cluster.choices =[(None,"Choose")]+ [(cluster,cluster) for cluster in topology.get().clusters]
 
     @classmethod
     def node_checkbox(cls,clustername):
         cls.nodes=SelectField(coerce=str)
-        cls.nodes.choices=[(node,node)for _,node in zip(range(1000),*[clusters.get(clustername) for clusters in json.loads(os.getenv("SOLUTION")).values() if clusters.get(clustername)])]
+        cls.nodes.choices=[(node.address,node.address) for node in topology.get().nodes(clustername)[:1000]]
 
         return cls
     
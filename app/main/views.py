@@ -1,16 +1,23 @@
 from . import main
-from flask import render_template,session,redirect,url_for,current_app, flash, abort,jsonify,request
-from .. import db
+from flask import render_template,session,redirect,url_for,current_app, flash, abort,jsonify,request,stream_with_context
+from .. import db,jobs,user_cache,health
+from ..health import wants_fresh
+from ..metrics import metrics
+from ..progress import progress
+from ..jobs import Job
+from ..topology import topology,Topology
+from ..execs import catalog
 from ..models import Execution, Operation, Permission, User,Role
 from .forms import EditProfileForm, NameForm,SearchForm,EditProfileAdminForm,OperationForm,ClusterForm
 from flask_login import login_required,current_user
 from app.decorators import admin_required,permission_required
-from os import getenv
+import hmac
 import json
+from datetime import datetime
 from app.core_features.ES import Es
 from app.core_features.REDIS import Redis
 from app.core_features.AGENT import Agent
-import re
+from app.core_features.AGENTCLIENT import agent_client
 
 
 ##DRY
@@ -52,6 +59,7 @@ def edit_profile():
         current_user.about_me = form.about_me.data
         db.session.add(current_user)
         db.session.commit()
+        user_cache.invalidate(current_user.id)
         flash("Your Profile has been updated")
         return redirect(url_for('.user',username=current_user.name))
     form.location.data = current_user.location
@@ -87,6 +95,7 @@ def edit_profile_admin_user(id):
         user.about_me = form.about_me.data
         db.session.add(user)
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash(f"The username has been changed to {user.username}.")
         return redirect(url_for('.edit_profile_admin'))
     form.email.data = user.email
@@ -115,7 +124,7 @@ def operation():
 @login_required
 @admin_required
 def op_call():
-    info = json.loads(getenv("SOLUTION"))
+    info = topology.get().inventory
     req= request.get_json()
     
     if req["req_client"] in info.keys(): 
@@ -136,84 +145,12 @@ def op_call():
 def op_call_exec():
     if current_user.can(Permission.EXECUTE) and request.method=="POST" :
         req : dict= request.get_json()
-        
-        #For ES 
-        if req.get("solution") == "ElasticSearch":
-            es = Es(req.get("nodes"),getenv("AUTH_"+req.get("cluster")))
-            #For Rolling restart
-            if int(req.get("execution")) == Execution.query.filter_by(name="RollingRestart",solution="ElasticSearch").first().id:
-                if es.RollingRestart():
-                    print("Right on")
-                    #You can just put req["execution"] as its value is coerced into integer in the model.
-                    op = Operation(exec_id=req["execution"],user=current_user._get_current_object(),cluster=req["cluster"])
-                    db.session.add(op)
-                    db.session.commit()
-                    flash("Rolling Restart on '{}' has been completed!".format(req.get("cluster")))
-                    return jsonify({"task":"RollingRestart"})
-                else:
-                    flash("Rolling Restart on cluster '{}' has failed!".format(req.get("cluster")))
-                    return jsonify({"task":"RollingRestart"})
-            
-            #For Cluster Health Check
-            if int(req.get("execution")) == Execution.query.filter_by(name="ClusterHealthCheck",solution="ElasticSearch").first().id:
-                result = es.ClusterHealthCheck()
-                if result in ("green","yellow","red"):
-                    flash("Cluster '{}' status: {}!".format(req.get("cluster"),result))
-      
-                else:
-                    flash("Cluster '{}' status: {}!".format(req.get("cluster"),result))
-                return jsonify({"task":"ClusterHealthCheck"})
-                
-            #For Configuration change
-            if int(req.get("execution")) == Execution.query.filter_by(name="Configuration",solution="ElasticSearch").first().id:
-                ##es.Configuration() #How to process YAML file?
-                form:dict = es.Configuration
-                if isinstance(form,Exception):
-                    flash(str(form))
-                    return jsonify({"task":"Configuration"})
-                else:
-                    return jsonify({"task":"Configuration","data":form})
-                       
-        #For Redis
-        if req.get("solution") == "Redis":
-            redis = Redis(req.get("nodes"),getenv("AUTH_"+req.get("cluster")))
-            
-            #For health check
-            if int(req.get("execution")) == Execution.query.filter_by(name="Ping",solution="Redis").first().id:
-                green = redis.ClusterHealthCheck()
-                print(green)
-                if green:
-                    flash("Cluster '{}' status: green!".format(req.get("cluster")))
-                else:
-                    flash("Cluster '{}' status: Not all nodes are up and running!".format(req.get("cluster")))
-                return jsonify({"task":"ClusterHealthCheck"})
-                
-            
-            #For rolling restart
-            if int(req.get("execution")) == Execution.query.filter_by(name="RollingRestart",solution="Redis").first().id:
-                success = redis.RollingRestart()
-                if success:
-                    print("Right on")
-                    op = Operation(exec_id=req["execution"],user=current_user._get_current_object(),cluster=req["cluster"])
-                    db.session.add(op)
-                    db.session.commit()
-                    flash("Rolling Restart on {} has been completed!".format(req.get("cluster")))
-                    return jsonify({"task":"RollingRestart"})
-                else:
-                    flash("Rolling Restart on cluster '{}' has failed!".format(req.get("cluster")))
-                    return jsonify({"task":"RollingRestart"})            
-            
-            #For config modification
-            if int(req.get("execution"))==Execution.query.filter_by(name="Configuration",solution="Redis").first().id:
-                data:dict = redis.Configuration
-                if isinstance(data,Exception):
-                    flash(str(data))
-                    return jsonify({"task":"Configuration"})
-                else:
-                    return jsonify({"task":"Configuration","data":data})
-        
-        print(request.get_json())
-        return jsonify("ee")
+        try:
+            handler,client,_ = catalog.dispatch(int(req.get("execution")),req.get("solution"))
+        except (KeyError,TypeError,ValueError):
+            print(request.get_json())
+            return jsonify("ee")
+        return handler(client(req.get("nodes"),req.get("cluster")),req)
     return jsonify("dd")
     
     
@@ -228,6 +165,8 @@ def op_call_config():
         nodes= req.get("nodes")
         data = req.get("data")
         exec_id= req.get("execution") #for db 
+        dry_run = bool(req.get("dry_run")) #only return what each node would be sent
+        force = bool(req.get("force")) #send every key, even to nodes already running it
         #print(req)
         
         if solution =="ElasticSearch":
@@ -238,34 +177,38 @@ def op_call_config():
                     data[k] = True
                 if v.lower() =="false":
                     data[k] =False
-            es= Es(nodes,getenv("AUTH_"+cluster))
-            reports = es.SetConfiguration(data)
+            es= Es(nodes,Topology.auth(cluster))
+            reports = es.SetConfiguration(data,force=force,dry_run=dry_run)
+            if dry_run:
+                return jsonify({"data":"plan","nodes":es.push_reports})
             if reports[0]:
                 op=Operation(exec_id=exec_id,user=current_user._get_current_object(),cluster=cluster)
                 db.session.add(op)
                 db.session.commit()
                 flash("Configuration modification on {} succeeded.".format(cluster))
-                return jsonify({"data":"okay"})
+                return jsonify({"data":"okay","nodes":es.push_reports})
             else:
                 flash("Configuration modification on {} failed.".format(cluster))
                 for report in reports[1]:
                     flash(report)    
                 
-                return jsonify({"data":"not okay"})
+                return jsonify({"data":"not okay","nodes":es.push_reports})
         if solution =="Redis":
-            redis = Redis(nodes,getenv("AUTH_"+cluster))
-            reports= redis.SetConfiguration(data)
+            redis = Redis(nodes,Topology.auth(cluster))
+            reports= redis.SetConfiguration(data,force=force,dry_run=dry_run)
+            if dry_run:
+                return jsonify({"data":"plan","nodes":redis.push_reports})
             if reports[0]:
                 op=Operation(exec_id=exec_id, user=current_user._get_current_object(),cluster=cluster)
                 db.session.add(op)
                 db.session.commit()
                 flash("Configuration modification on {} succeeded.".format(cluster))
-                return jsonify({"data":"okay"})
+                return jsonify({"data":"okay","nodes":redis.push_reports})
             else:
                 flash("Configuration modification on {} failed.".format(cluster))
                 for report in reports[1]:
                     flash(report) 
-                return jsonify({"data":"not okay"})
+                return jsonify({"data":"not okay","nodes":redis.push_reports})
     
 
 @main.route("/operation/history")
@@ -279,7 +222,142 @@ def ops_history():
 @login_required
 @admin_required
 def ops_table():
-    return {"data":[op.to_dict() for op in Operation.query]}
+    """
+    DataTables server-side protocol. 
+    Sorting, searching and paging happen in SQL; the client passes back 'after' (the cursor of
+    the previous page) when it moves to the next page so that the page is fetched by keyset.
+    """
+    args = request.args
+    if not args.get("draw"): #Client not using serverSide - keep the old payload shape.
+        return {"data":Operation.table_page(length=-1)[2]}
+
+    columns = []
+    idx = 0
+    while "columns[{}][data]".format(idx) in args:
+        columns.append((args.get("columns[{}][data]".format(idx)),args.get("columns[{}][searchable]".format(idx))=="true"))
+        idx+=1
+    order_idx = args.get("order[0][column]",type=int)
+    order = columns[order_idx][0] if order_idx is not None and order_idx < len(columns) else "timestamp"
+    desc = args.get("order[0][dir]","desc") != "asc"
+
+    after = None
+    if args.get("after"):
+        try:
+            value,last_id = json.loads(args.get("after"))
+            if order =="timestamp" and value is not None:
+                value = datetime.fromisoformat(value)
+            after = (value,int(last_id))
+        except (ValueError,TypeError):
+            after = None
+
+    length = args.get("length",10,type=int)
+    length = 1000 if length <= 0 else min(length,1000) #DataTables asks for every row with -1
+
+    total,filtered,rows,cursor = Operation.table_page(
+        start=args.get("start",0,type=int),
+        length=length,
+        search=args.get("search[value]","").strip(),
+        searchable=[data for data,searchable in columns if searchable],
+        order=order,desc=desc,after=after)
+
+    if cursor is not None:
+        cursor = json.dumps([cursor[0].isoformat() if isinstance(cursor[0],datetime) else cursor[0],cursor[1]])
+    return jsonify({
+        "draw":args.get("draw",type=int),
+        "recordsTotal":total,
+        "recordsFiltered":filtered,
+        "data":rows,
+        "cursor":cursor
+    })
+
+
+@main.route("/stats/user-cache")
+@login_required
+@admin_required
+def user_cache_stats():
+    return jsonify(user_cache.stats())
+
+
+@main.route("/health")
+@login_required
+@admin_required
+def health_snapshots():
+    "Latest snapshot of every cluster and agent. '?fresh=1' probes all of them first."
+    if wants_fresh():
+        health.poll_once()
+    return jsonify(health.snapshots())
+
+
+@main.route("/metrics")
+def prometheus_metrics():
+    """
+    Prometheus text format. The labels name nodes and agents, so it is served to scrapers sending
+    'Authorization: Bearer <METRICS_TOKEN>' and to logged-in administrators only.
+    """
+    token = current_app.config.get("METRICS_TOKEN")
+    scraper = bool(token) and hmac.compare_digest(request.headers.get("Authorization",""),"Bearer "+token)
+    if not scraper and not current_user.can(Permission.ADMIN):
+        abort(403)
+    return current_app.response_class(metrics.render(),mimetype="text/plain; version=0.0.4")
+
+
+@main.route("/stats/agent-client")
+@login_required
+@admin_required
+def agent_client_stats():
+    return jsonify(agent_client.stats())
+
+
+#----------------Background jobs -----------------------------
+@main.route("/jobs/<job_id>")
+@login_required
+@admin_required
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+@main.route("/jobs/<job_id>/result")
+@login_required
+@admin_required
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    if not job.done:
+        return jsonify(job.to_dict()),202
+    title = job.meta.get("title",job.name)
+    if job.status == Job.SUCCEEDED and job.result:
+        flash("{} on '{}' has been completed!".format(title,job.meta.get("cluster")))
+    else:
+        flash("{} on cluster '{}' has failed!".format(title,job.meta.get("cluster")))
+        if job.error:
+            flash("[ERROR] {}".format(job.error))
+    return jsonify(job.to_dict(with_result=True))
+
+
+@main.route("/jobs/<job_id>/events")
+@login_required
+@admin_required
+def job_events(job_id):
+    """
+    Progress of a job as Server-Sent Events, until it finishes or for PROGRESS_STREAM_TIMEOUT seconds,
+    so a long job doesn't hold a worker for its whole run. A reconnecting EventSource sends
+    Last-Event-ID and gets what it missed from the ring buffer first ('?last_id=' does the same).
+    """
+    if progress.get(job_id) is None:
+        abort(404)
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id") or 0
+    try:
+        last_id = int(last_id)
+    except ValueError:
+        last_id = 0
+    events = progress.subscribe(job_id,last_id,timeout=current_app.config.get("PROGRESS_STREAM_TIMEOUT"))
+    stream = (progress.format_sse(event) for event in events)
+    return current_app.response_class(stream_with_context(stream),mimetype="text/event-stream",
+                                      headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"})
 
 
 #----------------Agent synchronization -----------------------------
@@ -305,26 +383,26 @@ def nodes_to_sync():
     Todo list:
     - showing the list of clusters and 
     """
-    MANAGEMENT_DATABASE:dict=json.loads(getenv("SOLUTION"))
+    MANAGEMENT_DATABASE:Topology=topology.get()
     
     #From front
     req:dict = request.get_json()
     clustername:str = req.get("cluster")
+
+    #Every cluster of every solution at once. Agents shared by several clusters are only asked once.
+    if req.get("all"):
+        reports = {report["node"]:report for report in health.agents(list(MANAGEMENT_DATABASE.agents),fresh=wants_fresh(req))}
+        return jsonify({"clusters":{name:[reports[node] for node in MANAGEMENT_DATABASE.cluster_agents(name)]
+                                    for name in MANAGEMENT_DATABASE.clusters}})
+
     if clustername:
         #get nodes 
-        for cluster in MANAGEMENT_DATABASE.values():
-            unparsed_nodes:list = cluster.get(clustername)
-            if unparsed_nodes:
-                #parsing nodes address 
-                regex = re.compile(r"\d+.\d+.\d+.\d+")
-                nodes = set(map(lambda x: "http://"+regex.search(x).group()+":5000",unparsed_nodes))
-                break
+        nodes = MANAGEMENT_DATABASE.cluster_agents(clustername)
     
         #sync check 
-        print(nodes,type(nodes))
-        sync_state:list[tuple[str,int]] = list(map(lambda x: Agent.sync_status(x),nodes))
-        print(sync_state)
-        return jsonify({"sync":sync_state})
+        reports = health.agents(nodes,fresh=wants_fresh(req))
+        sync_state:list[tuple[str,int]] = [(report["node"],report["status"]) for report in reports]
+        return jsonify({"sync":sync_state,"nodes":reports})
         
         
     
@@ -332,20 +410,21 @@ def nodes_to_sync():
     
     #To the agents
     if nodename:
-        Agent.file_load()
-        files:dict = Agent.files
-        
-        sync_success = Agent.agent_sync(nodename,files)
-        if not sync_success:
+        report = Agent.delta_sync(nodename)
+        health.forget_agent(nodename) #its version or state may have changed
+        if not report["ok"]:
             flash("[ERROR] Attempt to synchronize Agent application on {} failed.".format(nodename))
             return jsonify({"data":"not okay"})
+        elif report["up_to_date"]: #Nothing was sent, no need to restart
+            flash("[SUCCESS] Agent application on {} is already up to date.".format(nodename))
+            return jsonify({"data":"okay","up_to_date":True,"sent":[]})
         else: #If successful, procede with restart 
             
             restart_success = Agent.agent_restart(nodename)
             if restart_success:
                 
                 flash("[SUCCESS] Attempt to restart Agent application succeeded.")
-                return jsonify({"data":"okay"}) #success
+                return jsonify({"data":"okay","up_to_date":False,"sent":report["sent"]}) #success
             else:
                 flash("[ERROR] Restart on {} failed!".format(nodename))
                 return jsonify({"data":"not okay"}) #fail
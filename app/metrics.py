@@ -0,0 +1,160 @@
+######################################################################
+# In-process metrics, exposed on /metrics in Prometheus text format.
+# Counters and histograms are plain dicts under a lock per metric :
+# recording costs a dict lookup and a bisect, no I/O.
+#
+######################################################################
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+
+
+#Seconds. From a Redis ping to a whole rolling restart phase.
+BUCKETS=(0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120,300,600)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\","\\\\").replace("\n","\\n").replace('"','\\"')
+
+
+def _labels(names:tuple,values:tuple,extra:str="") -> str:
+    pairs = ['{}="{}"'.format(name,_escape(value)) for name,value in zip(names,values)]
+    if extra:
+        pairs.append(extra)
+    return "{"+",".join(pairs)+"}" if pairs else ""
+
+
+class Counter:
+    def __init__(self,name:str,documentation:str,labelnames:tuple=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self,amount:float=1,**labels):
+        key = tuple(labels.get(name,"") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key,0)+amount
+
+    def value(self,**labels) -> float:
+        return self._values.get(tuple(labels.get(name,"") for name in self.labelnames),0)
+
+    def render(self) -> list:
+        lines = ["# HELP {} {}".format(self.name,self.documentation),"# TYPE {} counter".format(self.name)]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend("{}{} {}".format(self.name,_labels(self.labelnames,key),value) for key,value in values)
+        return lines
+
+
+class Histogram:
+    def __init__(self,name:str,documentation:str,labelnames:tuple=(),buckets:tuple=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {} #labels -> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self,value:float,**labels):
+        key = tuple(labels.get(name,"") for name in self.labelnames)
+        idx = bisect_left(self.buckets,value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0]*(len(self.buckets)+1),0.0]
+            entry[0][idx] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self,**labels):
+        "Observe the duration of the block, also when it raises."
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter()-start,**labels)
+
+    def count(self,**labels) -> int:
+        entry = self._values.get(tuple(labels.get(name,"") for name in self.labelnames))
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> list:
+        lines = ["# HELP {} {}".format(self.name,self.documentation),"# TYPE {} histogram".format(self.name)]
+        with self._lock:
+            values = sorted((key,(list(counts),total)) for key,(counts,total) in self._values.items())
+        for key,(counts,total) in values:
+            cumulative = 0
+            for bound,count in zip(self.buckets+(float("inf"),),counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append("{}_bucket{} {}".format(self.name,_labels(self.labelnames,key,'le="{}"'.format(le)),cumulative))
+            lines.append("{}_sum{} {}".format(self.name,_labels(self.labelnames,key),total))
+            lines.append("{}_count{} {}".format(self.name,_labels(self.labelnames,key),cumulative))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds every metric of the process. Metrics are created once, at import time, with counter()
+    and histogram(); init_app() adds the per-endpoint Flask request latency.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.requests = self.histogram("flask_request_duration_seconds","Flask request latency per endpoint",("endpoint","method"))
+        self.responses = self.counter("flask_responses_total","Flask responses per endpoint and status",("endpoint","method","status"))
+
+    def _add(self,metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name,metric)
+
+    def counter(self,name:str,documentation:str,labelnames:tuple=()) -> Counter:
+        return self._add(Counter(name,documentation,labelnames))
+
+    def histogram(self,name:str,documentation:str,labelnames:tuple=(),buckets:tuple=BUCKETS) -> Histogram:
+        return self._add(Histogram(name,documentation,labelnames,buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines)+"\n"
+
+    def init_app(self,app):
+        from flask import g,request
+
+        @app.before_request
+        def _start_timer():
+            g._metrics_start = time.perf_counter()
+
+        @app.after_request
+        def _record_request(response):
+            start = g.pop("_metrics_start",None)
+            if start is not None:
+                endpoint = request.endpoint or "unmatched" #404s don't get to pick their own label
+                self.requests.observe(time.perf_counter()-start,endpoint=endpoint,method=request.method)
+                self.responses.inc(endpoint=endpoint,method=request.method,status=response.status_code)
+            return response
+
+        app.extensions["metrics"] = self
+
+
+metrics = MetricsRegistry()
+
+#Core operations
+ES_REQUEST = metrics.histogram("es_request_duration_seconds","ElasticSearch REST request latency",("path",))
+ES_ERRORS = metrics.counter("es_request_errors_total","ElasticSearch REST requests that failed",("path",))
+REDIS_PING = metrics.histogram("redis_ping_duration_seconds","Redis ping latency, connect included",("node",))
+REDIS_PING_ERRORS = metrics.counter("redis_ping_errors_total","Redis pings without a PONG",("node",))
+AGENT_REQUEST = metrics.histogram("agent_request_duration_seconds","Agent request latency, retries included",("agent","command"))
+AGENT_ERRORS = metrics.counter("agent_request_errors_total","Agent requests that failed or got an error status",("agent","command"))
+RESTART_PHASE = metrics.histogram("rolling_restart_phase_duration_seconds","Duration of each rolling restart phase per node",("solution","phase","node"))
+RESTART_FAILURES = metrics.counter("rolling_restart_failures_total","Rolling restarts aborted, by the phase that failed",("solution","phase"))
+CONFIG_PUSH = metrics.histogram("config_push_duration_seconds","Configuration push latency per phase and node",("phase","node"))
+CONFIG_PUSH_ERRORS = metrics.counter("config_push_errors_total","Configuration push failures per phase and node",("phase","node"))
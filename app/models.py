@@ -1,12 +1,12 @@
 from werkzeug.security import generate_password_hash,check_password_hash
 from flask_login import UserMixin,AnonymousUserMixin
-from . import db, login_manager
+from . import db, login_manager, user_cache
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from flask import current_app
 from enum import Enum, IntEnum,auto
 from datetime import datetime
 import json
-from .execs import RedisDirector,ElasticDirector
+from .execs import catalog
 
 
 class User(UserMixin, db.Model):
@@ -106,12 +106,11 @@ class Execution(db.Model):
         if exec : 
             db.session.delete(exec)
             db.session.commit()
+            catalog.invalidate()
     
     @staticmethod
     def insert_execution():
-        REDIS= RedisDirector.construct() #dict - solution, execution
-        ELASTIC = ElasticDirector.construct() #dict 
-        SOLUTIONS=[REDIS,ELASTIC]
+        SOLUTIONS=catalog.products() #dict - solution, execution
         for sol in SOLUTIONS:
             for exe in sol["execution"]:
                 execution = Execution.query.filter_by(name=exe,solution=sol["solution"]).first()
@@ -119,10 +118,16 @@ class Execution(db.Model):
                     execution = Execution(name=exe,solution=sol["solution"])
                 db.session.add(execution)
             db.session.commit()
+        catalog.invalidate()
                 
     
 class Operation(db.Model):
     __tablename__ = "operations"
+    #Composite indexes backing the history table : time range per cluster, and per execution over time.
+    __table_args__ = (
+        db.Index("ix_operations_timestamp_cluster","timestamp","cluster"),
+        db.Index("ix_operations_exec_id_timestamp","exec_id","timestamp"),
+    )
     id = db.Column(db.Integer,primary_key=True)
     timestamp= db.Column(db.DateTime,index=True,default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
@@ -142,6 +147,84 @@ class Operation(db.Model):
             "solution":self.execution.solution,
             "cluster":self.cluster
         }
+
+    @staticmethod
+    def table_columns():
+        "Columns the history table can be sorted/searched on, keyed by DataTables 'data' name."
+        return {
+            "id":Operation.id,
+            "user":User.username,
+            "email":User.email,
+            "execution":Execution.name,
+            "solution":Execution.solution,
+            "cluster":Operation.cluster,
+            "timestamp":Operation.timestamp,
+        }
+
+    @staticmethod
+    def table_query():
+        "One query joining users and executions, so no lazy load happens per row."
+        return db.session.query(
+            Operation.id,Operation.timestamp,Operation.cluster,
+            User.username.label("user"),User.email.label("email"),
+            Execution.name.label("execution"),Execution.solution.label("solution"))\
+            .outerjoin(User,Operation.user_id==User.id)\
+            .outerjoin(Execution,Operation.exec_id==Execution.id)
+
+    @staticmethod
+    def table_page(start=0,length=10,search="",searchable=(),order="timestamp",desc=True,after=None):
+        """
+        Return (records_total, records_filtered, rows, cursor) for one page of history.
+
+        When 'after' is given as the (sort value, id) of the last row of the previous page,
+        the page is fetched by keyset instead of OFFSET so deep pages cost the same as the first one.
+        'cursor' is the (sort value, id) to pass as 'after' for the next page.
+        """
+        columns = Operation.table_columns()
+        if order not in columns:
+            order = "timestamp"
+        sort_col = columns[order]
+        query = Operation.table_query()
+        records_total = db.session.query(db.func.count(Operation.id)).scalar()
+
+        if search:
+            cols = [columns[c] for c in searchable if c in columns]
+            if cols:
+                query = query.filter(db.or_(*[col.ilike("%{}%".format(search)) for col in cols]))
+                records_filtered = query.count()
+            else:
+                records_filtered = records_total
+        else:
+            records_filtered = records_total
+
+        #Users and executions are outer joined, so their columns are NULL for deleted ones. Those rows
+        #sort last in both directions, whatever the database does, so the keyset can step over them.
+        nullable = order not in ("id","timestamp")
+        beyond = (lambda col,value: col < value) if desc else (lambda col,value: col > value)
+        if after is not None:
+            value,last_id = after
+            if value is None:
+                query = query.filter(sort_col.is_(None),beyond(Operation.id,last_id))
+            else:
+                keyset = [beyond(sort_col,value),db.and_(sort_col == value,beyond(Operation.id,last_id))]
+                if nullable:
+                    keyset.append(sort_col.is_(None))
+                query = query.filter(db.or_(*keyset))
+
+        ordering = [sort_col.is_(None)] if nullable else []
+        if desc:
+            ordering += [sort_col.desc(),Operation.id.desc()]
+        else:
+            ordering += [sort_col.asc(),Operation.id.asc()]
+        query = query.order_by(*ordering)
+        if after is None:
+            query = query.offset(max(start,0))
+        if length > 0:
+            query = query.limit(length)
+
+        rows = [row._asdict() for row in query]
+        cursor = (rows[-1][order],rows[-1]["id"]) if rows else None
+        return records_total,records_filtered,rows,cursor
 #----------------------------    
     
     
@@ -149,7 +232,7 @@ class Operation(db.Model):
 # User loading function 
 @login_manager.user_loader 
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 login_manager.anonymous_user=AnonymousUser
 
@@ -212,4 +295,5 @@ class Role(db.Model):
             role.default = (role.name == default_role)
             db.session.add(role)
         db.session.commit()
+        user_cache.clear()
 
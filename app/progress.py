@@ -0,0 +1,166 @@
+######################################################################
+# Progress events of long-running executions, streamed to the browser
+# as Server-Sent Events. Each job has a channel holding its last events
+# in a ring buffer, so a late subscriber first catches up on what it
+# missed, then waits for new events without polling.
+#
+######################################################################
+
+from collections import OrderedDict,deque
+from datetime import datetime
+import functools
+import json
+import threading
+import time
+
+
+#Event types
+JOB_STARTED="job_started"
+NODE_STARTED="node_started"
+NODE_RESTARTED="node_restarted"
+WAITING_FOR_GREEN="waiting_for_green"
+NODE_DONE="node_done"
+FAILOVER="failover"
+FAILURE="failure"
+JOB_FINISHED="job_finished"
+
+
+class Channel:
+    "Events of one job, the last 'size' of them, numbered from 1."
+    def __init__(self,size:int):
+        self.events = deque(maxlen=size)
+        self.last_id = 0
+        self.closed = False
+        self.changed = threading.Condition()
+
+    def append(self,event:dict) -> dict:
+        with self.changed:
+            if self.closed:
+                return None
+            self.last_id += 1
+            event["id"] = self.last_id
+            self.events.append(event)
+            self.changed.notify_all()
+            return event
+
+    def since(self,last_id:int) -> list:
+        with self.changed:
+            return [event for event in self.events if event["id"] > last_id]
+
+    def close(self):
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+
+class ProgressHub:
+    """
+    job id -> Channel.
+    Code running inside a job calls emit() : JobManager binds its worker thread to the job's channel,
+    and emit() outside of any job does nothing. Threads started by the job are bound with bound(fn).
+    subscribe() yields the buffered events after 'last_id', then every new one until the job finishes.
+    """
+    def __init__(self,app=None):
+        self.size = 500
+        self.max_channels = 100
+        self.keepalive = 15
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self,app):
+        self.size = app.config.get("PROGRESS_BUFFER",500)
+        self.max_channels = app.config.get("PROGRESS_CHANNELS",100)
+        self.keepalive = app.config.get("PROGRESS_KEEPALIVE",15)
+        app.extensions["progress"] = self
+
+    #--------Publishing--------
+    def open(self,channel_id:str) -> Channel:
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                channel = self._channels[channel_id] = Channel(self.size)
+                #Forget the oldest finished jobs
+                finished = [key for key,value in self._channels.items() if value.closed]
+                for key in finished[:max(len(self._channels)-self.max_channels,0)]:
+                    del self._channels[key]
+            return channel
+
+    def get(self,channel_id:str) -> Channel:
+        with self._lock:
+            return self._channels.get(channel_id)
+
+    def publish(self,channel_id:str,event_type:str,**data) -> dict:
+        channel = self.get(channel_id) or self.open(channel_id)
+        return channel.append({"event":event_type,"time":datetime.utcnow().isoformat(timespec="milliseconds")+"Z",**data})
+
+    def close(self,channel_id:str):
+        channel = self.get(channel_id)
+        if channel is not None:
+            channel.close()
+
+    def bind(self,channel_id:str=None):
+        "emit() from this thread goes to 'channel_id' (None : nowhere)."
+        self._local.channel = channel_id
+
+    @property
+    def current(self) -> str:
+        return getattr(self._local,"channel",None)
+
+    def bound(self,fn):
+        "fn, run in another thread with the channel of the calling thread (e.g. for ThreadPoolExecutor.map)."
+        channel_id = self.current
+        @functools.wraps(fn)
+        def wrapper(*args,**kwargs):
+            previous = self.current
+            self.bind(channel_id)
+            try:
+                return fn(*args,**kwargs)
+            finally:
+                self.bind(previous)
+        return wrapper
+
+    def emit(self,event_type:str,**data):
+        channel_id = self.current
+        if channel_id is not None:
+            self.publish(channel_id,event_type,**data)
+
+    #--------Subscribing--------
+    def subscribe(self,channel_id:str,last_id:int=0,timeout:float=None):
+        """
+        Buffered events after 'last_id', then new ones as they come, until the channel closes.
+        Yields None every 'keepalive' seconds without events, and stops after 'timeout' seconds.
+        """
+        channel = self.get(channel_id)
+        if channel is None:
+            return
+        deadline = None if timeout is None else time.monotonic()+timeout
+        while True:
+            with channel.changed:
+                if channel.last_id <= last_id and not channel.closed:
+                    wait = self.keepalive if deadline is None else min(self.keepalive,deadline-time.monotonic())
+                    if wait > 0:
+                        channel.changed.wait(wait)
+                closed = channel.closed
+            events = channel.since(last_id)
+            for event in events:
+                last_id = event["id"]
+                yield event
+            if closed and channel.last_id <= last_id:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            if not events:
+                yield None
+
+    @staticmethod
+    def format_sse(event:dict) -> str:
+        "One event in text/event-stream framing; None is a comment line keeping the connection alive."
+        if event is None:
+            return ": keep-alive\n\n"
+        return "id: {}\nevent: {}\ndata: {}\n\n".format(event["id"],event["event"],json.dumps(event,default=str))
+
+
+progress = ProgressHub()
@@ -0,0 +1,144 @@
+######################################################################
+# Cluster topology registry.
+# The SOLUTION inventory (env JSON, or the file SOLUTION_FILE points to)
+# is parsed once into indexed structures and re-parsed only when it changes.
+#
+######################################################################
+
+from collections import namedtuple
+import json
+import os
+import re
+import threading
+import time
+
+AGENT_PORT=5000 #unless AGENT_PORT is set in the environment
+DEFAULT_PORTS={"ElasticSearch":9200,"Redis":6379}
+
+
+def agent_port() -> int:
+    "Port every agent listens on."
+    return int(os.getenv("AGENT_PORT") or AGENT_PORT)
+
+#[scheme://]host[:port][/] where host is a hostname, an IPv4 or a bracketed IPv6 address
+ADDRESS = re.compile(r"^\s*(?:(?P<scheme>https?)://)?(?P<host>\[[0-9A-Fa-f:.]+\]|[A-Za-z0-9](?:[A-Za-z0-9.\-_]*[A-Za-z0-9])?)(?::(?P<port>\d{1,5}))?/?\s*$")
+
+
+class Node(namedtuple("Node",["address","scheme","host","port"])):
+    "One node of a cluster as written in the inventory, with its parsed parts."
+    __slots__ = ()
+
+    @property
+    def https(self) -> bool:
+        return self.scheme == "https"
+
+    @property
+    def agent(self) -> str:
+        return "http://{}:{}".format(self.host if ":" not in self.host else "["+self.host+"]",agent_port())
+
+    @property
+    def endpoint(self) -> tuple:
+        return self.host,self.port
+
+
+def parse_address(address:str,default_port:int=None) -> Node:
+    "Parse 'https://10.0.0.1:9200', 'es-01.internal:9200', '10.0.0.1:6379'... Raises ValueError on anything else."
+    match = ADDRESS.match(address or "")
+    if not match:
+        raise ValueError("Invalid node address : {!r}".format(address))
+    port = match.group("port")
+    port = int(port) if port else default_port
+    if port is None or not 0 < port < 65536:
+        raise ValueError("Invalid or missing port in node address : {!r}".format(address))
+    return Node(address,match.group("scheme") or "http",match.group("host").strip("[]"),port)
+
+
+class Topology:
+    "Immutable, indexed snapshot of the inventory : solution -> cluster -> nodes, cluster -> solution/auth, agent -> clusters."
+    def __init__(self,inventory:dict):
+        self.inventory = inventory
+        self.solutions = {}
+        self.clusters = {}
+        self.agents = {}
+        for solution,clusters in inventory.items():
+            self.solutions[solution] = {}
+            for cluster,addresses in clusters.items():
+                nodes = tuple(parse_address(address,DEFAULT_PORTS.get(solution)) for address in addresses)
+                self.solutions[solution][cluster] = nodes
+                self.clusters[cluster] = (solution,nodes)
+                for node in nodes:
+                    self.agents.setdefault(node.agent,[]).append(cluster)
+        self.by_address = {node.address:node for _,nodes in self.clusters.values() for node in nodes}
+
+    def nodes(self,cluster:str) -> tuple:
+        return self.clusters.get(cluster,(None,()))[1]
+
+    def solution_of(self,cluster:str):
+        return self.clusters.get(cluster,(None,()))[0]
+
+    def cluster_agents(self,cluster:str) -> list:
+        "Agent URL of every node of 'cluster', without duplicates."
+        return list(dict.fromkeys(node.agent for node in self.nodes(cluster)))
+
+    @staticmethod
+    def auth(cluster:str):
+        return os.getenv("AUTH_"+cluster)
+
+
+class TopologyRegistry:
+    """
+    Holds the current Topology. get() is cheap : the source is only re-checked every
+    'check_interval' seconds, and re-parsed when the SOLUTION variable or the file has changed.
+    A new snapshot replaces the old one in a single assignment, so readers never see a half-built one.
+    """
+    def __init__(self,check_interval:float=1):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._topology = None
+        self._signature = None
+        self._checked = 0
+        self.loads = 0
+
+    @staticmethod
+    def _source():
+        "(signature, loader) of the current inventory source."
+        path = os.getenv("SOLUTION_FILE")
+        if path:
+            stat = os.stat(path)
+            def load():
+                with open(path,encoding="UTF8") as f:
+                    return json.load(f)
+            return ("file",path,stat.st_mtime_ns,stat.st_size),load
+        raw = os.getenv("SOLUTION") or "{}"
+        return ("env",raw),lambda: json.loads(raw)
+
+    def get(self) -> Topology:
+        now = time.monotonic()
+        if self._topology is not None and now - self._checked < self.check_interval:
+            return self._topology
+        with self._lock:
+            try:
+                signature,load = TopologyRegistry._source()
+                if signature != self._signature:
+                    self._signature = signature #a broken source is not parsed again until it changes
+                    self._topology = Topology(load())
+                    self.loads += 1
+            #json errors are ValueErrors; a missing or half-replaced file raises OSError,
+            #valid JSON of the wrong shape TypeError or AttributeError
+            except (OSError,ValueError,TypeError,AttributeError) as e:
+                if self._topology is None:
+                    self._signature = None
+                    raise
+                print("[ERROR] Invalid SOLUTION inventory, keeping the previous one : {}".format(e))
+            finally:
+                self._checked = now
+            return self._topology
+
+    def reload(self) -> Topology:
+        with self._lock:
+            self._signature = None
+            self._checked = 0
+        return self.get()
+
+
+topology = TopologyRegistry()
@@ -0,0 +1,88 @@
+######################################################################
+# Per-process cache for login_manager.user_loader.
+# Keeps a detached snapshot of each user with its role loaded, and
+# merges a copy into the request session without touching the database.
+#
+######################################################################
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class UserCache:
+    """
+    TTL + LRU cache of user snapshots keyed by user id.
+    A snapshot is loaded in its own session and never attached to a request session, so it is
+    never expired or modified; each request gets its own copy through session.merge(load=False).
+    Call invalidate(user_id) after changing a user, and clear() after changing roles.
+    """
+    def __init__(self,app=None):
+        self.ttl = 60
+        self.size = 1024
+        self._entries = OrderedDict() #user id -> (loaded at, snapshot)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self,app):
+        self.ttl = app.config.get("USER_CACHE_TTL",60)
+        self.size = app.config.get("USER_CACHE_SIZE",1024)
+        self.clear()
+        app.extensions["user_cache"] = self
+
+    def get(self,user_id:int):
+        "The user as a persistent instance of the current session, or None."
+        from . import db
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                snapshot = entry[1]
+            else:
+                self.misses += 1
+                snapshot = None
+            generation = self._generation
+        if snapshot is None:
+            snapshot = self._load(user_id)
+            if snapshot is None:
+                return None
+            with self._lock:
+                if generation == self._generation: #not invalidated while loading
+                    self._entries[user_id] = (now,snapshot)
+                    self._entries.move_to_end(user_id)
+                    while len(self._entries) > self.size:
+                        self._entries.popitem(last=False)
+        return db.session.merge(snapshot,load=False)
+
+    @staticmethod
+    def _load(user_id:int):
+        from sqlalchemy.orm import Session,joinedload
+        from . import db
+        from .models import User
+        session = Session(bind=db.engine)
+        try:
+            return session.query(User).options(joinedload(User.role)).get(user_id)
+        finally:
+            session.close() #detaches the snapshot with its attributes loaded
+
+    def invalidate(self,user_id:int):
+        with self._lock:
+            self._entries.pop(user_id,None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits":self.hits,"misses":self.misses,"size":len(self._entries),
+                    "hit_ratio":round(self.hits/total,4) if total else None}
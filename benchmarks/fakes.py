@@ -0,0 +1,361 @@
+######################################################################
+# Local stand-ins for ElasticSearch, Redis and the agent, for benchmarks.
+# Every fake listens once on 0.0.0.0 and serves any number of nodes :
+# node i is 127.0.x.y, so N nodes cost one socket instead of N.
+# With loopback=True, node i is 127.0.0.1 on a port of its own instead,
+# for systems that only route 127.0.0.1 (macOS). Nodes are told apart by
+# the (ip, port) the client dialed either way.
+#
+######################################################################
+
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from urllib.parse import urlsplit,parse_qs
+import json
+import random
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+
+def node_ips(count:int) -> list:
+    "127.0.x.y for x,y in 1..250 : every address routes to the loopback interface."
+    return ["127.0.{}.{}".format(1+i//250,1+i%250) for i in range(count)]
+
+
+def loopback_only() -> bool:
+    "True where 127.0.x.y addresses other than 127.0.0.1 don't reach the loopback interface."
+    return not sys.platform.startswith("linux")
+
+
+class _Server:
+    "Serves on daemon threads; stop() closes them. The backlog is sized for a thousand nodes dialing at once."
+    def _listen(self,server_class,handler,host:str,port:int=0) -> int:
+        "Listen on host:port (0 : any free port) and return the port."
+        server = server_class((host,port),handler,bind_and_activate=False)
+        server.daemon_threads = True
+        server.allow_reuse_address = True
+        server.request_queue_size = 1024
+        server.connections = set()
+        server.server_bind()
+        server.server_activate()
+        self.servers = getattr(self,"servers",[])+[server]
+        threading.Thread(target=server.serve_forever,daemon=True).start()
+        return server.server_address[1]
+
+    def _nodes(self,server_class,handler,count:int,loopback:bool) -> list:
+        "(ip, port) of 'count' nodes : 127.0.x.y on one shared port, or with 'loopback' 127.0.0.1 on a port per node."
+        if loopback:
+            return [("127.0.0.1",self._listen(server_class,handler,"127.0.0.1")) for _ in range(count)]
+        port = self._listen(server_class,handler,"0.0.0.0")
+        return [(ip,port) for ip in node_ips(count)]
+
+    def stop(self):
+        "Also drops the keep-alive connections, so pooled clients can't reach a stopped fake."
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+            for conn in list(server.connections):
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class _Tracked(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.server.connections.add(self.connection)
+
+    def finish(self):
+        self.server.connections.discard(self.connection)
+        super().finish()
+
+
+class _JSONHandler(_Tracked,BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" #keep-alive, like the real servers
+    disable_nagle_algorithm = True #headers and body are separate writes
+
+    def send(self,obj,status=200):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def log_message(self,*args):
+        pass
+
+
+#--------------------ElasticSearch--------------------
+class FakeESCluster(_Server):
+    """
+    'count' nodes spread over 'zones' awareness zones, with one shard per node whose replica
+    sits on the next node. A restarted node leaves for 'restart_delay' seconds, comes back with
+    a new JVM start time, and the cluster stays yellow for 'recovery_delay' more seconds.
+    """
+    def __init__(self,count:int,zones:int=0,restart_delay:float=0.05,recovery_delay:float=0.05,version:str="7.17.0",
+                 loopback:bool=None):
+        self.zones = zones
+        self.restart_delay = restart_delay
+        self.recovery_delay = recovery_delay
+        self.version = version
+        self.lock = threading.Lock()
+        self.green_at = 0
+        self.restarts = 0
+        handler = type("Handler",(FakeESHandler,),{"cluster":self})
+        loopback = loopback_only() if loopback is None else loopback
+        self.nodes = {node:{"name":"node-{}".format(i),"zone":"zone-{}".format(i%zones) if zones else None,
+                            "start":1,"down_until":0}
+                      for i,node in enumerate(self._nodes(ThreadingHTTPServer,handler,count,loopback))}
+        self.addresses = ["http://{}:{}".format(ip,port) for ip,port in self.nodes]
+
+    def restart(self,node:tuple):
+        with self.lock:
+            info = self.nodes[node]
+            now = time.time()
+            info["down_until"] = now+self.restart_delay
+            info["start"] += 1
+            self.green_at = max(self.green_at,now+self.restart_delay+self.recovery_delay)
+            self.restarts += 1
+
+    def up(self) -> list:
+        now = time.time()
+        return [(node,info) for node,info in self.nodes.items() if info["down_until"] <= now]
+
+    def health(self) -> dict:
+        up = len(self.up())
+        status = "green" if up == len(self.nodes) and time.time() >= self.green_at else "yellow"
+        return {"cluster_name":"bench","status":status,"number_of_nodes":up,"timed_out":False}
+
+    def node_infos(self) -> dict:
+        return {info["name"]:{"name":info["name"],"http":{"publish_address":"{}:{}".format(*node)},
+                              "jvm":{"start_time_in_millis":info["start"]},
+                              "attributes":{"zone":info["zone"]} if info["zone"] else {}}
+                for node,info in self.up()}
+
+    def shards(self) -> list:
+        names = [info["name"] for info in self.nodes.values()]
+        up = {info["name"] for _,info in self.up()}
+        rows = []
+        for i,name in enumerate(names):
+            for prirep,holder in (("p",name),("r",names[(i+1)%len(names)])):
+                rows.append({"index":"bench","shard":str(i),"prirep":prirep,
+                             "state":"STARTED" if holder in up else "UNASSIGNED","node":holder if holder in up else None})
+        return rows
+
+
+class FakeESHandler(_JSONHandler):
+    cluster = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k:v[0] for k,v in parse_qs(url.query).items()}
+        cluster = self.cluster
+        if url.path == "/":
+            return self.send({"name":"bench","version":{"number":cluster.version}})
+        if url.path == "/_cluster/health":
+            return self.send(self._long_poll(params))
+        if url.path.startswith("/_nodes"):
+            return self.send({"nodes":cluster.node_infos()})
+        if url.path == "/_cluster/settings":
+            defaults = {"cluster.routing.allocation.awareness.attributes":"zone"} if cluster.zones else {}
+            return self.send({"persistent":{},"transient":{},"defaults":defaults})
+        if url.path == "/_cat/shards":
+            return self.send(cluster.shards())
+        self.send({"error":"no handler for {}".format(url.path)},404)
+
+    def _long_poll(self,params:dict) -> dict:
+        "_cluster/health with wait_for_status / wait_for_nodes : answer once the condition holds or the timeout runs out."
+        deadline = time.time()+float(params.get("timeout","0s").rstrip("s") or 0)
+        while True:
+            health = self.cluster.health()
+            ok = True
+            if params.get("wait_for_status") == "green":
+                ok = health["status"] == "green"
+            wanted = params.get("wait_for_nodes")
+            if wanted:
+                if wanted.startswith("<"):
+                    ok = ok and health["number_of_nodes"] < int(wanted[1:])
+                else:
+                    ok = ok and health["number_of_nodes"] >= int(wanted.lstrip(">="))
+            if ok or time.time() >= deadline:
+                health["timed_out"] = not ok
+                return health
+            time.sleep(0.01)
+
+
+#--------------------Redis--------------------
+class FakeRedis(_Server):
+    """
+    RESP server answering for 'count' nodes (inline or array commands) : PING, AUTH, ECHO, CLUSTER INFO,
+    INFO replication, INFO server and CLUSTER FAILOVER. Node i starts as a master when i is even, as the
+    replica of node i-1 otherwise. A node in restart answers -LOADING for 'restart_delay' seconds and
+    comes back with a new run_id. Nodes are (ip, port) tuples.
+    """
+    def __init__(self,count:int,restart_delay:float=0.05,latency:float=0,loopback:bool=None):
+        self.restart_delay = restart_delay
+        self.latency = latency
+        self.down_until = {}
+        self.offset = 1000
+        handler = type("Handler",(FakeRedisHandler,),{"redis":self})
+        loopback = loopback_only() if loopback is None else loopback
+        self.nodes = self._nodes(socketserver.ThreadingTCPServer,handler,count,loopback)
+        self.master_of = {node:self.nodes[i-1] for i,node in enumerate(self.nodes) if i % 2}
+        self.run_ids = {node:"{:040x}".format(i) for i,node in enumerate(self.nodes)}
+        self.restarts = []
+        self.failovers = []
+        self.lock = threading.Lock()
+        self.addresses = ["{}:{}".format(*node) for node in self.nodes]
+
+    def restart(self,node:tuple):
+        with self.lock:
+            self.down_until[node] = time.time()+self.restart_delay
+            self.run_ids[node] = "{:040x}".format(random.getrandbits(160))
+            self.restarts.append(node)
+
+    def failover(self,replica:str) -> bool:
+        with self.lock:
+            master = self.master_of.pop(replica,None)
+            if master is None:
+                return False
+            self.master_of[master] = replica
+            self.failovers.append(replica)
+            return True
+
+    def loading(self,node:tuple) -> bool:
+        return self.down_until.get(node,0) > time.time()
+
+    def role_of(self,node:tuple) -> tuple:
+        "('master', replica or None) or ('slave', master)"
+        with self.lock:
+            if node in self.master_of:
+                return "slave",self.master_of[node]
+            return "master",next((replica for replica,master in self.master_of.items() if master == node),None)
+
+    def reply(self,node:tuple,args:list) -> bytes:
+        command = [arg.lower() for arg in args[:2]]
+        if self.latency:
+            time.sleep(self.latency)
+        if self.loading(node):
+            return b"-LOADING Redis is loading the dataset in memory\r\n"
+        if command[:1] == [b"ping"]:
+            return b"+PONG\r\n"
+        if command[:1] == [b"auth"]:
+            return b"+OK\r\n"
+        if command[:1] == [b"echo"] and len(args) > 1:
+            return b"$%d\r\n%s\r\n" % (len(args[1]),args[1])
+        if command == [b"cluster",b"info"]:
+            return _bulk("cluster_state:ok\r\ncluster_slots_assigned:16384\r\ncluster_slots_ok:16384\r\ncluster_slots_fail:0\r\ncluster_known_nodes:{}\r\n".format(len(self.nodes)))
+        if command == [b"info",b"replication"]:
+            role,peer = self.role_of(node)
+            if role == "master":
+                lines = ["# Replication","role:master","connected_slaves:{}".format(int(peer is not None))]
+                if peer:
+                    lines.append("slave0:ip={},port={},state=online,offset={},lag=0".format(*peer,self.offset))
+                lines.append("master_repl_offset:{}".format(self.offset))
+            else:
+                lines = ["# Replication","role:slave","master_host:{}".format(peer[0]),"master_port:{}".format(peer[1]),
+                         "master_link_status:up","slave_repl_offset:{}".format(self.offset),"master_repl_offset:{}".format(self.offset)]
+            return _bulk("\r\n".join(lines)+"\r\n")
+        if command == [b"info",b"server"]:
+            return _bulk("# Server\r\nredis_version:7.0.0\r\nrun_id:{}\r\n".format(self.run_ids[node]))
+        if command[:2] == [b"cluster",b"failover"]:
+            return b"+OK\r\n" if self.failover(node) else b"-ERR You should send CLUSTER FAILOVER to a replica\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+def _bulk(text:str) -> bytes:
+    data = text.encode()
+    return b"$%d\r\n%s\r\n" % (len(data),data)
+
+
+class FakeRedisHandler(_Tracked):
+    redis = None
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        node = self.connection.getsockname()[:2] #the node address the client dialed
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            self.wfile.write(self.redis.reply(node,args))
+            self.wfile.flush()
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"): #inline command
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length+2)[:-2])
+        return args
+
+
+#--------------------Agent--------------------
+class FakeAgent(_Server):
+    """
+    The agent of every node, on host:port (0 : any free port; the master dials $AGENT_PORT).
+    Restarts are forwarded to the fake ES cluster or Redis server node the request names by its port;
+    configuration, manifest and sync calls are accepted. Each call waits 'latency' seconds and fails with
+    'failure_rate' probability (500), or always for the ips in 'failing'.
+    """
+    def __init__(self,port:int=0,es:FakeESCluster=None,redis:FakeRedis=None,latency:float=0,failure_rate:float=0,
+                 failing=(),version:str="1.0",config:dict=None,host:str=None):
+        self.es = es
+        self.redis = redis
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failing = set(failing)
+        self.version = version
+        self.config = config or {"maxmemory":"4gb","appendonly":"yes"}
+        self.calls = {}
+        self.lock = threading.Lock()
+        host = host or ("127.0.0.1" if loopback_only() else "0.0.0.0")
+        self.port = self._listen(ThreadingHTTPServer,type("Handler",(FakeAgentHandler,),{"agent":self}),host,port)
+
+    def record(self,path:str):
+        with self.lock:
+            self.calls[path] = self.calls.get(path,0)+1
+
+    def fails(self,ip:str) -> bool:
+        return ip in self.failing or (self.failure_rate and random.random() < self.failure_rate)
+
+
+class FakeAgentHandler(_JSONHandler):
+    agent = None
+
+    def _answer(self):
+        agent = self.agent
+        ip = self.connection.getsockname()[0]
+        path = urlsplit(self.path).path
+        body = self.body()
+        agent.record(path)
+        if agent.latency:
+            time.sleep(agent.latency)
+        if self.command == "GET" and path == "/":
+            return self.send({"version":agent.version})
+        if agent.fails(ip):
+            return self.send({"error":"injected failure"},500)
+        payload = json.loads(body) if body.startswith(b"{") else {}
+        if path == "/es/command/restart" and agent.es:
+            agent.es.restart((ip,int(payload["port"])))
+        elif path == "/redis/command/restart" and agent.redis:
+            agent.redis.restart((ip,int(payload["port"])))
+        elif path == "/redis/command/get_config":
+            return self.send(agent.config)
+        elif path == "/agent/command/manifest":
+            return self.send({"manifest":{}})
+        self.send({"result":"okay"})
+
+    do_GET = do_POST = _answer
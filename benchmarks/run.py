@@ -0,0 +1,275 @@
+######################################################################
+# Benchmarks of the core operations against the local fakes.
+#
+#   python -m benchmarks.run                         #10, 100 and 1000 nodes
+#   python -m benchmarks.run --sizes 10 --only es_cluster_health redis_health
+#   python -m benchmarks.run --compare benchmarks/results/<baseline>.json
+#
+# Results go to benchmarks/results/<timestamp>.json. With --compare, any
+# benchmark whose median got slower than --threshold times the baseline
+# is reported and the exit status is 1.
+#
+######################################################################
+
+from contextlib import redirect_stdout
+from datetime import datetime
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("AGENT_KEY","benchmark")
+os.environ.setdefault("AGENT_VERSION","1.0")
+os.environ.setdefault("SECRET_KEY","benchmark")
+os.environ.setdefault("ADMINS","[]")
+
+from .fakes import FakeESCluster,FakeRedis,FakeAgent
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__),"results")
+SIZES = (10,100,1000)
+ZONES = 10
+
+
+class Environment:
+    "Fake ES cluster, Redis nodes and agents for 'count' nodes, plus an app whose SOLUTION lists them."
+    def __init__(self,count:int,agent_latency:float=0,failure_rate:float=0):
+        self.count = count
+        self.es = FakeESCluster(count,zones=ZONES if count >= ZONES else 0)
+        self.redis = FakeRedis(count)
+        self.agent = FakeAgent(es=self.es,redis=self.redis,latency=agent_latency,failure_rate=failure_rate)
+        self._agent_port = os.environ.get("AGENT_PORT")
+        os.environ["AGENT_PORT"] = str(self.agent.port)
+        self._solution = os.environ.get("SOLUTION")
+        os.environ["SOLUTION"] = json.dumps({"ElasticSearch":{"bench-es":self.es.addresses},
+                                             "Redis":{"bench-redis":self.redis.addresses}})
+        from app import create_app
+        from app.topology import topology
+        topology.reload()
+        self.app = create_app("test")
+        self.app.config["WTF_CSRF_ENABLED"] = False
+
+    def close(self):
+        from app.topology import topology
+        for fake in (self.agent,self.es,self.redis):
+            fake.stop()
+        for name,value in (("SOLUTION",self._solution),("AGENT_PORT",self._agent_port)):
+            if value is None:
+                os.environ.pop(name,None)
+            else:
+                os.environ[name] = value
+        topology.reload()
+
+
+#--------------------Benchmarks--------------------
+#name -> (function(env) -> (ok, extra dict), repeats, largest size run by default)
+BENCHMARKS = {}
+
+
+def benchmark(name:str,repeats:int=3,max_nodes:int=None):
+    def decorator(func):
+        BENCHMARKS[name] = (func,repeats,max_nodes)
+        return func
+    return decorator
+
+
+@benchmark("es_cluster_health")
+def es_cluster_health(env):
+    from app.core_features.ES import Es
+    status = Es(env.es.addresses).ClusterHealthCheck()
+    return status == "green",{"status":status}
+
+
+@benchmark("redis_health")
+def redis_health(env):
+    from app.core_features.REDIS import Redis
+    status = Redis.cluster_status(Redis(env.redis.addresses).HealthReport())
+    return status == "green",{"status":status}
+
+
+@benchmark("redis_health_async")
+def redis_health_async(env):
+    "Every node probed at once from the bridge's event loop, up to ASYNC_MAX_PER_CLUSTER in flight."
+    from app.core_features.AIO import bridge
+    from app.core_features.REDIS import Redis
+    status = Redis.cluster_status(bridge.run(bridge.redis(env.redis.addresses).HealthReport()))
+    return status == "green",{"status":status}
+
+
+@benchmark("agent_scan_async")
+def agent_scan_async(env):
+    from app.core_features.AGENT import Agent
+    from app.core_features.AIO import bridge
+    from app.topology import agent_port
+    nodes = list(dict.fromkeys("http://{}:{}".format(ip,agent_port()) for ip,_ in env.redis.nodes))
+    reports = bridge.run(bridge.agents().scan(nodes))
+    return all(report["status"] == Agent.SYNC for report in reports),{}
+
+
+@benchmark("es_rolling_restart",repeats=1,max_nodes=100)
+def es_rolling_restart(env):
+    from app.core_features.ES import Es
+    es = Es(env.es.addresses)
+    ok = es.RollingRestart()
+    return ok,{"groups":len(es.groups)}
+
+
+@benchmark("es_batched_rolling_restart",repeats=1)
+def es_batched_rolling_restart(env):
+    from app.core_features.ES import Es
+    es = Es(env.es.addresses)
+    ok = es.RollingRestart(batched=True)
+    return ok,{"groups":len(es.groups)}
+
+
+@benchmark("redis_rolling_restart",repeats=1,max_nodes=100)
+def redis_rolling_restart(env):
+    from app.core_features.REDIS import Redis
+    return Redis(env.redis.addresses).RollingRestart(),{}
+
+
+@benchmark("redis_replica_first_rolling_restart",repeats=1)
+def redis_replica_first_rolling_restart(env):
+    from app.core_features.REDIS import Redis
+    redis = Redis(env.redis.addresses)
+    ok = redis.RollingRestart(replica_first=True)
+    return ok,{"waves":len(redis.waves)}
+
+
+@benchmark("es_set_configuration")
+def es_set_configuration(env):
+    "Every key to every node, as on the first push."
+    from app.core_features.ES import Es
+    ok,_ = Es(env.es.addresses).SetConfiguration({"indices.recovery.max_bytes_per_sec":"100mb"},force=True)
+    return ok,{}
+
+
+@benchmark("es_delta_set_configuration")
+def es_delta_set_configuration(env):
+    "One key of 50 changed since the last push : only that key is sent."
+    from app.core_features.ES import Es
+    from app.core_features.FINGERPRINTS import fingerprints
+    config = {"bench.setting.{}".format(i):"value" for i in range(50)}
+    es = Es(env.es.addresses)
+    for ip,port in es.nodes:
+        fingerprints.record("ElasticSearch",f"{ip}:{port}",config,replace=True)
+    config["bench.setting.0"] = str(time.perf_counter())
+    ok,_ = es.SetConfiguration(config)
+    return ok and all(report["keys"] == ["bench.setting.0"] for report in es.push_reports),{}
+
+
+@benchmark("redis_set_configuration")
+def redis_set_configuration(env):
+    from app.core_features.REDIS import Redis
+    ok,_ = Redis(env.redis.addresses).SetConfiguration({"maxmemory":"4gb"},force=True)
+    return ok,{}
+
+
+@benchmark("nodes_to_sync")
+def nodes_to_sync(env):
+    "Agent status of one cluster, then of every cluster, through the view. Probes are forced with 'fresh'."
+    with env.app.test_client() as client:
+        cluster = client.post("/nodes_to_sync",json={"cluster":"bench-es","fresh":True}).get_json()
+        everything = client.post("/nodes_to_sync",json={"all":True,"fresh":True}).get_json()
+    ok = all(status == 1 for _,status in cluster["sync"]) and len(everything["clusters"]) == 2
+    return ok,{}
+
+
+#--------------------Runner--------------------
+def run(sizes=SIZES,only=None,repeats=None,full=False,agent_latency:float=0,failure_rate:float=0,log=print) -> list:
+    from app.core_features.AGENTCLIENT import agent_client
+    names = [name for name in BENCHMARKS if not only or name in only]
+    results = []
+    for count in sizes:
+        env = Environment(count,agent_latency,failure_rate)
+        try:
+            for name in names:
+                func,default_repeats,max_nodes = BENCHMARKS[name]
+                if max_nodes and count > max_nodes and not full:
+                    log("{:<36} {:>5} nodes  skipped (over {} nodes, see --full)".format(name,count,max_nodes))
+                    continue
+                runs,ok,extra = [],True,{}
+                for _ in range(repeats or default_repeats):
+                    agent_client.close()
+                    start = time.perf_counter()
+                    try:
+                        with redirect_stdout(io.StringIO()): #the progress prints of the core features
+                            passed,extra = func(env)
+                    except Exception as e:
+                        passed,extra = False,{"error":str(e)}
+                    runs.append(round(time.perf_counter()-start,4))
+                    ok = ok and passed
+                stats = agent_client.stats()
+                extra.update(agent_requests=stats["requests"],agent_connections=stats["connections"])
+                result = {"name":name,"nodes":count,"ok":ok,"runs":runs,
+                          "median_s":round(statistics.median(runs),4),"min_s":min(runs),**extra}
+                results.append(result)
+                log("{:<36} {:>5} nodes  {:>9.4f}s  {}".format(name,count,result["median_s"],"ok" if ok else "FAILED"))
+        finally:
+            env.close()
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git","rev-parse","--short","HEAD"],cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+
+def save(results:list,directory:str=RESULTS_DIR) -> str:
+    os.makedirs(directory,exist_ok=True)
+    now = datetime.utcnow()
+    path = os.path.join(directory,now.strftime("%Y%m%d-%H%M%S")+".json")
+    with open(path,"w") as f:
+        json.dump({"timestamp":now.isoformat(timespec="seconds")+"Z","revision":_git_revision(),
+                   "python":platform.python_version(),"platform":platform.platform(),"results":results},f,indent=2)
+    return path
+
+
+def compare(results:list,baseline:dict,threshold:float) -> list:
+    "Benchmarks whose median is more than 'threshold' times the baseline's (or that stopped passing)."
+    before = {(r["name"],r["nodes"]):r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = before.get((result["name"],result["nodes"]))
+        if old is None:
+            continue
+        ratio = result["median_s"]/old["median_s"] if old["median_s"] else 1
+        if ratio > threshold or (old["ok"] and not result["ok"]):
+            regressions.append(dict(result,baseline_s=old["median_s"],ratio=round(ratio,2)))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark core operations against local fake ES, Redis and agents.")
+    parser.add_argument("--sizes",type=int,nargs="+",default=list(SIZES))
+    parser.add_argument("--only",nargs="+",choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeats",type=int,help="runs per benchmark, the median is reported")
+    parser.add_argument("--full",action="store_true",help="run the rolling restarts at every size too")
+    parser.add_argument("--agent-latency",type=float,default=0,help="seconds added to every agent call")
+    parser.add_argument("--failure-rate",type=float,default=0,help="probability of an agent call failing")
+    parser.add_argument("--output",default=RESULTS_DIR)
+    parser.add_argument("--compare",help="baseline result file")
+    parser.add_argument("--threshold",type=float,default=1.25)
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes,args.only,args.repeats,args.full,args.agent_latency,args.failure_rate)
+    print("Results written to {}".format(save(results,args.output)))
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results,json.load(f),args.threshold)
+        for r in regressions:
+            print("[REGRESSION] {} at {} nodes : {}s -> {}s (x{})".format(r["name"],r["nodes"],r["baseline_s"],r["median_s"],r["ratio"]))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,51 @@ class Config:
     #DB
     SQLALCHEMY_TRACK_MODIFICATIONS=False 
 
+    #Background jobs (rolling restarts...)
+    JOB_WORKERS=int(os.getenv("JOB_WORKERS",4))
+    JOB_HISTORY=int(os.getenv("JOB_HISTORY",1000))
+
+    #User.last_seen write-behind : skip updates within the window, flush every interval (seconds)
+    LAST_SEEN_WINDOW=int(os.getenv("LAST_SEEN_WINDOW",60))
+    LAST_SEEN_FLUSH_INTERVAL=int(os.getenv("LAST_SEEN_FLUSH_INTERVAL",30))
+
+    #Cache of users and their roles for login_manager.user_loader
+    USER_CACHE_TTL=int(os.getenv("USER_CACHE_TTL",60))
+    USER_CACHE_SIZE=int(os.getenv("USER_CACHE_SIZE",1024))
+
+    #Shared HTTP client for master -> agent requests (seconds)
+    AGENT_CONNECT_TIMEOUT=float(os.getenv("AGENT_CONNECT_TIMEOUT",3))
+    AGENT_READ_TIMEOUT=float(os.getenv("AGENT_READ_TIMEOUT",30))
+    AGENT_RETRIES=int(os.getenv("AGENT_RETRIES",2)) #idempotent requests only
+    AGENT_RETRY_BACKOFF=float(os.getenv("AGENT_RETRY_BACKOFF",0.2))
+    AGENT_MAX_IN_FLIGHT=int(os.getenv("AGENT_MAX_IN_FLIGHT",8)) #per agent, also the keep-alive pool size
+    AGENT_POOL_HOSTS=int(os.getenv("AGENT_POOL_HOSTS",256))
+    AGENT_SCAN_WORKERS=int(os.getenv("AGENT_SCAN_WORKERS",32)) #version scans : requests in flight
+    AGENT_SCAN_DEADLINE=float(os.getenv("AGENT_SCAN_DEADLINE",10)) #seconds for a whole scan
+
+    #asyncio clients (health probes, agent scans) : requests in flight per cluster, seconds a probe or scan may take
+    ASYNC_MAX_PER_CLUSTER=int(os.getenv("ASYNC_MAX_PER_CLUSTER",256))
+    ASYNC_RUN_TIMEOUT=float(os.getenv("ASYNC_RUN_TIMEOUT",60))
+
+    #Background health poller : every cluster and agent, every interval (+/- jitter ratio) seconds
+    HEALTH_POLL_ENABLED=True
+    HEALTH_POLL_INTERVAL=float(os.getenv("HEALTH_POLL_INTERVAL",30))
+    HEALTH_POLL_JITTER=float(os.getenv("HEALTH_POLL_JITTER",0.2))
+    HEALTH_POLL_WORKERS=int(os.getenv("HEALTH_POLL_WORKERS",8))
+    HEALTH_MAX_AGE=float(os.getenv("HEALTH_MAX_AGE",0)) #seconds before a snapshot is stale, 0 : 3 intervals
+
+    #Configuration templates under app/solutions/ : seconds between checks of their mtime
+    CONFIG_TEMPLATE_CHECK_INTERVAL=float(os.getenv("CONFIG_TEMPLATE_CHECK_INTERVAL",5))
+
+    #Progress events of jobs (/jobs/<id>/events) : events kept per job, jobs kept, seconds between keep-alives
+    PROGRESS_BUFFER=int(os.getenv("PROGRESS_BUFFER",500))
+    PROGRESS_CHANNELS=int(os.getenv("PROGRESS_CHANNELS",100))
+    PROGRESS_KEEPALIVE=float(os.getenv("PROGRESS_KEEPALIVE",15))
+    PROGRESS_STREAM_TIMEOUT=float(os.getenv("PROGRESS_STREAM_TIMEOUT",300)) #seconds a stream stays open, EventSource then reconnects
+
+    #Bearer token of the Prometheus scrapers on /metrics (otherwise administrators only)
+    METRICS_TOKEN=os.getenv("METRICS_TOKEN")
+
     #session management
     #PERMANENT_SESSION_LIFETIME=timedelta(minutes=1)
 
@@ -33,6 +78,7 @@ class DevelopmentConfig(Config):
     
 class TestingConfig(Config):
     TESTING=True
+    HEALTH_POLL_ENABLED=False #probe on demand only
     SQLALCHEMY_DATABASE_URI=os.environ.get("TEST_DATABASE_URL") or\
         "sqlite://"
     #In memory
@@ -0,0 +1,90 @@
+import unittest
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from app.core_features.AGENT import Agent,AgentBundle
+
+
+class FakeAgentHandler(BaseHTTPRequestHandler):
+    delay = 0
+    version = "1.0"
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = json.dumps({"version":self.version}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,*args):
+        pass
+
+
+class AgentScanTestCase(unittest.TestCase):
+    def setUp(self):
+        os.environ["AGENT_VERSION"] = "1.0"
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def agent(self,delay=0,version="1.0"):
+        handler = type("Handler",(FakeAgentHandler,),{"delay":delay,"version":version})
+        server = ThreadingHTTPServer(("127.0.0.1",0),handler)
+        threading.Thread(target=server.serve_forever,daemon=True).start()
+        self.servers.append(server)
+        return "http://127.0.0.1:{}".format(server.server_address[1])
+
+    def test_status_per_node(self):
+        nodes = [self.agent(),self.agent(version="0.9"),"http://127.0.0.1:1"]
+        reports = Agent.scan(nodes)
+        self.assertEqual([r["status"] for r in reports],[Agent.SYNC,Agent.UNSYNC,Agent.FAILURE])
+        self.assertEqual(reports[1]["version"],"0.9")
+        self.assertIsNotNone(reports[2]["error"])
+
+    def test_timeout_is_a_failure(self):
+        node = self.agent(delay=1)
+        self.assertEqual(Agent.sync_status(node,timeout=0.2),(node,Agent.FAILURE))
+
+    def test_scan_is_concurrent_and_bounded_by_deadline(self):
+        nodes = [self.agent(delay=0.5) for _ in range(6)]+[self.agent(delay=5)]
+        start = time.perf_counter()
+        reports = Agent.scan(nodes,timeout=10,deadline=1.5)
+        self.assertLess(time.perf_counter()-start,2.5)
+        self.assertEqual([r["status"] for r in reports],[Agent.SYNC]*6+[Agent.FAILURE])
+
+
+class AgentBundleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.write("agent.py",b"print('agent')")
+        self.write("requirements.txt",b"flask")
+        self.bundle = AgentBundle(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self,name,data):
+        with open(os.path.join(self.dir.name,name),"wb") as f:
+            f.write(data)
+
+    def test_bundle_is_cached(self):
+        files,manifest = self.bundle.load()
+        self.assertEqual(files["agent.py"],b"print('agent')")
+        self.assertEqual(set(manifest),{"agent.py","requirements.txt"})
+        self.bundle.load()
+        self.assertEqual(self.bundle.builds,1)
+
+    def test_bundle_is_rebuilt_on_change(self):
+        _,before = self.bundle.load()
+        self.write("agent.py",b"print('agent v2')")
+        _,after = self.bundle.load()
+        self.assertEqual(self.bundle.builds,2)
+        self.assertEqual(Agent.changed_files(after,before),["agent.py"])
+        self.assertEqual(Agent.changed_files(after,after),[])
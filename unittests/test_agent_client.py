@@ -0,0 +1,86 @@
+import unittest
+import threading
+import time
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from app.core_features.AGENTCLIENT import AgentClient
+
+
+class FakeAgentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" #keep-alive
+    failures = 0
+    delay = 0
+
+    def _answer(self):
+        if self.headers.get("Content-Length"):
+            self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            server.hits += 1
+            server.in_flight += 1
+            server.peak = max(server.peak,server.in_flight)
+            fail = server.hits <= self.failures
+        time.sleep(self.delay)
+        with server.lock:
+            server.in_flight -= 1
+        self.send_response(503 if fail else 200)
+        self.send_header("Content-Length","2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    do_GET = do_POST = _answer
+
+    def log_message(self,*args):
+        pass
+
+
+class AgentClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = AgentClient()
+        self.client.backoff = 0.01
+        self.servers = []
+
+    def tearDown(self):
+        self.client.close()
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def agent(self,failures=0,delay=0):
+        handler = type("Handler",(FakeAgentHandler,),{"failures":failures,"delay":delay})
+        server = ThreadingHTTPServer(("127.0.0.1",0),handler)
+        server.lock = threading.Lock()
+        server.hits = server.in_flight = server.peak = 0
+        threading.Thread(target=server.serve_forever,daemon=True).start()
+        self.servers.append(server)
+        return server,"http://127.0.0.1:{}".format(server.server_address[1])
+
+    def test_connections_are_reused(self):
+        _,url = self.agent()
+        for _ in range(10):
+            self.assertTrue(self.client.get(url+"/").ok)
+        stats = self.client.stats()
+        self.assertEqual(stats["requests"],10)
+        self.assertEqual(stats["connections"],1)
+        self.assertEqual(stats["reuse_ratio"],0.9)
+
+    def test_idempotent_calls_are_retried(self):
+        server,url = self.agent(failures=2)
+        self.assertTrue(self.client.get(url+"/").ok)
+        self.assertEqual(server.hits,3)
+
+    def test_post_is_not_retried_by_default(self):
+        server,url = self.agent(failures=1)
+        self.assertEqual(self.client.post(url+"/es/command/restart",json={}).status_code,503)
+        self.assertEqual(server.hits,1)
+        self.assertTrue(self.client.post(url+"/redis/command/get_config",json={},idempotent=True).ok)
+
+    def test_in_flight_requests_are_capped_per_agent(self):
+        self.client.max_in_flight = 2
+        server,url = self.agent(delay=0.1)
+        threads = [threading.Thread(target=self.client.get,args=(url+"/",)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(server.hits,6)
+        self.assertLessEqual(server.peak,2)
@@ -0,0 +1,187 @@
+import unittest
+import asyncio
+from unittest import mock
+import os
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from app.core_features.AIO import AsyncBridge,AsyncHTTPClient,AsyncEs,AsyncRedis,AsyncAgent
+from app.core_features.AGENT import Agent
+from app.core_features.ES import Es
+from app.core_features.REDIS import Redis
+from app.topology import agent_port
+from benchmarks.fakes import FakeESCluster,FakeRedis,FakeAgent
+
+
+class ChunkedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    paths = []
+
+    def do_GET(self):
+        ChunkedHandler.paths.append(self.path)
+        self.send_response(200)
+        if self.path == "/chunked":
+            self.send_header("Transfer-Encoding","chunked")
+            self.end_headers()
+            for chunk in (b'{"a":',b'1}'):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk),chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length","2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+    def log_message(self,*args):
+        pass
+
+
+class AsyncHTTPClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1",0),ChunkedHandler)
+        threading.Thread(target=self.server.serve_forever,daemon=True).start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive_and_chunked_bodies(self):
+        async def main():
+            http = AsyncHTTPClient()
+            first = await http.request("GET","127.0.0.1",self.port,"/")
+            second = await http.request("GET","127.0.0.1",self.port,"/chunked")
+            await http.close()
+            return first,second,http.stats
+        first,second,stats = asyncio.run(main())
+        self.assertEqual(first.body,b"{}")
+        self.assertEqual(second.body,b'{"a":1}')
+        self.assertEqual((stats["created"],stats["reused"]),(1,1))
+
+    def test_post_is_not_sent_again_on_a_dropped_connection(self):
+        listener = socket.create_server(("127.0.0.1",0))
+        received = []
+        def serve():
+            conn,_ = listener.accept()
+            with conn:
+                reader = conn.makefile("rb")
+                for _ in range(2):
+                    request = reader.readline().decode()
+                    while reader.readline() not in (b"\r\n",b""):
+                        pass
+                    received.append(request.split()[0])
+                    if request.startswith("GET"):
+                        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+                #the POST was read, and the connection is closed without an answer
+                conn.shutdown(socket.SHUT_RDWR)
+            conn,_ = listener.accept() #a replay would land here
+            with conn:
+                received.append(conn.recv(65536).split(b" ")[0].decode())
+                conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+        threading.Thread(target=serve,daemon=True).start()
+        port = listener.getsockname()[1]
+        async def main():
+            http = AsyncHTTPClient()
+            try:
+                await http.request("GET","127.0.0.1",port,"/")
+                with self.assertRaises(ConnectionError):
+                    await http.request("POST","127.0.0.1",port,"/redis/command/restart",body=b"{}")
+            finally:
+                await http.close()
+        try:
+            asyncio.run(main())
+            time.sleep(0.1)
+            self.assertEqual(received,["GET","POST"])
+        finally:
+            listener.close()
+
+    def test_agent_request_keeps_the_query_string(self):
+        async def main():
+            agent = AsyncAgent(http=AsyncHTTPClient())
+            await agent.request("GET","http://127.0.0.1:{}/es/info?pretty=true".format(self.port))
+            await agent.http.close()
+        asyncio.run(main())
+        self.assertEqual(ChunkedHandler.paths[-1],"/es/info?pretty=true")
+
+
+class AsyncOperationsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.es = FakeESCluster(3,loopback=True)
+        cls.redis = FakeRedis(4,loopback=True)
+        cls.agent = FakeAgent(es=cls.es,redis=cls.redis,host="127.0.0.1")
+        cls.environ = mock.patch.dict(os.environ,{"AGENT_VERSION":"1.0","AGENT_PORT":str(cls.agent.port)})
+        cls.environ.start()
+        cls.bridge = AsyncBridge()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bridge.close()
+        for fake in (cls.agent,cls.es,cls.redis):
+            fake.stop()
+        cls.environ.stop()
+
+    def tearDown(self):
+        Es._versions.clear()
+
+    def test_redis_report_matches_the_threaded_one(self):
+        reports = self.bridge.run(self.bridge.redis(self.redis.addresses).HealthReport())
+        expected = Redis(self.redis.addresses).HealthReport()
+        timings = ("connect_ms","rtt_ms")
+        self.assertEqual([{k:v for k,v in r.items() if k not in timings} for r in reports],
+                         [{k:v for k,v in r.items() if k not in timings} for r in expected])
+        self.assertTrue(self.bridge.run(self.bridge.redis(self.redis.addresses).ClusterHealthCheck()))
+
+    def test_es_health_and_configuration(self):
+        es = self.bridge.es(self.es.addresses)
+        self.assertEqual(self.bridge.run(es.ClusterHealthCheck()),"green")
+        self.assertEqual(self.bridge.run(es.Configuration()),Es(self.es.addresses).Configuration)
+        down = AsyncEs(["127.0.0.1:1"])
+        self.assertNotEqual(asyncio.run(down.ClusterHealthCheck()),"green")
+
+    def test_agent_scan_matches_the_threaded_one(self):
+        nodes = ["http://127.0.0.1:{}".format(agent_port()),"http://localhost:{}".format(agent_port()),"http://127.0.0.1:1"]
+        reports = self.bridge.run(self.bridge.agents().scan(nodes))
+        self.assertEqual([r["status"] for r in reports],[r["status"] for r in Agent.scan(nodes)])
+        self.assertEqual([r["status"] for r in reports],[Agent.SYNC]*2+[Agent.FAILURE])
+
+    def test_concurrency_is_capped_per_cluster(self):
+        running,peak = 0,0
+        async def probe(node):
+            nonlocal running,peak
+            async with redis.limit:
+                running += 1
+                peak = max(peak,running)
+                await asyncio.sleep(0.01)
+                running -= 1
+            return Redis._new_report(node)
+        bridge = AsyncBridge()
+        bridge.max_per_cluster = 3
+        try:
+            redis = bridge.redis(["10.0.0.{}:6379".format(i) for i in range(20)])
+            redis._probe = probe
+            self.assertEqual(len(bridge.run(redis.HealthReport())),20)
+            self.assertEqual(peak,3)
+        finally:
+            bridge.close()
+
+    def test_run_timeout_cancels(self):
+        with self.assertRaises(Exception):
+            self.bridge.run(asyncio.sleep(5),timeout=0.1)
+        self.assertEqual(self.bridge.run(asyncio.sleep(0,result=1)),1)
+
+    def test_close_cancels_pending_runs(self):
+        bridge = AsyncBridge()
+        outcome = []
+        def wait():
+            try:
+                bridge.run(asyncio.sleep(30))
+            except BaseException as e:
+                outcome.append(type(e))
+        waiting = threading.Thread(target=wait)
+        waiting.start()
+        time.sleep(0.1)
+        bridge.close()
+        waiting.join(5)
+        self.assertFalse(waiting.is_alive())
+        self.assertEqual(len(outcome),1)
@@ -0,0 +1,17 @@
+import unittest
+from benchmarks import run
+
+
+class BenchmarkSmokeTestCase(unittest.TestCase):
+    "Keeps the benchmark suite and its fakes working; the timings themselves are not checked."
+    def test_fast_benchmarks_pass_on_a_small_cluster(self):
+        only = ["es_cluster_health","redis_health","redis_health_async","agent_scan_async","es_set_configuration","es_delta_set_configuration","redis_set_configuration","nodes_to_sync"]
+        results = run.run(sizes=[3],only=only,repeats=1,log=lambda *args: None)
+        self.assertEqual([r["name"] for r in results],only)
+        self.assertTrue(all(r["ok"] for r in results),results)
+
+    def test_compare_flags_regressions(self):
+        baseline = {"results":[{"name":"redis_health","nodes":10,"median_s":0.1,"ok":True}]}
+        current = [{"name":"redis_health","nodes":10,"median_s":0.2,"ok":True}]
+        self.assertEqual(run.compare(current,baseline,1.25)[0]["ratio"],2.0)
+        self.assertEqual(run.compare(current,baseline,3),[])
@@ -0,0 +1,128 @@
+import unittest
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from app.core_features.INTERFACE import Interface
+from app.core_features.FINGERPRINTS import fingerprints
+
+
+class FakeAgentHandler(BaseHTTPRequestHandler):
+    stage_status = 200
+    delay = 0
+
+    def do_POST(self):
+        time.sleep(self.delay)
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.calls.append(self.path.rsplit("/",1)[-1])
+        self.server.bodies.append(json.loads(body))
+        status = self.stage_status if self.path.endswith("/stage") else 200
+        self.send_response(status)
+        self.send_header("Content-Length","0")
+        self.end_headers()
+
+    def log_message(self,*args):
+        pass
+
+
+class ConfigPushTestCase(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+        fingerprints.forget("Test")
+
+    def tearDown(self):
+        fingerprints.forget("Test")
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def agent(self,stage_status=200,delay=0):
+        handler = type("Handler",(FakeAgentHandler,),{"stage_status":stage_status,"delay":delay})
+        server = ThreadingHTTPServer(("127.0.0.1",0),handler)
+        server.calls = []
+        server.bodies = []
+        threading.Thread(target=server.serve_forever,daemon=True).start()
+        self.servers.append(server)
+        return ("node{}".format(len(self.servers)),
+                "http://127.0.0.1:{}/es/command/configuration".format(server.server_address[1]),{"data":{}})
+
+    def test_commit_after_every_node_staged(self):
+        targets = [self.agent() for _ in range(3)]
+        reports = Interface.two_phase_push(targets)
+        self.assertEqual([r["commit"] for r in reports],["ok"]*3)
+        self.assertEqual(Interface.push_result(reports),(True,0))
+        self.assertEqual([s.calls for s in self.servers],[["stage","commit"]]*3)
+
+    def test_rejected_stage_aborts_everywhere(self):
+        targets = [self.agent(),self.agent(stage_status=400),self.agent()]
+        reports = Interface.two_phase_push(targets)
+        self.assertEqual([r["commit"] for r in reports],["aborted","skipped","aborted"])
+        self.assertEqual([s.calls for s in self.servers],[["stage","abort"],["stage"],["stage","abort"]])
+        ok,errors = Interface.push_result(reports)
+        self.assertFalse(ok)
+        self.assertIn("node2",errors[0])
+
+    def test_unreachable_node_blocks_commit(self):
+        targets = [self.agent(),("down","http://127.0.0.1:1/es/command/configuration",{})]
+        reports = Interface.two_phase_push(targets)
+        self.assertEqual(reports[0]["commit"],"aborted")
+        self.assertEqual(reports[1]["stage"],"failed")
+
+    def test_legacy_agent_gets_one_shot_push(self):
+        targets = [self.agent(stage_status=404)]
+        reports = Interface.two_phase_push(targets)
+        self.assertTrue(reports[0]["legacy"])
+        self.assertEqual(self.servers[0].calls,["stage","configuration"])
+
+    def test_nodes_are_pushed_concurrently(self):
+        targets = [self.agent(delay=0.3) for _ in range(8)]
+        start = time.perf_counter()
+        Interface.two_phase_push(targets)
+        self.assertLess(time.perf_counter()-start,1.5)
+
+    def test_delta_push_sends_changed_keys_only(self):
+        targets = [self.agent()[:2]+({"token":"t"},) for _ in range(2)]
+        Interface.delta_push("Test",targets,{"a":1,"b":2})
+        self.assertEqual([s.bodies[-1]["data"] for s in self.servers],[{"a":1,"b":2}]*2)
+        reports = Interface.delta_push("Test",targets,{"a":1,"b":3})
+        self.assertEqual([r["keys"] for r in reports],[["b"]]*2)
+        self.assertEqual([s.bodies[-1] for s in self.servers],[{"token":"t","data":{"b":3},"delta":True}]*2)
+        calls = [len(s.calls) for s in self.servers]
+        reports = Interface.delta_push("Test",targets,{"a":1,"b":3})
+        self.assertEqual([r["commit"] for r in reports],["unchanged"]*2)
+        self.assertEqual([len(s.calls) for s in self.servers],calls)
+        self.assertEqual(Interface.push_result(reports),(True,0))
+        Interface.delta_push("Test",targets,{"a":1,"b":3},force=True)
+        self.assertEqual([s.bodies[-1]["data"] for s in self.servers],[{"a":1,"b":3}]*2)
+
+    def test_dry_run_sends_nothing(self):
+        targets = [self.agent()[:2]+({},)]
+        fingerprints.record("Test","node1",{"a":1})
+        reports = Interface.delta_push("Test",targets,{"a":1,"b":2},dry_run=True)
+        self.assertEqual((reports[0]["commit"],reports[0]["keys"]),("planned",["b"]))
+        self.assertEqual(self.servers[0].calls,[])
+        self.assertEqual(fingerprints.get("Test","node1"),{"a":fingerprints.value_hash(1)})
+
+    def test_legacy_agent_gets_whole_config(self):
+        targets = [self.agent(stage_status=404)[:2]+({},)]
+        fingerprints.record("Test","node1",{"a":1})
+        Interface.delta_push("Test",targets,{"a":1,"b":2})
+        self.assertEqual(self.servers[0].bodies[-1],{"data":{"a":1,"b":2}})
+
+    def test_failed_push_is_not_recorded(self):
+        targets = [self.agent()[:2]+({},),self.agent(stage_status=400)[:2]+({},)]
+        Interface.delta_push("Test",targets,{"a":1})
+        self.assertEqual(fingerprints.get("Test","node1"),{})
+        self.assertEqual(Interface.delta_push("Test",targets,{"a":1},dry_run=True)[0]["keys"],["a"])
+
+    def test_removed_key_replaces_the_whole_file(self):
+        targets = [self.agent()[:2]+({"token":"t"},) for _ in range(2)]
+        Interface.delta_push("Test",targets,{"a":1,"b":2})
+        plan = Interface.delta_push("Test",targets,{"a":1},dry_run=True)
+        self.assertEqual([(r["commit"],r["removed"]) for r in plan],[("planned",["b"])]*2)
+        reports = Interface.delta_push("Test",targets,{"a":1})
+        self.assertEqual([r["commit"] for r in reports],["ok"]*2)
+        self.assertEqual([s.bodies[-1] for s in self.servers],[{"token":"t","data":{"a":1},"delta":False}]*2)
+        self.assertEqual(fingerprints.get("Test","node1"),{"a":fingerprints.value_hash(1)})
+        #b is gone for good : the next push of the same config changes nothing
+        self.assertEqual([r["commit"] for r in Interface.delta_push("Test",targets,{"a":1})],["unchanged"]*2)
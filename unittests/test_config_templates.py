@@ -0,0 +1,69 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from app.core_features.TEMPLATES import ConfigTemplates,config_templates,flatten
+from app.core_features.ES import Es
+
+
+class ConfigTemplatesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root,"elasticsearch"))
+        self.path = os.path.join(self.root,"elasticsearch","elasticsearch7.yml")
+        self.write("cluster:\n  name: test\nnode.roles: [data, master]\n")
+        self.templates = ConfigTemplates(self.root)
+        self.templates.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        Es._versions.clear()
+
+    def write(self,text,mtime=None):
+        with open(self.path,"w") as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(self.path,(mtime,mtime))
+
+    def test_flatten_matches_recursive_keys(self):
+        self.assertEqual(flatten({"a":{"b":{"c":1},"d":2},"e":3}),{"a.b.c":1,"a.d":2,"e":3})
+        self.assertEqual(Es.flatten_dict({"a":{"b":1}},"x"),{"x.a.b":1})
+
+    def test_flatten_keeps_the_order_of_the_file(self):
+        nested = {"xpack":{"security":{"enabled":True,"http":{"ssl":{"enabled":True}},"audit":False}},"path":{"data":"/d"}}
+        self.assertEqual(list(flatten(nested)),["xpack.security.enabled","xpack.security.http.ssl.enabled",
+                                                "xpack.security.audit","path.data"])
+
+    def test_template_is_flat_and_read_only(self):
+        data = self.templates.get("elasticsearch",7)
+        self.assertEqual(dict(data),{"cluster.name":"test","node.roles":("data","master")})
+        with self.assertRaises(TypeError):
+            data["cluster.name"] = "other"
+        self.assertIs(self.templates.get("elasticsearch","7"),data)
+        with self.assertRaises(LookupError):
+            self.templates.get("elasticsearch",6)
+
+    def test_changed_file_is_parsed_again(self):
+        self.templates.check_interval = 0
+        first = self.templates.get("elasticsearch",7)
+        self.write("cluster.name: renamed\n",mtime=os.stat(self.path).st_mtime+10)
+        self.assertEqual(dict(self.templates.get("elasticsearch",7)),{"cluster.name":"renamed"})
+        self.assertEqual(first["cluster.name"],"test")
+
+    def test_shipped_templates_are_loaded(self):
+        config_templates.load()
+        self.assertIn(7,config_templates.versions("elasticsearch"))
+        self.assertIn("cluster.name",config_templates.get("elasticsearch",8))
+
+    def test_version_is_asked_once_per_ttl(self):
+        es = Es(["127.0.0.1:9200"])
+        with mock.patch.object(Es,"es_con",return_value={"number":"8.6.2"}) as es_con:
+            first = es.Configuration
+            second = Es(["127.0.0.1:9200"]).Configuration
+        self.assertEqual(es_con.call_count,1)
+        self.assertEqual(first,second)
+        first["cluster.name"] = "changed" #a copy, the cache is untouched
+        self.assertNotEqual(config_templates.get("elasticsearch",8)["cluster.name"],"changed")
+        with mock.patch.object(Es,"es_con",side_effect=ConnectionError("down")):
+            self.assertIsInstance(Es(["127.0.0.2:9200"]).Configuration,ConnectionError)
@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+from app.core_features.ES import Es
+
+
+def settings(name,**extra):
+    base = {"cluster.name":"vertical-cluster","node.name":name,"path.home":"/usr/share/elasticsearch",
+            "node.roles":["master","data","ingest"],"http.port":"9200","http.cors.enabled":"true",
+            "xpack.security.enabled":"true"}
+    base.update(extra)
+    return {"name":name,"settings":base}
+
+
+class FakeSettingsEs(Es):
+    def __init__(self,nodes_body):
+        super().__init__(["127.0.0.1:9200"])
+        self.nodes_body = nodes_body
+        self.paths = []
+
+    def version(self):
+        return "8.6.2"
+
+    def es_json(self,path,timeout=None):
+        self.paths.append(path)
+        return {"nodes":self.nodes_body}
+
+
+class EsLiveConfigurationTestCase(unittest.TestCase):
+    def test_one_call_and_only_deltas(self):
+        es = FakeSettingsEs({
+            "a":settings("es-1"),
+            "b":settings("es-2"),
+            "c":settings("es-3",**{"http.port":"9201","indices.memory.index_buffer_size":"20%"}),
+        })
+        report = es.LiveConfigurationReport()
+        self.assertEqual(len(es.paths),1)
+        self.assertTrue(es.paths[0].startswith("/_nodes/settings"))
+        self.assertEqual(report["nodes"],3)
+        self.assertEqual([len(group["nodes"]) for group in report["groups"]],[2,1])
+        self.assertEqual(report["data"]["http.port"],"9200")
+        self.assertEqual(report["drift"]["http.port"],{"es-3":"9201"})
+        self.assertEqual(report["drift"]["indices.memory.index_buffer_size"],{"es-1":None,"es-2":None})
+        self.assertEqual(report["data"]["indices.memory.index_buffer_size"],"20%") #the only value set
+        #set in the template, on no node
+        self.assertEqual(report["drift"]["transport.port"],{"es-1":None,"es-2":None,"es-3":None})
+        for key in ("cluster.name","node.roles","node.name","http.cors.enabled","xpack.security.enabled"):
+            self.assertNotIn(key,report["data"])
+
+    def test_node_attributes_and_placeholders_are_not_drift(self):
+        def node(name,memory,seeds):
+            #as _nodes/settings answers on a real 8.x cluster
+            return settings(name,**{"cluster.name":"prod-search","path.logs":"/var/log/"+name,"network.host":"10.0.0."+name[-1],
+                                    "node.attr.ml.machine_memory":memory,"node.attr.ml.max_jvm_size":"4294967296",
+                                    "node.attr.xpack.installed":"true","node.attr.transform.node":"true",
+                                    "discovery.seed_hosts":seeds,"cluster.initial_master_nodes":["es-1","es-2","es-3"]})
+        seeds = ["10.0.0.1","10.0.0.2","10.0.0.3"]
+        es = FakeSettingsEs({"a":node("es-1","16496680960",seeds),"b":node("es-2","16496685056",seeds),
+                             "c":node("es-3","33284112384",seeds[:2])})
+        report = es.LiveConfigurationReport()
+        self.assertEqual([len(group["nodes"]) for group in report["groups"]],[2,1]) #only the seed hosts differ
+        self.assertFalse([key for key in report["data"] if key.startswith(("node.attr.","path.","network.host"))])
+        for key in ("cluster.name","cluster.initial_master_nodes"):
+            self.assertNotIn(key,report["data"])
+        self.assertEqual(report["data"]["discovery.seed_hosts"],seeds) #what most nodes have, not the template's
+        self.assertEqual(report["drift"]["discovery.seed_hosts"],{"es-3":seeds[:2]})
+
+    def test_normalize_settings(self):
+        self.assertEqual(Es.normalize_settings({"a":True,"b":9200,"c.0":"x","c.1":"y","node.name":"n",
+                                                "node.attr.zone":"a","path.repo.0":"/backup"}),
+                         {"a":"true","b":"9200","c":["x","y"]})
+
+    def test_handler_returns_deltas(self):
+        from app import create_app
+        from app.main.executions import es_live_configuration
+        es = FakeSettingsEs({"a":settings("es-1"),"b":settings("es-2",**{"http.port":"9201"})})
+        app = create_app("test")
+        with app.test_request_context():
+            with mock.patch("app.main.executions.flash"):
+                body = es_live_configuration(es,{"cluster":"search"}).get_json()
+        self.assertEqual(body["task"],"Configuration")
+        self.assertEqual(body["drift"]["http.port"],{"es-2":"9201"})
+        self.assertNotIn("cluster.name",body["data"])
@@ -0,0 +1,120 @@
+import unittest
+import time
+from unittest import mock
+from app.core_features.ES import Es
+
+
+class RestartGroupsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.a1,self.a2,self.b1,self.b2,self.c1 = [("10.0.0.{}".format(i),9200) for i in range(1,6)]
+        self.nodes = [self.a1,self.b1,self.a2,self.b2,self.c1]
+        self.zone_of = {self.a1:("a",),self.a2:("a",),self.b1:("b",),self.b2:("b",),self.c1:("c",)}
+
+    def test_one_batch_per_zone_when_replicas_span_zones(self):
+        copies = [{self.a1,self.b1},{self.a2,self.c1},{self.b2,self.a1}]
+        groups = Es.plan_groups(self.nodes,self.zone_of,copies)
+        self.assertEqual(groups,[[self.a1,self.a2],[self.b1,self.b2],[self.c1]])
+
+    def test_zone_holding_every_copy_is_split(self):
+        copies = [{self.a1,self.a2},{self.b1,self.c1}]
+        groups = Es.plan_groups(self.nodes,self.zone_of,copies)
+        self.assertEqual(groups,[[self.a1],[self.a2],[self.b1,self.b2],[self.c1]])
+        for group in groups:
+            for holders in copies:
+                self.assertFalse(holders <= set(group))
+
+    def test_nodes_without_zone_are_alone(self):
+        groups = Es.plan_groups(self.nodes,{},[])
+        self.assertEqual(groups,[[node] for node in self.nodes])
+
+
+class FakeCluster:
+    """
+    es_json of a cluster of 'count' nodes published at 'published' (defaults to the configured addresses).
+    A restarted node comes back with a new JVM start time, or the same one with 'same_jvm'.
+    """
+    def __init__(self,es:Es,published:list=None,same_jvm:bool=False):
+        self.published = published or ["{}:{}".format(*node) for node in es.nodes]
+        self.start_times = {address:1000 for address in self.published}
+        self.same_jvm = same_jvm
+        self.refused = ()
+        self.health = []
+        self.calls = []
+
+    def restart(self,node:tuple) -> bool:
+        if node in self.refused:
+            return False
+        if not self.same_jvm:
+            self.start_times = {address:t+1 for address,t in self.start_times.items()}
+        return True
+
+    def es_json(self,path:str,timeout:float=None) -> dict:
+        self.calls.append(path)
+        if path.startswith("/_nodes/http,jvm"):
+            return {"nodes":{str(i):{"http":{"publish_address":"host{}/{}".format(i,address)},
+                                     "jvm":{"start_time_in_millis":self.start_times[address]}}
+                             for i,address in enumerate(self.published)}}
+        if self.health:
+            return self.health.pop(0)
+        return {"status":"green","number_of_nodes":len(self.published),"timed_out":False}
+
+
+class RollingRestartWaitsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.es = Es(["10.0.0.1:9200","10.0.0.2:9200"])
+        self.sleep = mock.patch("app.core_features.ES.time.sleep")
+        self.sleep.start()
+
+    def tearDown(self):
+        self.sleep.stop()
+
+    def restart(self,cluster:FakeCluster,batched:bool=False) -> bool:
+        with mock.patch.object(self.es,"es_json",cluster.es_json),mock.patch.object(self.es,"_send_restart",cluster.restart):
+            return self.es.RollingRestart(batched)
+
+    def test_wait_for_health_retries_until_the_condition_holds(self):
+        cluster = FakeCluster(self.es)
+        cluster.health = [{"error":"master_not_discovered_exception"},
+                          {"status":"yellow","number_of_nodes":2,"timed_out":True},
+                          {"status":"green","number_of_nodes":2,"timed_out":False}]
+        polls = []
+        with mock.patch.object(self.es,"es_json",cluster.es_json):
+            health = self.es.wait_for_health(time.monotonic()+60,polls.append,wait_for_status="green")
+        self.assertEqual(health["status"],"green")
+        self.assertEqual([p["status"] for p in polls],["yellow","green"])
+        self.assertTrue(all("wait_for_status=green" in path for path in cluster.calls))
+
+    def test_wait_for_health_gives_up_at_the_deadline(self):
+        with mock.patch.object(self.es,"es_json",side_effect=AssertionError("not asked")):
+            self.assertIsNone(self.es.wait_for_health(time.monotonic()-1,wait_for_status="green"))
+
+    def test_restarted_nodes_are_recognised_by_their_jvm_start_time(self):
+        self.assertTrue(self.restart(FakeCluster(self.es)))
+        self.assertEqual([t["node"] for t in self.es.timings],["10.0.0.1:9200","10.0.0.2:9200"])
+
+    def test_node_that_never_restarted_fails_at_the_deadline(self):
+        with mock.patch.object(Es,"NODE_TIMEOUT",0.5):
+            self.assertFalse(self.restart(FakeCluster(self.es,same_jvm=True)))
+
+    def test_nodes_publishing_other_addresses_fall_back_to_the_node_count(self):
+        cluster = FakeCluster(self.es,published=["192.168.0.1:9200","192.168.0.2:9200"])
+        with mock.patch.object(Es,"NODE_TIMEOUT",5):
+            started = time.monotonic()
+            self.assertTrue(self.restart(cluster))
+        self.assertLess(time.monotonic()-started,5)
+
+    def test_partial_batch_waits_for_the_restarted_nodes(self):
+        cluster = FakeCluster(self.es)
+        cluster.refused = (self.es.nodes[1],)
+        with mock.patch.object(self.es,"restart_groups",return_value=[list(self.es.nodes)]):
+            self.assertFalse(self.restart(cluster,batched=True))
+        after = cluster.calls[cluster.calls.index(next(c for c in cluster.calls if c.startswith("/_nodes/http,jvm")))+1:]
+        self.assertTrue(any(c.startswith("/_nodes/http,jvm") for c in after)) #rejoin of the node that restarted
+        self.assertIn("wait_for_status=green",after[-1])
+
+    def test_restart_request_outlasts_the_default_read_timeout(self):
+        from app.core_features.AGENTCLIENT import agent_client
+        with mock.patch.object(agent_client,"post",return_value=mock.Mock(status_code=200)) as post:
+            self.assertTrue(self.es._send_restart(self.es.nodes[0]))
+        self.assertEqual(post.call_args.kwargs["timeout"][1],Es.RESTART_REQUEST_TIMEOUT)
+        self.assertGreater(Es.RESTART_REQUEST_TIMEOUT,agent_client.read_timeout)
@@ -0,0 +1,41 @@
+import unittest
+from app import create_app,db
+from app.execs import catalog
+from app.models import Execution
+
+
+class ExecutionCatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('test')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Execution.insert_execution()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        catalog.invalidate()
+
+    def test_dispatch(self):
+        exe = Execution.query.filter_by(name="Ping",solution="Redis").first()
+        handler,client,name = catalog.dispatch(exe.id,"Redis")
+        self.assertEqual(name,"Ping")
+        self.assertEqual(handler.__name__,"redis_ping")
+        with self.assertRaises(KeyError):
+            catalog.dispatch(exe.id,"ElasticSearch")
+        with self.assertRaises(KeyError):
+            catalog.dispatch(-1)
+
+    def test_ids_are_loaded_once(self):
+        exe = Execution.query.filter_by(name="RollingRestart",solution="ElasticSearch").first()
+        catalog.dispatch(exe.id)
+        loads = []
+        load,catalog.load = catalog.load,lambda: loads.append(1) or load()
+        try:
+            for _ in range(10):
+                catalog.dispatch(exe.id)
+        finally:
+            del catalog.load
+        self.assertEqual(loads,[])
@@ -0,0 +1,74 @@
+import unittest
+import json
+import os
+import threading
+import time
+from app import create_app,health
+from app.topology import topology
+
+
+class HealthPollerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.solution = os.environ.get("SOLUTION")
+        os.environ["SOLUTION"] = json.dumps({"Redis":{"cache":["127.0.0.1:6379"]},"ElasticSearch":{"search":["127.0.0.1:9200"]}})
+        topology.reload()
+        self.app = create_app('test')
+        self.calls = []
+        self.probes = dict(health._probes)
+        health.probe("Redis")(self.fake_probe)
+        health.probe("ElasticSearch")(self.fake_probe)
+
+    def tearDown(self):
+        health._probes = self.probes
+        if self.solution is None:
+            os.environ.pop("SOLUTION",None)
+        else:
+            os.environ["SOLUTION"] = self.solution
+        topology.reload()
+
+    def fake_probe(self,nodes,cluster):
+        self.calls.append(cluster)
+        time.sleep(0.2)
+        return {"status":"green","nodes":[]}
+
+    def test_snapshot_is_reused_until_fresh(self):
+        first = health.cluster("cache")
+        self.assertEqual(first["status"],"green")
+        self.assertIs(health.cluster("cache"),first)
+        self.assertEqual(self.calls,["cache"])
+        self.assertIsNot(health.cluster("cache",fresh=True),first)
+        self.assertEqual(self.calls,["cache","cache"])
+
+    def test_concurrent_probes_are_shared(self):
+        threads = [threading.Thread(target=health.cluster,args=("search",True)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls,["search"])
+
+    def test_failing_probe_is_recorded(self):
+        def broken(nodes,cluster):
+            raise ConnectionError("refused")
+        health.probe("Redis")(broken)
+        snapshot = health.cluster("cache",fresh=True)
+        self.assertEqual((snapshot["status"],snapshot["error"]),("unknown","refused"))
+
+    def test_unknown_cluster(self):
+        self.assertIsNone(health.cluster("nope"))
+
+    def test_poll_once_covers_every_cluster(self):
+        health.poll_once()
+        snapshots = health.snapshots()
+        self.assertEqual(sorted(snapshots["clusters"]),["cache","search"])
+        self.assertEqual(list(snapshots["agents"]),["http://127.0.0.1:5000"])
+        self.assertIn("checked_at",snapshots["agents"]["http://127.0.0.1:5000"])
+
+    def test_old_snapshot_is_stale_and_probed_again(self):
+        health.max_age = 0.1
+        first = health.cluster("cache")
+        self.assertFalse(health.snapshots()["clusters"]["cache"]["stale"])
+        time.sleep(0.15)
+        self.assertTrue(health.snapshots()["clusters"]["cache"]["stale"])
+        self.assertIsNot(health.cluster("cache"),first)
+        self.assertEqual(self.calls,["cache","cache"])
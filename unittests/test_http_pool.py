@@ -0,0 +1,81 @@
+import unittest
+import json
+import threading
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from app.core_features.HTTPPOOL import ConnectionPool
+
+
+class FakeESHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    posts = 0
+
+    def do_GET(self):
+        if self.path == "/big":
+            body = json.dumps({"status":"green","padding":"x"*10000}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length",str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/chunked":
+            body = json.dumps({"status":"yellow"}).encode()
+            self.send_response(200)
+            self.send_header("Transfer-Encoding","chunked")
+            self.end_headers()
+            for part in (body[:5],body[5:]):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(part),part))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            body = b'{"status":"green"}'
+            self.send_response(200)
+            self.send_header("Content-Length",str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def do_POST(self):
+        #Counted, then the connection drops without a response
+        FakeESHandler.posts += 1
+        self.close_connection = True
+
+    def log_message(self,*args):
+        pass
+
+
+class HTTPPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1",0),FakeESHandler)
+        threading.Thread(target=self.server.serve_forever,daemon=True).start()
+        self.pool = ConnectionPool([("127.0.0.1",self.server.server_address[1])])
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_large_body_is_read_fully(self):
+        response = self.pool.request("GET","/big")
+        self.assertEqual(len(json.loads(response.body)["padding"]),10000)
+
+    def test_chunked_body(self):
+        response = self.pool.request("GET","/chunked")
+        self.assertEqual(json.loads(response.body)["status"],"yellow")
+
+    def test_connection_is_reused(self):
+        for _ in range(5):
+            self.assertTrue(self.pool.request("GET","/_cluster/health").ok)
+        stats = self.pool.pool_stats()
+        self.assertEqual(stats["created"],1)
+        self.assertEqual(stats["reused"],4)
+
+    def test_bounded_retries(self):
+        pool = ConnectionPool([("127.0.0.1",1)],timeout=0.5,retries=2)
+        with self.assertRaises(OSError):
+            pool.request("GET","/")
+        self.assertEqual(pool.pool_stats()["retries"],2)
+        self.assertEqual(pool.pool_stats()["errors"],1)
+
+    def test_post_is_not_retried_once_sent(self):
+        FakeESHandler.posts = 0
+        with self.assertRaises(OSError):
+            self.pool.request("POST","/_flush",body=b"{}")
+        self.assertEqual(FakeESHandler.posts,1)
+        self.assertEqual(self.pool.pool_stats()["retries"],0)
@@ -0,0 +1,54 @@
+import unittest
+import threading
+from flask import current_app
+from app import create_app,db,jobs
+from app.jobs import Job
+
+
+class JobManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('test')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_job_runs_in_background(self):
+        done = []
+        job = jobs.submit("Sum",lambda a,b: a+b,1,2,on_done=lambda job: done.append(current_app.name))
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status,Job.SUCCEEDED)
+        self.assertEqual(job.result,3)
+        self.assertEqual(done,[self.app.name])
+        self.assertIs(jobs.get(job.id),job)
+
+    def test_failure_is_recorded(self):
+        def boom():
+            raise RuntimeError("node unreachable")
+        job = jobs.submit("Boom",boom)
+        job.wait(5)
+        self.assertEqual(job.status,Job.FAILED)
+        self.assertEqual(job.error,"node unreachable")
+
+    def test_bookkeeping_failure_keeps_the_result(self):
+        def record(job):
+            raise RuntimeError("database is locked")
+        job = jobs.submit("RollingRestart",lambda: True,on_done=record)
+        job.wait(5)
+        self.assertEqual(job.status,Job.SUCCEEDED)
+        self.assertTrue(job.result)
+        self.assertIn("database is locked",job.error)
+
+    def test_same_key_is_not_started_twice(self):
+        release = threading.Event()
+        first = jobs.submit("RollingRestart",release.wait,key="cluster1")
+        second = jobs.submit("RollingRestart",release.wait,key="cluster1")
+        other = jobs.submit("RollingRestart",release.wait,key="cluster2")
+        self.assertIs(first,second)
+        self.assertIsNot(first,other)
+        release.set()
+        self.assertTrue(first.wait(5) and other.wait(5))
@@ -0,0 +1,37 @@
+import unittest
+from datetime import datetime,timedelta
+from app import create_app,db,last_seen
+from app.models import User,Role
+
+
+class LastSeenTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('test')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.users = [User(email="user{}@wemakeprice.com".format(i),password="cat") for i in range(3)]
+        db.session.add_all(self.users)
+        db.session.commit()
+        self.ids = [u.id for u in self.users]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_updates_within_window_are_skipped(self):
+        now = datetime(2022,1,1)
+        self.assertTrue(last_seen.touch(self.ids[0],now))
+        self.assertFalse(last_seen.touch(self.ids[0],now+timedelta(seconds=10)))
+        self.assertTrue(last_seen.touch(self.ids[0],now+last_seen.window))
+
+    def test_flush_writes_all_pending_at_once(self):
+        now = datetime(2022,1,1)
+        for i,user_id in enumerate(self.ids):
+            last_seen.touch(user_id,now+timedelta(minutes=i))
+        self.assertEqual(last_seen.flush(),3)
+        for i,user_id in enumerate(self.ids):
+            self.assertEqual(User.query.get(user_id).last_seen,now+timedelta(minutes=i))
+        self.assertEqual(last_seen.flush(),0)
@@ -0,0 +1,80 @@
+import unittest
+from app import create_app
+from app.metrics import Counter,Histogram,metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('test')
+        self.client = self.app.test_client()
+
+    def test_histogram_buckets_are_cumulative(self):
+        hist = Histogram("op_seconds","Operation latency",("node",),buckets=(0.1,1))
+        for value in (0.05,0.5,5):
+            hist.observe(value,node="10.0.0.1:9200")
+        lines = hist.render()
+        self.assertIn('op_seconds_bucket{node="10.0.0.1:9200",le="0.1"} 1',lines)
+        self.assertIn('op_seconds_bucket{node="10.0.0.1:9200",le="1.0"} 2',lines)
+        self.assertIn('op_seconds_bucket{node="10.0.0.1:9200",le="+Inf"} 3',lines)
+        self.assertIn('op_seconds_count{node="10.0.0.1:9200"} 3',lines)
+        self.assertEqual(hist.count(node="10.0.0.1:9200"),3)
+
+    def test_timer_observes_failures_too(self):
+        hist = Histogram("op_seconds","Operation latency")
+        with self.assertRaises(ValueError):
+            with hist.time():
+                raise ValueError()
+        self.assertEqual(hist.count(),1)
+
+    def test_counter_labels_are_escaped(self):
+        counter = Counter("errors_total","Errors",("path",))
+        counter.inc(path='a"b')
+        counter.inc(path='a"b')
+        self.assertIn('errors_total{path="a\\"b"} 2',counter.render())
+
+    def test_endpoint_exposes_request_latency(self):
+        self.app.config["METRICS_TOKEN"] = "secret"
+        self.client.get("/auth/login")
+        body = self.client.get("/metrics",headers={"Authorization":"Bearer secret"}).get_data(as_text=True)
+        self.assertIn("# TYPE flask_request_duration_seconds histogram",body)
+        self.assertIn('flask_request_duration_seconds_count{endpoint="auth.login",method="GET"}',body)
+        self.assertIn("# TYPE es_request_duration_seconds histogram",body)
+
+    def test_token_is_required_when_set(self):
+        self.app.config["METRICS_TOKEN"] = "secret"
+        self.assertEqual(self.client.get("/metrics").status_code,403)
+        self.assertEqual(self.client.get("/metrics",headers={"Authorization":"Bearer wrong"}).status_code,403)
+        self.assertEqual(self.client.get("/metrics",headers={"Authorization":"Bearer secret"}).status_code,200)
+
+    def test_denied_without_token_or_admin_session(self):
+        self.app.config["METRICS_TOKEN"] = None
+        self.assertEqual(self.client.get("/metrics").status_code,403)
+        self.assertEqual(self.client.get("/metrics",headers={"Authorization":"Bearer "}).status_code,403)
+
+    def test_admin_session_is_accepted(self):
+        from flask import current_app
+        from flask_login import login_user
+        from app import db
+        from app.models import User,Role
+        from app.main.views import prometheus_metrics
+        from werkzeug.exceptions import Forbidden
+        self.app.config["METRICS_TOKEN"] = None
+        with self.app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            admin = User(email=current_app.config["ADMINS"][0],username="admin",password="cat")
+            user = User(email="john@wemakeprice.com",username="john",password="cat")
+            db.session.add_all([admin,user])
+            db.session.commit()
+            try:
+                for who,allowed in ((admin,True),(user,False)):
+                    with self.app.test_request_context("/metrics"):
+                        login_user(who)
+                        if allowed:
+                            self.assertEqual(prometheus_metrics().status_code,200)
+                        else:
+                            with self.assertRaises(Forbidden):
+                                prometheus_metrics()
+            finally:
+                db.session.remove()
+                db.drop_all()
@@ -0,0 +1,83 @@
+import unittest
+from datetime import datetime,timedelta
+from app.models import User,Role,Execution,Operation
+from app import create_app,db
+
+
+class OperationTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('test')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        Execution.insert_execution()
+
+        self.user = User(email="john@wemakeprice.com",username="john",password="cat")
+        db.session.add(self.user)
+        restart = Execution.query.filter_by(name="RollingRestart",solution="Redis").first()
+        base = datetime(2022,1,1)
+        for i in range(25):
+            db.session.add(Operation(exec_id=restart.id,user=self.user,
+                                     cluster="cluster{}".format(i%3),timestamp=base+timedelta(minutes=i)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_rows_are_joined(self):
+        total,filtered,rows,_ = Operation.table_page(length=1)
+        self.assertEqual(total,25)
+        self.assertEqual(filtered,25)
+        self.assertEqual(rows[0]["user"],"john")
+        self.assertEqual(rows[0]["execution"],"RollingRestart")
+        self.assertEqual(rows[0]["solution"],"Redis")
+
+    def test_keyset_matches_offset(self):
+        _,_,first,cursor = Operation.table_page(start=0,length=10)
+        _,_,by_offset,_ = Operation.table_page(start=10,length=10)
+        _,_,by_keyset,_ = Operation.table_page(length=10,after=cursor)
+        self.assertEqual([r["id"] for r in by_offset],[r["id"] for r in by_keyset])
+        self.assertTrue(first[-1]["timestamp"] > by_keyset[0]["timestamp"])
+
+    def test_keyset_keeps_rows_of_deleted_users(self):
+        restart = Execution.query.filter_by(name="RollingRestart",solution="Redis").first()
+        orphans = [Operation(exec_id=restart.id,user_id=None,cluster="cluster0") for _ in range(3)]
+        db.session.add_all(orphans)
+        db.session.commit()
+        for desc in (True,False):
+            seen,cursor = [],None
+            while True:
+                _,filtered,rows,cursor = Operation.table_page(length=4,order="user",desc=desc,after=cursor)
+                if not rows:
+                    break
+                seen += [r["id"] for r in rows]
+            self.assertEqual(len(seen),filtered)
+            self.assertEqual(sorted(seen),sorted(o.id for o in Operation.query))
+            self.assertEqual(seen[-3:],sorted((o.id for o in orphans),reverse=desc)) #NULLs last
+
+    def test_endpoint_caps_the_page_length(self):
+        from app.main.views import ops_table
+        for length in (-1,5000):
+            with self.app.test_request_context("/operation/table?draw=1&start=0&length={}".format(length)):
+                res = ops_table.__wrapped__.__wrapped__().get_json()
+            self.assertEqual(len(res["data"]),25)
+
+    def test_search_filters(self):
+        _,filtered,rows,_ = Operation.table_page(length=100,search="cluster1",searchable=["cluster"])
+        self.assertEqual(filtered,8)
+        self.assertTrue(all(r["cluster"]=="cluster1" for r in rows))
+
+    def test_endpoint_protocol(self):
+        #Skip login; the view is exercised directly.
+        with self.app.test_request_context("/operation/table?draw=3&start=0&length=5"
+                                           "&columns[0][data]=cluster&columns[0][searchable]=true"
+                                           "&order[0][column]=0&order[0][dir]=asc"):
+            from app.main.views import ops_table
+            res = ops_table.__wrapped__.__wrapped__().get_json()
+        self.assertEqual(res["draw"],3)
+        self.assertEqual(res["recordsTotal"],25)
+        self.assertEqual(len(res["data"]),5)
+        self.assertEqual(res["data"][0]["cluster"],"cluster0")
@@ -0,0 +1,146 @@
+import unittest
+import json
+import os
+import threading
+import time
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app,jobs
+from app.progress import ProgressHub,progress,JOB_STARTED,JOB_FINISHED,NODE_DONE
+
+
+class ProgressHubTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hub = ProgressHub()
+        self.hub.size = 5
+        self.hub.keepalive = 0.05
+
+    def test_late_subscriber_catches_up_from_the_ring_buffer(self):
+        for i in range(10):
+            self.hub.publish("job","node_done",node=i)
+        self.hub.close("job")
+        events = list(self.hub.subscribe("job"))
+        self.assertEqual([e["id"] for e in events],[6,7,8,9,10])
+        self.assertEqual([e["id"] for e in self.hub.subscribe("job",last_id=8)],[9,10])
+
+    def test_subscriber_is_woken_by_new_events(self):
+        self.hub.open("job")
+        received = []
+        def listen():
+            for event in self.hub.subscribe("job"):
+                received.append(event and event["event"])
+        listener = threading.Thread(target=listen)
+        listener.start()
+        time.sleep(0.12)
+        self.hub.publish("job","node_started",node="a")
+        self.hub.close("job")
+        listener.join(2)
+        self.assertFalse(listener.is_alive())
+        self.assertIn(None,received) #keep-alives while idle
+        self.assertEqual([e for e in received if e],["node_started"])
+
+    def test_stream_ends_after_timeout_and_resumes_from_last_id(self):
+        self.hub.open("job")
+        self.hub.publish("job","node_started",node="a")
+        first = [e for e in self.hub.subscribe("job",timeout=0.1) if e]
+        self.hub.publish("job","node_done",node="a")
+        self.hub.close("job")
+        again = list(self.hub.subscribe("job",last_id=first[-1]["id"],timeout=0.1))
+        self.assertEqual([e["event"] for e in first],["node_started"])
+        self.assertEqual([e["event"] for e in again],["node_done"])
+
+    def test_emit_follows_the_bound_channel(self):
+        self.hub.emit("node_done",node="nowhere")
+        self.hub.bind("job")
+        try:
+            self.hub.emit("node_started",node="a")
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(self.hub.bound(lambda node: self.hub.emit("node_done",node=node)),["b","c"]))
+                pool.submit(self.hub.emit,"node_done",node="unbound").result()
+        finally:
+            self.hub.bind(None)
+        self.hub.close("job")
+        self.assertEqual(sorted(e["node"] for e in self.hub.subscribe("job")),["a","b","c"])
+
+    def test_format_sse(self):
+        event = self.hub.publish("job","failure",error="boom")
+        frame = ProgressHub.format_sse(event)
+        self.assertTrue(frame.startswith("id: 1\nevent: failure\ndata: "))
+        self.assertTrue(frame.endswith("\n\n"))
+        self.assertEqual(json.loads(frame.split("data: ",1)[1])["error"],"boom")
+        self.assertEqual(ProgressHub.format_sse(None),": keep-alive\n\n")
+
+
+class JobEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("test")
+
+    def run_job(self):
+        def restart(nodes):
+            for node in nodes:
+                progress.emit(NODE_DONE,node=node)
+            return True
+        job = jobs.submit("RollingRestart",restart,["a","b"],cluster="search")
+        job.wait(5)
+        return job
+
+    def test_job_events_are_recorded(self):
+        job = self.run_job()
+        events = list(progress.subscribe(job.id))
+        self.assertEqual([e["event"] for e in events],[JOB_STARTED,NODE_DONE,NODE_DONE,JOB_FINISHED])
+        self.assertEqual(events[-1]["status"],"succeeded")
+
+    def test_event_stream_endpoint(self):
+        job = self.run_job()
+        from app.main.views import job_events
+        with self.app.test_request_context("/jobs/{}/events".format(job.id),headers={"Last-Event-ID":"2"}):
+            response = job_events.__wrapped__.__wrapped__(job.id)
+            body = "".join(response.response)
+        self.assertEqual(response.mimetype,"text/event-stream")
+        self.assertEqual([line.split(": ")[1] for line in body.splitlines() if line.startswith("event:")],
+                         ["node_done",JOB_FINISHED])
+
+
+class RestartEventsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from benchmarks.fakes import FakeESCluster,FakeRedis,FakeAgent
+        cls.es = FakeESCluster(2,loopback=True)
+        cls.redis = FakeRedis(2,loopback=True)
+        cls.agent = FakeAgent(es=cls.es,redis=cls.redis,host="127.0.0.1")
+        cls.environ = mock.patch.dict(os.environ,{"AGENT_PORT":str(cls.agent.port)})
+        cls.environ.start()
+        os.environ.setdefault("AGENT_KEY","test")
+
+    @classmethod
+    def tearDownClass(cls):
+        for fake in (cls.agent,cls.es,cls.redis):
+            fake.stop()
+        cls.environ.stop()
+
+    def events_of(self,restart) -> list:
+        hub_channel = "restart-{}".format(id(restart))
+        progress.bind(hub_channel)
+        try:
+            self.assertTrue(restart())
+        finally:
+            progress.bind(None)
+        progress.close(hub_channel)
+        return list(progress.subscribe(hub_channel))
+
+    def test_es_rolling_restart_events(self):
+        from app.core_features.ES import Es
+        events = self.events_of(Es(self.es.addresses).RollingRestart)
+        kinds = [e["event"] for e in events]
+        self.assertEqual([k for k in kinds if k != "waiting_for_green"],["node_started","node_restarted","node_done"]*2)
+        waits = [e for e in events if e["event"] == "waiting_for_green"]
+        self.assertTrue(waits and all(e["status"] for e in waits))
+
+    def test_redis_replica_first_restart_events(self):
+        from app.core_features.REDIS import Redis
+        redis = Redis(self.redis.addresses)
+        events = self.events_of(lambda: redis.RollingRestart(replica_first=True))
+        kinds = [e["event"] for e in events]
+        self.assertEqual(kinds.count("node_done"),2)
+        self.assertEqual(kinds.count("failover"),1)
+        self.assertNotIn("failure",kinds)
@@ -0,0 +1,51 @@
+import unittest
+from app.core_features.REDIS import Redis
+
+
+CONFIGS = {
+    ("10.0.0.1",6379):{"maxmemory":"4gb","appendonly":"yes"},
+    ("10.0.0.2",6379):{"MaxMemory":" 4gb ","appendonly":"yes"},
+    ("10.0.0.3",6379):{"maxmemory":"2gb","appendonly":"yes"},
+}
+
+
+class FakeConfigRedis(Redis):
+    def _get_config(self,node):
+        if node not in CONFIGS:
+            raise ConnectionError("agent down")
+        return CONFIGS[node]
+
+
+class RedisConfigurationTestCase(unittest.TestCase):
+    def test_identical_configs_are_grouped(self):
+        report = FakeConfigRedis(["10.0.0.1:6379","10.0.0.2:6379"]).ConfigurationReport()
+        self.assertEqual(len(report["groups"]),1)
+        self.assertEqual(report["drift"],{})
+        self.assertEqual(report["config"],{"maxmemory":"4gb","appendonly":"yes"})
+
+    def test_drift_is_reported_per_node(self):
+        redis = FakeConfigRedis(["10.0.0.1:6379","10.0.0.2:6379","10.0.0.3:6379","10.0.0.4:6379"])
+        report = redis.ConfigurationReport()
+        self.assertEqual([len(group["nodes"]) for group in report["groups"]],[2,1])
+        self.assertEqual(report["config"]["maxmemory"],"4gb")
+        #as each node sent it
+        self.assertEqual(report["drift"],{"maxmemory":{"10.0.0.1:6379":"4gb","10.0.0.2:6379":" 4gb ","10.0.0.3:6379":"2gb"}})
+        self.assertEqual(list(report["errors"]),["10.0.0.4:6379"])
+
+    def test_majority_is_per_key(self):
+        configs = {
+            ("10.0.0.1",6379):{"maxmemory":"4gb","appendonly":"no","save":None},
+            ("10.0.0.2",6379):{"maxmemory":"2gb","appendonly":"yes","save":None},
+            ("10.0.0.3",6379):{"maxmemory":"2gb","appendonly":"yes","save":None},
+            ("10.0.0.4",6379):{"maxmemory":"4gb","appendonly":"yes","save":None},
+            ("10.0.0.5",6379):{"maxmemory":"4gb","appendonly":"no","save":None},
+        }
+        redis = FakeConfigRedis(["{}:{}".format(*node) for node in configs])
+        redis._get_config = configs.get
+        report = redis.ConfigurationReport()
+        #no group has both majority values : maxmemory 4gb on 3 nodes, appendonly yes on 3
+        self.assertEqual(report["config"],{"maxmemory":"4gb","appendonly":"yes","save":None})
+        self.assertEqual(sorted(report["drift"]),["appendonly","maxmemory"])
+
+    def test_no_node_answers(self):
+        self.assertIsInstance(FakeConfigRedis(["10.0.0.9:6379"]).Configuration,Exception)
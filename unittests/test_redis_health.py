@@ -0,0 +1,173 @@
+import unittest
+import socket
+import threading
+import time
+from app.core_features.REDIS import Redis
+
+
+class FakeRedisNode:
+    """
+    Speaks RESP : PING, AUTH, CLUSTER INFO ('cluster' fields, or cluster support disabled when None)
+    and INFO replication ('replication' fields). Never answers at all when hung.
+    """
+    def __init__(self,hung=False,cluster=None,replication=None,password=None):
+        self.hung = hung
+        self.cluster = cluster
+        self.replication = replication or {"role":"master","connected_slaves":0,"master_repl_offset":0}
+        self.password = password
+        self.sock = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1",0))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+        self.conns = []
+        self.reads = 0
+        threading.Thread(target=self._serve,daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn,_ = self.sock.accept()
+            except OSError:
+                return
+            self.conns.append(conn)
+            if not self.hung:
+                threading.Thread(target=self._handle,args=(conn,),daemon=True).start()
+
+    @staticmethod
+    def _bulk(fields:dict) -> bytes:
+        text = "".join("{}:{}\r\n".format(k,v) for k,v in fields.items()).encode()
+        return b"$%d\r\n%s\r\n" % (len(text),text)
+
+    def _reply(self,args:list,authed:bool) -> bytes:
+        command = [arg.upper() for arg in args]
+        if command[0] == b"AUTH":
+            return b"+OK\r\n" if args[1].decode() == self.password else b"-WRONGPASS invalid password\r\n"
+        if self.password and not authed:
+            return b"-NOAUTH Authentication required.\r\n"
+        if command[0] == b"PING":
+            return b"+PONG\r\n"
+        if command[:2] == [b"CLUSTER",b"INFO"]:
+            if self.cluster is None:
+                return b"-ERR This instance has cluster support disabled\r\n"
+            return self._bulk(self.cluster)
+        if command[:2] == [b"INFO",b"REPLICATION"]:
+            return self._bulk(dict({"# Replication":""},**self.replication))
+        return b"-ERR unknown command\r\n"
+
+    @staticmethod
+    def _commands(buffer:bytes) -> tuple:
+        "Complete RESP commands at the start of 'buffer', and what is left of it."
+        commands = []
+        while buffer.startswith(b"*"):
+            lines = buffer.split(b"\r\n")
+            count = int(lines[0][1:])
+            if len(lines) < 1+2*count+1:
+                break
+            args = lines[2:2+2*count:2]
+            commands.append(args)
+            buffer = b"\r\n".join(lines[1+2*count:])
+        return commands,buffer
+
+    def _handle(self,conn):
+        buffer = b""
+        authed = False
+        try:
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    return
+                commands,buffer = self._commands(buffer+chunk)
+                if not commands:
+                    continue
+                self.reads += 1
+                out = []
+                for args in commands:
+                    if args[0].upper() == b"AUTH":
+                        authed = args[1].decode() == self.password
+                    out.append(self._reply(args,authed))
+                conn.sendall(b"".join(out))
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+        for conn in self.conns:
+            conn.close()
+
+
+class RedisHealthTestCase(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+
+    def node(self,hung=False):
+        server = FakeRedisNode(hung)
+        self.servers.append(server)
+        return "127.0.0.1:{}".format(server.port)
+
+    def test_all_up(self):
+        redis = Redis([self.node() for _ in range(3)])
+        self.assertTrue(redis.ClusterHealthCheck())
+        for report in redis.HealthReport():
+            self.assertEqual(report["status"],"up")
+            self.assertIsNotNone(report["rtt_ms"])
+
+    def test_hung_nodes_are_probed_concurrently(self):
+        redis = Redis([self.node(),self.node(hung=True),self.node(hung=True)],read_timeout=0.5)
+        start = time.perf_counter()
+        reports = redis.HealthReport()
+        elapsed = time.perf_counter()-start
+        self.assertFalse(all(report["status"]=="up" for report in reports))
+        self.assertEqual([report["status"] for report in reports],["up","down","down"])
+        self.assertIsNotNone(reports[1]["error"])
+        self.assertLess(elapsed,1)
+
+    def test_commands_are_pipelined(self):
+        server = FakeRedisNode(password="secret")
+        self.servers.append(server)
+        report = Redis(["127.0.0.1:{}".format(server.port)],auth="secret").HealthReport()[0]
+        self.assertEqual(report["status"],"up")
+        self.assertEqual(server.reads,1)
+
+    def test_wrong_password(self):
+        server = FakeRedisNode(password="secret")
+        self.servers.append(server)
+        report = Redis(["127.0.0.1:{}".format(server.port)],auth="nope").HealthReport()[0]
+        self.assertEqual(report["status"],"down")
+        self.assertIn("WRONGPASS",report["error"])
+
+    def test_uncovered_slots_and_cluster_failure(self):
+        degraded = {"cluster_state":"ok","cluster_slots_assigned":16384,"cluster_slots_ok":16000,"cluster_slots_fail":384}
+        failed = dict(degraded,cluster_state="fail")
+        nodes = []
+        for cluster in (degraded,failed):
+            server = FakeRedisNode(cluster=cluster)
+            self.servers.append(server)
+            nodes.append("127.0.0.1:{}".format(server.port))
+        reports = Redis(nodes[:1]).HealthReport()
+        self.assertEqual(reports[0]["slots_ok"],16000)
+        self.assertEqual(Redis.cluster_status(reports),"yellow")
+        self.assertEqual(Redis.cluster_status(Redis(nodes).HealthReport()),"red")
+
+    def test_replica_lag(self):
+        replication = {"role":"master","connected_slaves":2,"master_repl_offset":5000000,
+                       "slave0":"ip=10.0.0.2,port=6379,state=online,offset=5000000,lag=0",
+                       "slave1":"ip=10.0.0.3,port=6379,state=online,offset=1000000,lag=3"}
+        server = FakeRedisNode(cluster={"cluster_state":"ok","cluster_slots_ok":16384},replication=replication)
+        self.servers.append(server)
+        report = Redis(["127.0.0.1:{}".format(server.port)]).HealthReport()[0]
+        self.assertEqual(report["role"],"master")
+        self.assertEqual([r["lag_bytes"] for r in report["replicas"]],[0,4000000])
+        self.assertEqual(report["max_lag_bytes"],4000000)
+        self.assertEqual(len(report["problems"]),1)
+
+    def test_standalone_node_has_no_cluster_fields(self):
+        server = FakeRedisNode(replication={"role":"slave","master_link_status":"down"})
+        self.servers.append(server)
+        report = Redis(["127.0.0.1:{}".format(server.port)]).HealthReport()[0]
+        self.assertIsNone(report["cluster_state"])
+        self.assertEqual(report["role"],"replica")
+        self.assertEqual(report["problems"],["link to master is down"])
@@ -0,0 +1,74 @@
+import unittest
+import os
+from unittest import mock
+from benchmarks.fakes import FakeRedis,FakeAgent
+from app.core_features.REDIS import Redis
+
+
+def report(node,role,master=None,replicas=()):
+    return {"node":node,"role":role,"master":master,
+            "replicas":[{"node":r,"state":state,"lag_bytes":lag} for r,state,lag in replicas]}
+
+
+class ReplicationPlanTestCase(unittest.TestCase):
+    def test_replicas_of_one_master_are_in_different_waves(self):
+        reports = [report("m1","master",replicas=[("r1","online",10),("r2","online",0)]),
+                   report("m2","master",replicas=[("r3","wait_bgsave",0)]),
+                   report("m3","master"),
+                   report("r1","replica","m1"),report("r2","replica","m1"),report("r3","replica","m2")]
+        waves,masters = Redis.replication_plan(reports)
+        self.assertEqual(waves,[["r1","r3"],["r2"]])
+        #the most up to date online replica takes over; none when no replica is online
+        self.assertEqual(masters,[("m1","r2"),("m2",None),("m3",None)])
+
+
+class CaughtUpTestCase(unittest.TestCase):
+    def probe(self,master_offset,replica_offset):
+        #the master lists its replica by the address it announces, not by its inventory name
+        reports = {("redis-r1.local",6379):{"status":"up","run_id":"new","cluster_state":"ok","role":"replica",
+                                            "master_link_status":"up","master":"10.0.0.1:6379","repl_offset":replica_offset},
+                   ("10.0.0.1",6379):{"status":"up","repl_offset":master_offset,
+                                      "replicas":[{"node":"10.0.0.9:6379","state":"online","lag_bytes":0}]}}
+        return reports.__getitem__
+
+    def test_replica_is_caught_up_by_its_own_offset(self):
+        client = Redis(["redis-r1.local:6379"])
+        client._probe = self.probe(5000,5000)
+        self.assertTrue(client._caught_up("redis-r1.local:6379","old"))
+        client._probe = self.probe(5000+2*Redis.REPLICA_MAX_LAG,5000)
+        self.assertFalse(client._caught_up("redis-r1.local:6379","old"))
+
+
+class ReplicaFirstRestartTestCase(unittest.TestCase):
+    def setUp(self):
+        os.environ.setdefault("AGENT_KEY","test")
+        self.redis = FakeRedis(4,restart_delay=0.1,loopback=True)
+        self.agent = FakeAgent(redis=self.redis,host="127.0.0.1")
+        self.environ = mock.patch.dict(os.environ,{"AGENT_PORT":str(self.agent.port)})
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        self.agent.stop()
+        self.redis.stop()
+
+    def test_replicas_first_then_masters_after_failover(self):
+        nodes = self.redis.nodes #0 and 2 are masters, 1 and 3 their replicas
+        client = Redis(self.redis.addresses)
+        self.assertTrue(client.RollingRestart(replica_first=True))
+        self.assertEqual(sorted(self.redis.restarts[:2]),sorted([nodes[1],nodes[3]]))
+        self.assertEqual(sorted(self.redis.restarts[2:]),sorted([nodes[0],nodes[2]]))
+        self.assertEqual(sorted(self.redis.failovers),sorted([nodes[1],nodes[3]]))
+        self.assertEqual(client.waves[0],[self.redis.addresses[1],self.redis.addresses[3]])
+        self.assertEqual([t["role"] for t in client.timings],["replica","replica","master","master"])
+
+    def test_in_order_restart_waits_for_each_node(self):
+        client = Redis(self.redis.addresses)
+        self.assertTrue(client.RollingRestart())
+        self.assertEqual(self.redis.restarts,self.redis.nodes)
+        self.assertTrue(all(t["recover_s"] >= 0.1 for t in client.timings))
+
+    def test_unhealthy_cluster_is_not_restarted(self):
+        self.redis.restart(self.redis.nodes[0])
+        self.assertFalse(Redis(self.redis.addresses).RollingRestart(replica_first=True))
+        self.assertEqual(len(self.redis.restarts),1)
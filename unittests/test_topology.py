@@ -0,0 +1,78 @@
+import unittest
+import json
+import os
+from app.topology import TopologyRegistry,parse_address
+
+
+INVENTORY = {
+    "ElasticSearch":{"es-prod":["https://10.107.11.66:9200","es-02.internal:19200"]},
+    "Redis":{"redis-prod":["10.107.11.66:6379","10.107.11.59"]},
+}
+
+
+class TopologyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.saved = os.environ.get("SOLUTION")
+        os.environ["SOLUTION"] = json.dumps(INVENTORY)
+        self.registry = TopologyRegistry(check_interval=0)
+
+    def tearDown(self):
+        if self.saved is None:
+            os.environ.pop("SOLUTION",None)
+        else:
+            os.environ["SOLUTION"] = self.saved
+
+    def test_parse_address(self):
+        node = parse_address("https://10.107.11.66:9200")
+        self.assertEqual((node.scheme,node.host,node.port),("https","10.107.11.66",9200))
+        self.assertTrue(node.https)
+        self.assertEqual(node.agent,"http://10.107.11.66:5000")
+        self.assertEqual(parse_address("es-02.internal:19200").endpoint,("es-02.internal",19200))
+        self.assertEqual(parse_address("10.107.11.59",6379).port,6379)
+        for bad in ("10.107.11.59","http://host:port","host:123456",""):
+            with self.assertRaises(ValueError):
+                parse_address(bad)
+
+    def test_indexes(self):
+        topology = self.registry.get()
+        self.assertEqual(topology.solution_of("redis-prod"),"Redis")
+        self.assertEqual([n.port for n in topology.nodes("redis-prod")],[6379,6379])
+        self.assertEqual(topology.cluster_agents("es-prod"),["http://10.107.11.66:5000","http://es-02.internal:5000"])
+        self.assertEqual(sorted(topology.agents["http://10.107.11.66:5000"]),["es-prod","redis-prod"])
+
+    def test_loaded_once_and_reloaded_on_change(self):
+        first = self.registry.get()
+        self.assertIs(self.registry.get(),first)
+        self.assertEqual(self.registry.loads,1)
+        os.environ["SOLUTION"] = json.dumps({"Redis":{"redis-dev":["127.0.0.1:6379"]}})
+        second = self.registry.get()
+        self.assertIsNot(second,first)
+        self.assertEqual(list(second.clusters),["redis-dev"])
+
+    def test_invalid_inventory_keeps_previous(self):
+        first = self.registry.get()
+        os.environ["SOLUTION"] = "{not json"
+        self.assertIs(self.registry.get(),first)
+
+    def test_missing_or_malformed_file_keeps_previous(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory,"solution.json")
+            with open(path,"w") as f:
+                json.dump(INVENTORY,f)
+            saved = os.environ.get("SOLUTION_FILE")
+            os.environ["SOLUTION_FILE"] = path
+            try:
+                registry = TopologyRegistry(check_interval=0)
+                first = registry.get()
+                with open(path,"w") as f:
+                    json.dump({"Redis":["10.0.0.1:6379"]},f) #clusters must be a mapping
+                self.assertIs(registry.get(),first)
+                os.remove(path)
+                self.assertIs(registry.get(),first)
+                self.assertEqual(registry.loads,1)
+            finally:
+                if saved is None:
+                    os.environ.pop("SOLUTION_FILE",None)
+                else:
+                    os.environ["SOLUTION_FILE"] = saved
@@ -0,0 +1,58 @@
+import unittest
+from sqlalchemy import event
+from app import create_app,db,user_cache
+from app.models import User,Role,Permission,load_user
+
+
+class UserCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('test')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        user = User(email="migo@wemakeprice.com",username="migo",password="cat")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        self.queries = []
+        event.listen(db.engine,"before_cursor_execute",self._count)
+
+    def tearDown(self):
+        event.remove(db.engine,"before_cursor_execute",self._count)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _count(self,conn,cursor,statement,*args):
+        self.queries.append(statement)
+
+    def test_hit_needs_no_query(self):
+        before = user_cache.stats()
+        self.assertEqual(load_user(str(self.user_id)).username,"migo")
+        db.session.remove()
+        self.queries.clear()
+        user = load_user(str(self.user_id))
+        self.assertTrue(user.can(Permission.ADMIN))
+        self.assertEqual(self.queries,[])
+        self.assertEqual(user_cache.stats()["hits"],before["hits"]+1)
+        self.assertEqual(user_cache.stats()["misses"],before["misses"]+1)
+
+    def test_cached_user_can_be_saved(self):
+        user = load_user(str(self.user_id))
+        user.location = "Seoul"
+        db.session.add(user)
+        db.session.commit()
+        user_cache.invalidate(self.user_id)
+        db.session.remove()
+        self.assertEqual(load_user(str(self.user_id)).location,"Seoul")
+
+    def test_invalidated_on_role_change(self):
+        load_user(str(self.user_id))
+        Role.insert_roles()
+        misses = user_cache.stats()["misses"]
+        load_user(str(self.user_id))
+        self.assertEqual(user_cache.stats()["misses"],misses+1)
+
+    def test_missing_user(self):
+        self.assertIsNone(load_user("12345"))